@@ -1,7 +1,58 @@
+from TDTK.core.startup import profiler
 import argparse
-from TDTK.core.test_runner import TestRunner
+import sys
+
+def list_modules():
+    with profiler.phase("import modules"):
+        from TDTK.core.logger import Logger
+        from TDTK.core.modules import Modules
+    logger = Logger(None)
+    with profiler.phase("module catalog"):
+        catalog = Modules().list_modules()
+    for container, submodules in catalog.items():
+        logger.log(container, type="plain")
+        for submodule in submodules:
+            logger.log(f"{container}.{submodule}", type="result")
+
+def history_command(argv: list[str]):
+    parser = argparse.ArgumentParser(prog="TDTK compare|gate",
+                                     description="Compare a run from the performance history against a baseline run")
+    parser.add_argument("command", choices=["compare", "gate"],
+                        help="compare only reports, gate also exits with 1 when a measurement regressed")
+    parser.add_argument("--run", dest="run", default="latest",
+                        help="Run id, label or 'latest' to check (default: latest)")
+    parser.add_argument("-b", "--baseline", dest="baseline", default="previous",
+                        help="Run id, label or 'previous' run of the same plan to compare with (default: previous)")
+    parser.add_argument("--threshold", dest="threshold", type=float, default=5.0, metavar="PERCENT",
+                        help="Smallest change of the mean counted as a regression (default: 5)")
+    parser.add_argument("--sigma", dest="sigma", type=float, default=2.0,
+                        help="The change must also exceed this many standard errors of the difference (default: 2)")
+    parser.add_argument("-i", "--id", dest="device", default=None, help="Only compare results of this device")
+    parser.add_argument("--history", dest="history", default=None, metavar="HISTORY_DB",
+                        help="Performance history database (default: history.db in the TDTK cache)")
+    args = parser.parse_args(argv)
+    from TDTK.core.history import gate
+    sys.exit(gate(args))
+
+def daemon_command(argv: list[str]):
+    parser = argparse.ArgumentParser(prog="TDTK daemon",
+                                     description="Keep TDTK and the device sessions warm, later invocations run through it")
+    parser.add_argument("--socket", dest="socket", default=None, metavar="SOCKET",
+                        help="Unix socket to listen on (default: daemon.sock in the TDTK cache, or $TDTK_DAEMON_SOCKET)")
+    parser.add_argument("--stop", dest="stop", action="store_true", help="Stop the running daemon")
+    args = parser.parse_args(argv)
+    from TDTK.core import daemon
+    if args.stop:
+        sys.exit(0 if daemon.stop(args.socket) else 1)
+    daemon.Daemon(args.socket).serve()
+    sys.exit(0)
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in ("compare", "gate"):
+        history_command(sys.argv[1:])
+    if len(sys.argv) > 1 and sys.argv[1] == "daemon":
+        daemon_command(sys.argv[2:])
+
     parser = argparse.ArgumentParser(description="TerraDebugToolKit (TDTK) - CLI Tool")
 
     # Test plan argument
@@ -9,18 +60,131 @@ def main():
 
     # Device ID argument
     parser.add_argument("-i", "--id", dest="device_id", default="",
-                        help="Device ID of the Android phone")
+                        help="Device ID of the Android phone, or a comma separated list of IDs")
+
+    # All devices argument
+    parser.add_argument("-a", "--all-devices", dest="all_devices", action="store_true",
+                        help="Run the test plan on every attached device in parallel")
+
+    # Shard argument
+    parser.add_argument("--shard", dest="shard", action="store_true",
+                        help="Split the test plan across the devices (all attached unless -i is given), balanced by past durations")
 
     # Debug argument
     parser.add_argument("-d", "--debug", action="store_true", help="Enable debug output")
 
+    # Progress argument
+    parser.add_argument("--no-progress", dest="progress", action="store_false",
+                        help="Do not draw the live per-device progress lines (they are never drawn without a TTY)")
+
+    # Log file argument
+    parser.add_argument("--log-file", dest="log_file", default=None, metavar="LOG_FILE",
+                        help="Also append all output, without colors, to LOG_FILE")
+
+    # Keep pushed files argument
+    parser.add_argument("-k", "--keep-files", dest="keep_files", action="store_true",
+                        help="Keep pushed files on the device so unchanged files are not pushed again next run")
+
+    # Shell session argument
+    parser.add_argument("-s", "--shell-session", dest="shell_session", action="store_true",
+                        help="Run shell commands through one persistent shell per device")
+
+    # Concurrency argument
+    parser.add_argument("-c", "--concurrency", dest="concurrency", type=int, default=4, metavar="N",
+                        help="Maximum concurrent adb operations per device (default: 4)")
+
+    # Timeout arguments
+    parser.add_argument("--command-timeout", dest="command_timeout", type=float, default=120, metavar="SECONDS",
+                        help="Kill any single adb operation after SECONDS (default: 120)")
+    parser.add_argument("--test-timeout", dest="test_timeout", type=float, default=None, metavar="SECONDS",
+                        help="Wall-clock budget of one test iteration, dependencies included")
+    parser.add_argument("--plan-timeout", dest="plan_timeout", type=float, default=None, metavar="SECONDS",
+                        help="Wall-clock budget of the whole run, tests left when it runs out are recorded as timed out")
+
+    # Log capture arguments
+    parser.add_argument("--capture-logs", dest="capture_logs", nargs="?", const="tdtk-logs", default=None, metavar="DIR",
+                        help="Follow logcat and dmesg in the background and save a failed test's slice to DIR (default: tdtk-logs)")
+    parser.add_argument("--capture-size", dest="capture_size", type=float, default=4, metavar="MB",
+                        help="Size of the in-memory logcat and dmesg ring buffers per device (default: 4)")
+
+    # Sampler argument
+    parser.add_argument("--sample", dest="sample", type=float, nargs="?", const=1.0, default=None, metavar="INTERVAL",
+                        help="Sample CPU load, cpufreq, thermal zones and memory on the device every INTERVAL seconds "
+                             "(default: 1) and add per-test summaries to the results")
+
+    # Parallel argument
+    parser.add_argument("-p", "--parallel", dest="parallel", type=int, default=1, metavar="N",
+                        help="Run up to N tests at once per device when their declared resources do not conflict")
+
+    # Record and replay arguments
+    parser.add_argument("--record", dest="record", default=None, metavar="RECORDING_JSONL",
+                        help="Record every shell command, push and install with its output and timing to RECORDING_JSONL")
+    parser.add_argument("--replay", dest="replay", default=None, metavar="RECORDING_JSONL",
+                        help="Run against the devices of a recording instead of attached ones")
+    parser.add_argument("--replay-speed", dest="replay_speed", choices=["recorded", "max"], default="recorded",
+                        help="Replay with the recorded timing or as fast as possible (default: recorded)")
+
+    # Trace argument
+    parser.add_argument("-t", "--trace", dest="trace", default=None, metavar="TRACE_JSON",
+                        help="Trace every adb operation, print a time breakdown and write a Chrome/Perfetto trace")
+
+    # Results arguments
+    parser.add_argument("-r", "--results", dest="results", default=None, metavar="RESULTS_JSONL",
+                        help="Write one JSON line per test iteration as it finishes")
+    parser.add_argument("--flush-every", dest="flush_every", type=int, default=1, metavar="N",
+                        help="Flush the results file every N lines (default: 1)")
+    parser.add_argument("-j", "--junit", dest="junit", default=None, metavar="JUNIT_XML",
+                        help="Write a JUnit XML report built from the results stream at the end of the run")
+
+    # Performance history arguments
+    parser.add_argument("--history", dest="history", default=None, metavar="HISTORY_DB",
+                        help="Record measurements in HISTORY_DB (default: history.db in the TDTK cache)")
+    parser.add_argument("--no-history", dest="history_enabled", action="store_false",
+                        help="Do not record this run in the performance history")
+    parser.add_argument("--label", dest="label", default=None,
+                        help="Label this run in the performance history, e.g. the kernel build, to use it as a baseline")
+
     # Specific module argument
     parser.add_argument("-m", "--module", dest="module", default="", help="Run a specific module")
 
-    args = parser.parse_args()
+    # List modules argument
+    parser.add_argument("-l", "--list-modules", dest="list_modules", action="store_true",
+                        help="List the available modules from the module index and exit")
+
+    # Validate argument
+    parser.add_argument("-v", "--validate", dest="validate", action="store_true",
+                        help="Validate the test plan or module without connecting to a device")
+
+    # Daemon argument
+    parser.add_argument("--no-daemon", dest="use_daemon", action="store_false",
+                        help="Run in this process even when a TDTK daemon is running")
+
+    # Startup profile argument
+    parser.add_argument("--profile-startup", dest="profile_startup", type=float, nargs="?", const=0, default=None,
+                        metavar="BUDGET_MS",
+                        help="Report import and initialization time per component, fail if over BUDGET_MS")
+
+    with profiler.phase("argument parsing"):
+        args = parser.parse_args()
+    if args.profile_startup is not None:
+        profiler.enable(args.profile_startup)
+
+    if args.list_modules:
+        list_modules()
+        sys.exit(0 if profiler.report() else 2)
+
+    # Hand the run to a resident daemon when one is listening
+    if args.use_daemon and not args.validate and args.profile_startup is None and not args.record and not args.replay:
+        from TDTK.core.daemon import submit
+        code = submit(args)
+        if code is not None:
+            sys.exit(code)
 
     # Setup and start the test runner
-    runner = TestRunner(args)
+    with profiler.phase("import test runner"):
+        from TDTK.core.test_runner import TestRunner
+    with profiler.phase("test runner init"):
+        runner = TestRunner(args)
     if runner:
         runner.start()
     else:
@@ -0,0 +1,229 @@
+import pytest
+import socket
+import subprocess
+import threading
+import time
+import adbutils
+from TDTK.core.adb import ADB, DeviceState, ShellSession, filesPath
+from TDTK.core.cache import hash_cache
+from TDTK.core.deadline import TimeoutExpired, budget
+from TDTK.core.fake_adb import FakeAdbClient, FakeAdbDevice, Response
+from TDTK.core.matching import Matcher
+from TDTK.core.tracing import tracer
+
+# Stands in for an adb shell stream by wiring a local `sh` to one end of a socket pair.
+class LocalShell:
+    def __init__(self, sock, process):
+        self.conn = sock
+        self.process = process
+
+    def close(self):
+        self.conn.close()
+        self.process.kill()
+
+class LocalDevice:
+    def shell(self, command, stream=False):
+        host, device = socket.socketpair()
+        process = subprocess.Popen([command], stdin=device.fileno(), stdout=device.fileno(), stderr=device.fileno())
+        device.close()
+        return LocalShell(host, process)
+
+# Runs every command through a local `sh -c`, the way a streamed adb shell hands back its output.
+class CommandDevice:
+    serial = "command"
+
+    def shell(self, command, stream=False):
+        host, device = socket.socketpair()
+        process = subprocess.Popen(["sh", "-c", command], stdin=subprocess.DEVNULL, stdout=device.fileno(), stderr=device.fileno())
+        device.close()
+        return LocalShell(host, process)
+
+# Answers the install cache query as if deviceinfo.apk with the given build was installed.
+class InstalledDevice:
+    serial = "installed"
+
+    def __init__(self, version_code, digest):
+        self.reply = f"versionCode={version_code}\n{digest}  /data/app/base.apk\n"
+        self.commands = []
+
+    def shell2(self, command, timeout=None):
+        self.commands.append(command)
+        return adbutils.ShellReturn(command=command, returncode=0, output=self.reply)
+
+class Tests:
+    # Tests that output and exit codes are framed the same way shell2 reports them.
+    def test_shell_session_run(self):
+        session = ShellSession(LocalDevice(), timeout=5)
+        ret = session.run("echo hello")
+        assert (ret.returncode, ret.output) == (0, "hello\n")
+        ret = session.run("printf hello; exit 3")
+        assert (ret.returncode, ret.output) == (3, "hello")
+        session.close()
+
+    # Tests that pipelined commands come back in order on one connection.
+    def test_shell_session_run_many(self, mocker):
+        device = LocalDevice()
+        spy = mocker.spy(device, "shell")
+        session = ShellSession(device, timeout=5)
+        rets = session.run_many([f"echo {i}" for i in range(100)])
+        assert [ret.output for ret in rets] == [f"{i}\n" for i in range(100)]
+        assert spy.call_count == 1
+        session.close()
+
+    # Tests that an identical build is recognized once and then remembered until reboot.
+    def test_is_app_installed(self, fake_adb):
+        digest = hash_cache.hash(filesPath / "deviceinfo.apk")
+        adb = fake_adb("installed", InstalledDevice(199, digest))
+        assert adb.is_app_installed("deviceinfo.apk")
+        assert adb.is_app_installed("deviceinfo.apk")
+        assert len(adb.device.commands) == 1
+        adb.state.update("another-boot", "0", [])
+        adb.device = InstalledDevice(198, digest)
+        assert not adb.is_app_installed("deviceinfo.apk")
+
+    # Tests that a new boot id drops everything known about the device, and that an adbd restart only drops root.
+    def test_device_state(self):
+        state = DeviceState()
+        assert state.update("boot-1", "0", ["/dev/block/dm-1", "/product", "ext4", "rw,seclabel"]) is None
+        assert state.rooted and state.remounted
+        state.installed["com.example"] = "digest"
+        state.fingerprint = "fake/fake/fake:14"
+        assert state.update("boot-1", "2000", ["/dev/block/dm-1", "/product", "ext4", "rw,seclabel"]) == "adbd restart"
+        assert not state.rooted and state.installed == {"com.example": "digest"}
+        assert state.update("boot-2", "2000", ["/dev/block/dm-1", "/product", "ext4", "ro,seclabel"]) == "reboot"
+        assert (state.rooted, state.remounted, state.installed, state.fingerprint) == (False, False, {}, None)
+        assert state.boot_id == "boot-2"
+
+    # Tests that refreshing the state notices a reboot of the device and fetches the fingerprint again.
+    def test_refresh_state(self, fake_adb):
+        adb = fake_adb("refreshed")
+        adb.refresh_state()
+        assert adb.build_fingerprint() == "fake/fake/fake:14/FAKE/1:userdebug/test-keys"
+        adb.state.installed["com.example"] = "digest"
+        adb.refresh_state()
+        assert adb.state.installed == {"com.example": "digest"}
+        adb.device.boot_id = "another-boot"
+        adb.refresh_state()
+        assert adb.state.installed == {} and adb.state.fingerprint is None
+        assert adb.state.boot_id == "another-boot"
+
+    # Tests that a remembered install is trusted without a round trip until a refresh notices a reboot.
+    def test_is_installed_after_reboot(self, fake_adb):
+        digest = hash_cache.hash(filesPath / "deviceinfo.apk")
+        reply = Response(r"^p=\$\(pm path", f"versionCode=199\n{digest}  /data/app/base.apk\n")
+        adb = fake_adb("rebooted", responses=[reply])
+        adb.refresh_state()
+        assert adb.is_installed("app-install", ["deviceinfo.apk"])
+        adb.device.boot_id = "another-boot"
+        reply.output = f"versionCode=198\n{digest}  /data/app/base.apk\n"
+        commands = adb.device.counts["shell2"]
+        assert adb.is_installed("app-install", ["deviceinfo.apk"])
+        assert adb.device.counts["shell2"] == commands
+        adb.refresh_state()
+        assert not adb.is_installed("app-install", ["deviceinfo.apk"])
+
+    # Tests that exit code 124 only counts as a device side timeout when the command used up its time.
+    def test_exit_code_124(self, fake_adb):
+        adb = fake_adb("exit-124", device_timeout=True, responses=[Response(r"^timeout -k 2 1 ", "", 124)])
+        assert adb.run_command("exits-124", None, 124, 2, True, 1)
+        assert not adb.run_command("exits-124", None, 0, 2, True, 1)
+        adb.device.latency = 1
+        with pytest.raises(TimeoutExpired):
+            adb.run_command("sleep 5", None, None, 2, True, 1)
+
+    # Tests that tests rooting the same device side by side restart adbd once.
+    def test_root_is_serialized(self, fake_adb):
+        adb = fake_adb("rooting", root_latency=0.05)
+        threads = [threading.Thread(target=adb.root) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert adb.state.rooted
+        assert adb.device.counts["root"] == 1
+
+    # Tests that a different APK at the priv-app path only counts as installed with the same package and versionCode.
+    def test_priv_moves_checks_manifest(self, fake_adb):
+        path = "/product/priv-app/deviceinfo/deviceinfo.apk"
+        installed = Response(r"^p=\$\(pm path ru\.andr7e\.deviceinfohw", f"versionCode=199\nother  {path}\n")
+        adb = fake_adb("priv", responses=[Response(r"^sha256sum", f"other  {path}\n"), installed])
+        assert adb.priv_moves("deviceinfo.apk", []) == []
+        installed.output = f"versionCode=198\nother  {path}\n"
+        assert [move[0] for move in adb.priv_moves("deviceinfo.apk", [])] == ["deviceinfo.apk"]
+        installed.output = "versionCode=199\nother  /data/app/base.apk\n"
+        assert [move[0] for move in adb.priv_moves("deviceinfo.apk", [])] == ["deviceinfo.apk"]
+
+    # Tests that a hung command gives up within the time budget and the session recovers.
+    def test_shell2_timeout(self, fake_adb):
+        adb = fake_adb("hung", LocalDevice())
+        adb.use_shell_session()
+        start = time.monotonic()
+        with budget(0.3), pytest.raises(TimeoutExpired):
+            adb.shell2("sleep 5")
+        assert time.monotonic() - start < 2
+        assert adb.shell2("echo alive").output == "alive\n"
+        adb.use_shell_session(False)
+
+    # Tests that streaming stops at the first line passing the predicate and keeps only the last lines.
+    def test_stream(self, fake_adb):
+        adb = fake_adb("streaming", CommandDevice())
+        adb.device_timeout = False
+        matcher = Matcher({"regex": "value ([0-9]+)", "predicate": ">= 50", "max_lines": 3})
+        start = time.monotonic()
+        assert adb.stream("i=0; while true; do echo value $i; i=$((i+1)); sleep 0.01; done", matcher, 10)
+        assert time.monotonic() - start < 5
+        assert adb.last_output == "value 48\nvalue 49\nvalue 50"
+        assert not adb.stream("echo value 1; echo value 2", matcher, 10)
+        assert not adb.stream("sleep 5", Matcher({"regex": "never"}), 0.3)
+
+    # Tests that pushes run on the device pool are traced with the test's attributes and inside its span.
+    def test_pooled_push_trace(self, fake_adb):
+        adb = fake_adb("traced-push", latency=0.01)
+        tracer.enable()
+        try:
+            with tracer.scope(device="traced-push", test="Push", iteration=0), tracer.span("submodule"):
+                assert adb.push_many([filesPath / "hackbench", filesPath / "test.mp3"]) == [
+                    (filesPath / "hackbench").stat().st_size, (filesPath / "test.mp3").stat().st_size]
+            pushes = [event for event in tracer.events if event["name"] == "adb.push"]
+            assert len(pushes) == 2
+            assert all(push["args"]["device"] == "traced-push" and push["args"]["test"] == "Push" for push in pushes)
+            assert all(push["tid"] != threading.get_ident() for push in pushes)
+            assert set(tracer.threads.values()) == {"traced-push"}
+            count, total, own = tracer.phases["submodule"]
+            assert own < total - 0.02  # The pooled pushes and their device round trips are not the span's own time.
+        finally:
+            tracer.reset()
+
+    # Tests that pushes share the device's pool, overlapping but never beyond its concurrency.
+    def test_push_many_pool(self, fake_adb, tmp_path, mocker):
+        adb = fake_adb("pooled", throughput=1e6)
+        adb.concurrency = 2
+        files = []
+        for index in range(6):
+            files.append(tmp_path / f"payload{index}.bin")
+            files[-1].write_bytes(b"x" * 50000)
+        running, peak, lock = [0], [0], threading.Lock()
+        push = adb.device.sync.push
+
+        def counted(*args, **kwargs):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            try:
+                return push(*args, **kwargs)
+            finally:
+                with lock:
+                    running[0] -= 1
+
+        mocker.patch.object(adb.device.sync, "push", side_effect=counted)
+        assert adb.push_many(files) == [50000] * 6
+        assert peak[0] == 2
+
+    # Tests that a run without a serial uses the attached device's own session, the one the daemon keeps warm.
+    def test_default_session(self, mocker):
+        devices = [FakeAdbDevice("warm-1")]
+        mocker.patch("TDTK.core.adb.adbutils.AdbClient", side_effect=lambda *args, **kwargs: FakeAdbClient(devices))
+        warmed = ADB.attached()[0]
+        assert ADB.default() is warmed and warmed.serial == "warm-1"
+        devices.clear()
+        assert ADB.default() is ADB()
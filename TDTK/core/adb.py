@@ -1,26 +1,292 @@
+import contextlib
+import contextvars
+import itertools
 import os
+import shlex
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 import adbutils
 from TDTK.core.logger import Logger
-from TDTK.core.indicator import Indicator
+from TDTK.core.cache import hash_cache
+from TDTK.core.apk import read_manifest
+from TDTK.core.deadline import TimeoutExpired, remaining
+from TDTK.core.matching import Matcher
+from TDTK.core.tracing import tracer
+from TDTK.core.indicator import indicator
 import time
 from pathlib import Path
 logger = Logger(None)
 thisPath = Path(__file__).parent
 filesPath = thisPath / "files"
+deviceFilesPath = "/sdcard/TDTK"
+manifestPath = f"{deviceFilesPath}/.manifest"
 
-class ADB:
-    _instance = None
-    
-    def __new__(cls, *args, **kwargs):
-        cls._instance = cls._instance or object.__new__(cls)
-        return cls._instance
-    
+class ShellSession:
+    # A single long-lived `sh` per device, every command is framed by a sentinel line carrying its exit code.
+    window = 32
+
+    def __init__(self, device: adbutils.AdbDevice, timeout: Optional[float] = 60) -> None:
+        self.device = device
+        self.timeout = timeout
+        self.connection = None
+        self.buffer = b""
+        self.token = uuid.uuid4().hex[:12]
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def open(self) -> None:
+        self.connection = self.device.shell("sh", stream=True)
+        self.connection.conn.settimeout(self.timeout)
+        self.buffer = b""
+
+    def close(self) -> None:
+        if self.connection:
+            self.connection.close()
+        self.connection = None
+
+    def run(self, command: str, timeout: Optional[float] = None) -> adbutils.ShellReturn:
+        return self.run_many([command], timeout)[0]
+
+    def run_many(self, commands: list[str], timeout: Optional[float] = None) -> list[adbutils.ShellReturn]:
+        with self.lock:
+            if not self.connection:
+                self.open()
+            self.connection.conn.settimeout(timeout or self.timeout)
+            try:
+                returns = []
+                # Commands are written a window at a time so a chatty command can never fill both socket buffers.
+                for offset in range(0, len(commands), self.window):
+                    returns += self.run_window(commands[offset:offset + self.window])
+                return returns
+            except (socket.timeout, adbutils.AdbTimeout):
+                self.close()  # Closing the stream kills the shell together with whatever hung in it.
+                raise adbutils.AdbTimeout(f"Shell session timed out after {timeout or self.timeout}s")
+            except (OSError, adbutils.AdbError):
+                self.close()
+                raise
+
+    def run_window(self, commands: list[str]) -> list[adbutils.ShellReturn]:
+        sentinels = [f"__TDTK_{self.token}_{next(self.counter)}__" for _ in commands]
+        payload = "".join(
+            f"( {command}\n) </dev/null 2>&1; __rc=$?; echo; echo \"{sentinel} $__rc\"\n"
+            for command, sentinel in zip(commands, sentinels)
+        )
+        self.connection.conn.sendall(payload.encode())
+        returns = []
+        for command, sentinel in zip(commands, sentinels):
+            returncode, output = self.read_reply(sentinel)
+            returns.append(adbutils.ShellReturn(command=command, returncode=returncode, output=output))
+        return returns
+
+    def read_reply(self, sentinel: str) -> tuple[int, str]:
+        marker = f"\n{sentinel} ".encode()
+        while True:
+            start = self.buffer.find(marker)
+            end = self.buffer.find(b"\n", start + len(marker)) if start >= 0 else -1
+            if end >= 0:
+                output = self.buffer[:start].decode("utf-8", errors="replace")
+                returncode = int(self.buffer[start + len(marker):end])
+                self.buffer = self.buffer[end + 1:]
+                return returncode, output
+            chunk = self.connection.conn.recv(65536)
+            if not chunk:
+                raise adbutils.AdbError("Shell session closed by the device")
+            self.buffer += chunk
+
+class DeviceState:
     def __init__(self) -> None:
-        self.adb_client = adbutils.AdbClient(host="127.0.0.1", port=5037)
-        devices = self.adb_client.device_list()
-        self.device = devices[0] if devices else None
-        
+        self.boot_id = None
+        self.rooted = False
+        self.remounted = False
+        self.installed = {}  # Device path or package name -> sha256 verified since boot.
+        self.fingerprint = None
+
+    def invalidate(self) -> None:
+        self.rooted = False
+        self.remounted = False
+
+    def update(self, boot_id: str, uid: str, product_mount: list[str]) -> Optional[str]:
+        event = None
+        if boot_id != self.boot_id:
+            event = "reboot" if self.boot_id is not None else None
+            self.invalidate()
+            self.installed.clear()
+            self.fingerprint = None
+            self.boot_id = boot_id
+        elif self.rooted and uid != "0":
+            event = "adbd restart"
+            self.invalidate()
+        if uid == "0":
+            self.rooted = True
+        if len(product_mount) > 3 and "rw" in product_mount[3].split(","):
+            self.remounted = True
+        return event
+
+class ADB:
+    # One session per device serial, the None key is the default (first attached) device.
+    _instances = {}
+    _lock = threading.Lock()
+
+    def __new__(cls, serial: Optional[str] = None, *args, **kwargs):
+        with cls._lock:
+            instance = cls._instances.get(serial)
+            if instance is None:
+                instance = object.__new__(cls)
+                instance._initialized = False
+                cls._instances[serial] = instance
+        return instance
+
+    def __init__(self, serial: Optional[str] = None) -> None:
+        if self._initialized:
+            return
+        self._initialized = True
+        self.requested_serial = serial
+        self._adb_client = None
+        self._device = None
+        self._device_resolved = False
+        self.state = DeviceState()
+        self.shell_session = None
+        self.local = threading.local()
+        self.concurrency = 4
+        self.timeout = 120
+        self.device_timeout = None
+        self.manifest_lock = threading.Lock()
+        # Root and remount restart adbd or change mounts, tests running side by side take turns at them.
+        self.state_lock = threading.RLock()
+        self._executor = None
+
+    # Tests running side by side on one device each see the output of their own last command.
+    @property
+    def last_output(self) -> str:
+        return getattr(self.local, "last_output", "")
+
+    @last_output.setter
+    def last_output(self, output: str) -> None:
+        self.local.last_output = output
+
+    # Blocking operations issued side by side share one pool per device instead of a thread per call.
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=max(self.concurrency, 1),
+                                                    thread_name_prefix=f"TDTK-adb-{self.requested_serial or 'default'}")
+            return self._executor
+
+    def submit(self, function, *args, **kwargs):
+        # Worker threads log under the caller's device tag, keep its deadline and trace inside its current span.
+        device = getattr(logger.context, "device", None)
+        traced = tracer.carry(function)
+
+        def bound():
+            logger.bind_device(device)
+            return traced(*args, **kwargs)
+
+        return self.executor.submit(contextvars.copy_context().run, bound)
+
+    # The adb server is only contacted once a device is actually needed.
+    @property
+    def adb_client(self) -> adbutils.AdbClient:
+        if self._adb_client is None:
+            # Every connection, push and install included, gives up once the device stays silent this long.
+            self._adb_client = adbutils.AdbClient(host="127.0.0.1", port=5037, socket_timeout=self.timeout)
+        return self._adb_client
+
+    @property
+    def device(self) -> Optional[adbutils.AdbDevice]:
+        if not self._device_resolved:
+            devices = self.adb_client.device_list()
+            if self.requested_serial:
+                devices = [device for device in devices if device.serial == self.requested_serial]
+            self._device = devices[0] if devices else None
+            self._device_resolved = True
+        return self._device
+
+    @device.setter
+    def device(self, device: Optional[adbutils.AdbDevice]) -> None:
+        self._device = device
+        self._device_resolved = True
+
+    def use_shell_session(self, enabled: Optional[bool] = True) -> None:
+        if self.shell_session:
+            self.shell_session.close()
+        self.shell_session = ShellSession(self.device) if enabled and self.device else None
+
+    @contextlib.contextmanager
+    def expire(self, operation: str, timeout: Optional[float]):
+        try:
+            yield
+        except (adbutils.AdbTimeout, socket.timeout) as e:
+            raise TimeoutExpired(f"{operation} timed out after {timeout or self.timeout:.1f}s") from e
+
+    def shell2(self, command: str, timeout: Optional[float] = None, session: bool = True) -> adbutils.ShellReturn:
+        timeout = remaining(timeout or self.timeout)
+        with tracer.span("adb.shell2", command=command), self.expire(f'"{command}"', timeout):
+            return self._shell2(command, timeout, session)
+
+    def _shell2(self, command: str, timeout: float, session: bool = True) -> adbutils.ShellReturn:
+        if self.shell_session and session:
+            try:
+                return self.shell_session.run(command, timeout)
+            except adbutils.AdbTimeout:
+                raise
+            except (OSError, adbutils.AdbError) as e:
+                logger.log("Shell session failed (%s), falling back to a new connection", "debug", e)
+        return self.device.shell2(command, timeout=timeout)
+
+    def shell2_many(self, commands: list[str], timeout: Optional[float] = None) -> list[adbutils.ShellReturn]:
+        timeout = remaining(timeout or self.timeout)
+        with tracer.span("adb.shell2_many", commands=len(commands)), self.expire(f"{len(commands)} commands", timeout):
+            return self._shell2_many(commands, timeout)
+
+    def _shell2_many(self, commands: list[str], timeout: float) -> list[adbutils.ShellReturn]:
+        if self.shell_session:
+            try:
+                return self.shell_session.run_many(commands, timeout)
+            except adbutils.AdbTimeout:
+                raise
+            except (OSError, adbutils.AdbError) as e:
+                logger.log("Shell session failed (%s), falling back to a new connection", "debug", e)
+        return [self.device.shell2(command, timeout=timeout) for command in commands]
+
+    def killable(self, command: str, timeout: float) -> str:
+        # The device's own timeout kills the command when it runs over, not just our end of the connection.
+        if self.device_timeout is None:
+            self.device_timeout = self.device.shell2("command -v timeout", timeout=self.timeout).returncode == 0
+        if not self.device_timeout:
+            return command
+        return f"timeout -k 2 {max(int(timeout), 1)} sh -c {shlex.quote(command)}"
+
+    def shell(self, command: str) -> str:
+        return self.shell2(command).output.rstrip()
+
+    @classmethod
+    def forget_default(cls) -> None:
+        # The default session picks the first attached device again next time, that may no longer be the same one.
+        with cls._lock:
+            instance = cls._instances.get(None)
+        if instance is not None:
+            instance._device_resolved = False
+
+    @classmethod
+    def attached(cls) -> list["ADB"]:
+        client = adbutils.AdbClient(host="127.0.0.1", port=5037)
+        return [cls(device.serial) for device in client.device_list()]
+
+    @classmethod
+    def default(cls) -> "ADB":
+        # The first attached device under its own serial, the session a daemon or an earlier -i run already warmed up.
+        devices = adbutils.AdbClient(host="127.0.0.1", port=5037).device_list()
+        return cls(devices[0].serial) if devices else cls()
+
+    @property
+    def serial(self) -> Optional[str]:
+        return self.device.serial if self.device else None
+
+
     def run(
         self,
         command: Optional[str],
@@ -33,19 +299,23 @@ class ADB:
         overwrite: Optional[bool] = False,
         silent: Optional[bool] = True,
         repeat: Optional[int] = 0,
+        command_timeout: Optional[float] = None,
+        matcher: Optional[Matcher] = None,
     ) -> bool:
-        logger.log(f"adb run type is {command_type}", type="debug")
+        logger.log("adb run type is %s", "debug", command_type)
+        self.last_output = ""
+        # The boot id was checked when the test started (Planner.session), root and remount keep the state current.
         if not self.root():
             logger.log(f"Failed to restart adb as root!", type="plainFailure")
             return False
         if command_type == "app-install-priv":
-            logger.log(f"Running install-app-priv routine", type="debug")
+            logger.log("Running install-app-priv routine", "debug")
             return self.run_app_install_priv(files[0], files[1:], overwrite)
         if command_type == "app-install":
-            logger.log(f"Running install-app routine, files are {files}", type="debug")
+            logger.log("Running install-app routine, files are %s", "debug", files)
             return self.run_app_install(files[0])
         if command_type == "push-exec":
-            logger.log(f"Running push-exec routine, files are {files}", type="debug")
+            logger.log("Running push-exec routine, files are %s", "debug", files)
             return self.run_push_exec(files)
         if not timeout:
             timeout = 2
@@ -54,150 +324,325 @@ class ADB:
             return False
         if parameters:
             command = f"{command} {' '.join(parameters)}"
-        logger.log(f"Running command: {command}", type="debug")
-        logger.log(f"Parameters: {parameters}", type="debug")
+        logger.log("Running command: %s", "debug", command)
+        logger.log("Parameters: %s", "debug", parameters)
         if repeat:
             for _ in range(repeat):
-                logger.log(f"Command: {command}, in iteration!", type="debug")
-                ret = self.run_command(command, check, expected, timeout, silent)
+                logger.log("Command: %s, in iteration!", "debug", command)
+                ret = self.run_command(command, check, expected, timeout, silent, command_timeout, matcher)
                 if not ret:
                     return False
                 return ret
         else:
-            return self.run_command(command, check, expected, timeout, silent)
+            return self.run_command(command, check, expected, timeout, silent, command_timeout, matcher)
 
-    def run_command(self, command: str, check: str, expected: str, timeout: int, silent: bool) -> bool:
-        ret = self.device.shell2(command)
-        if not silent:
-            logger.log(f"Command Output: {ret.output if ret.output else ret.returncode}", type="summarySpaced")
-        else:
-            logger.log(f"Command Output: {ret.output if ret.output else ret.returncode}", type="debug")
+    def run_command(self, command: str, check: str, expected: str, timeout: int, silent: bool,
+                    command_timeout: Optional[float] = None, matcher: Optional[Matcher] = None) -> bool:
+        if matcher and not check:
+            matched = self.stream(command, matcher, command_timeout)
+            self.log_output(self.last_output, silent)
+            return matched
+        command_timeout = remaining(command_timeout or self.timeout)
+        # Our end waits a little longer than the device side, so the device reports the kill itself.
+        start = time.monotonic()
+        ret = self.shell2(self.killable(command, command_timeout), command_timeout + 5)
+        self.last_output = ret.output
+        # 124 is also an ordinary exit code, it only means the device killed the command once its time was up.
+        if self.device_timeout and ret.returncode == 124 and time.monotonic() - start >= max(int(command_timeout), 1):
+            raise TimeoutExpired(f'"{command}" timed out after {command_timeout:.1f}s and was killed')
+        self.log_output(ret.output if ret.output else ret.returncode, silent)
+        if check and matcher:
+            return self.stream(check, matcher, timeout)
         if check:
             ret = self.check(check, expected, timeout)
             return ret
         return self.acceptable(ret, expected)
 
+    def log_output(self, output, silent: bool) -> None:
+        if not silent:
+            logger.log(f"Command Output: {output}", type="summarySpaced")
+        else:
+            logger.log("Command Output: %s", "debug", output)
+
+    def stream(self, command: str, matcher: Matcher, timeout: Optional[float] = None) -> bool:
+        # Reads the command line by line and stops it at the first match, only the last lines are kept.
+        limit = timeout or self.timeout
+        timeout = remaining(limit)
+        lines = matcher.buffer()
+        partial = b""
+        matched = False
+        end = time.monotonic() + timeout
+        with tracer.span("adb.stream", command=command):
+            connection = self.device.shell(self.killable(command, timeout), stream=True)
+            try:
+                while not matched:
+                    left = end - time.monotonic()
+                    if left <= 0:
+                        raise socket.timeout()
+                    connection.conn.settimeout(left)
+                    chunk = connection.conn.recv(65536)
+                    if not chunk:
+                        break
+                    *complete, partial = (partial + chunk).split(b"\n")
+                    partial = partial[-matcher.max_line_bytes:]
+                    for line in complete:
+                        line = line.decode("utf-8", errors="replace").rstrip("\r")
+                        lines.append(line)
+                        if matcher.feed(line):
+                            matched = True
+                            break
+                if not matched and partial:
+                    line = partial.decode("utf-8", errors="replace")
+                    lines.append(line)
+                    matched = matcher.feed(line)
+            except socket.timeout:
+                if timeout < limit:
+                    raise TimeoutExpired(f'"{command}" ran out of the time budget after {timeout:.1f}s')
+                logger.log('No match in the output of "%s" within %ss', "debug", command, limit)
+            finally:
+                connection.close()  # Closing the stream hangs up on whatever is still running.
+        self.last_output = "\n".join(lines)
+        return matched
+
     def run_push_exec(self, files: list[str]) -> bool:
         for file in files:
             if self.push(filesPath / file, f"/data/local/tmp/{file}") <= 0:
                 logger.log(f"Failed to push file {file}!", type="plainFailure")
                 return False
-        logger.log(f"Pushed files successfully!", type="debug")
+        logger.log("Pushed files successfully!", "debug")
         return True
 
     def run_app_install(
         self,
         file: str,
     ) -> bool:
+        if self.is_app_installed(file):
+            logger.log(f"{file} is already installed on the device, skipping install", type="result")
+            return True
         ret = self.remount()
         if not ret:
             return False
         else:
-            logger.log(f"Running adb install now!", type="debug")
-            self.device.install(str(filesPath / file), nolaunch=True, silent=True)
+            logger.log("Running adb install now!", "debug")
+            if not self.install(filesPath / file):
+                return False
+            manifest = read_manifest(filesPath / file)
+            if manifest:
+                self.state.installed[manifest[0]] = hash_cache.hash(filesPath / file)
+        return True
+
+    def install(self, file_path: Path, timeout: Optional[float] = None) -> bool:
+        # Push and pm install separately so both are bounded, adbutils' install has no timeout of its own.
+        timeout = remaining(timeout or self.timeout)
+        dest = f"/data/local/tmp/{file_path.name}"
+        with tracer.span("adb.install", file=str(file_path)):
+            if self.push(file_path, dest) <= 0:
+                return False
+            ret = self.shell2(f"pm install -r -t {dest}; __rc=$?; rm -f {dest}; exit $__rc", timeout, session=False)
+        if ret.returncode != 0 or "Success" not in ret.output:
+            logger.log(f"Failed to install {file_path.name}, output: {ret.output}", type="plainFailure")
+            return False
         return True
 
+    def is_app_installed(self, file: str) -> bool:
+        # Same package, versionCode and base.apk contents as the local file, so installing again changes nothing.
+        file_path = filesPath / file
+        manifest = read_manifest(file_path)
+        if not manifest:
+            return False
+        package, version_code = manifest
+        digest = hash_cache.hash(file_path)
+        if self.state.installed.get(package) == digest:
+            return True
+        installed = self.installed_package(package)
+        logger.log("Installed %s: %s, local versionCode %s sha256 %s", "debug", package, installed, version_code, digest)
+        if not installed or installed[1] != str(version_code) or installed[2] != digest:
+            return False
+        self.state.installed[package] = digest
+        return True
+
+    def installed_package(self, package: str) -> Optional[tuple[str, str, str]]:
+        # (path, versionCode, sha256) of the package's base APK on the device, None when it is not installed.
+        with tracer.span("adb.installed", package=package):
+            ret = self.shell2(
+                f'p=$(pm path {package} 2>/dev/null | head -n 1); p=${{p#package:}}; [ -n "$p" ] || exit 1;'
+                f' dumpsys package {package} | grep -m 1 -o "versionCode=[0-9]*"; sha256sum "$p"'
+            )
+        lines = ret.output.split()
+        if ret.returncode != 0 or len(lines) < 3:
+            return None
+        return lines[2], lines[0].removeprefix("versionCode="), lines[1]
+
+    def is_same_build(self, apk_name: str, path: str) -> bool:
+        # The package manager has the local APK's package and versionCode installed from path.
+        manifest = read_manifest(filesPath / apk_name)
+        if not manifest:
+            return False
+        installed = self.installed_package(manifest[0])
+        return installed is not None and installed[0] == path and installed[1] == str(manifest[1])
+
+    def installed_digests(self, paths: list[str]) -> dict[str, str]:
+        missing = [path for path in paths if path not in self.state.installed]
+        if missing:
+            ret = self.shell2(f"sha256sum {' '.join(missing)} 2>/dev/null")
+            for line in ret.output.splitlines():
+                parts = line.split()
+                if len(parts) == 2:
+                    self.state.installed[parts[1]] = parts[0]
+        return {path: self.state.installed[path] for path in paths if path in self.state.installed}
+
+    def priv_moves(self, apk_name: str, additional_files: list[str], overwrite: Optional[bool] = False) -> list[tuple]:
+        apk_name = str(apk_name)
+        moves = []
+        for file in additional_files:
+            file = str(file)
+            logger.log("Additional file found! %s", "debug", file)
+            if "privapp-permissions" in file:
+                destination = f'/product/etc/permissions/{file}'
+            elif "default-permissions" in file:
+                destination = f'/product/etc/default-permissions/{file}'
+            else:
+                continue
+            moves.append((file, destination, False, destination))
+        apk_destination = f'/product/priv-app/{apk_name.split(".")[0]}/'
+        moves.append((apk_name, apk_destination, True, f'{apk_destination}{apk_name}'))
+        # Identical files are never moved again. Without overwrite a differing permission file is kept,
+        # and so is a differing APK as long as it is the same package and versionCode.
+        installed = self.installed_digests([move[3] for move in moves])
+        pending = []
+        for move in moves:
+            if move[3] not in installed:
+                pending.append(move)
+            elif installed[move[3]] == hash_cache.hash(filesPath / move[0]):
+                continue
+            elif overwrite or (move[0] == apk_name and not self.is_same_build(apk_name, move[3])):
+                pending.append(move)
+        return pending
+
+    def is_installed(self, command_type: str, files: list[str], overwrite: Optional[bool] = False) -> bool:
+        if not all((filesPath / file).is_file() for file in files):
+            return False  # Missing files are reported by the push that follows.
+        if command_type not in ("app-install", "app-install-priv") or not files:
+            return False
+        if command_type == "app-install":
+            return self.is_app_installed(files[0])
+        return not self.priv_moves(files[0], files[1:], overwrite)
+
     def run_app_install_priv(
         self,
         apk_name: str,
         additional_files: list[str],
         overwrite: Optional[bool] = False,
     ):
-        logger.log(f"In run_app_install_priv", type="debug")
+        logger.log("In run_app_install_priv", "debug")
+        if overwrite:
+            logger.log("Overwriting!", "debug")
+        moves = self.priv_moves(apk_name, additional_files, overwrite)
+        if not moves:
+            logger.log(f"{apk_name} is already installed on the device, skipping install", type="result")
+            return True
         ret = self.remount()
         if not ret:
             return False
-        apk_name = str(apk_name)
-        if not overwrite:
-            for file in additional_files:
-                file = str(file)
-                logger.log(f"Additional file found! {file}", type="debug")
-                if "privapp-permissions" in file:
-                    if self.check_file_existence(f'/product/etc/permissions/{file}'):
-                        continue
-                    else:
-                        if not self.move_file(file, f'/product/etc/permissions/{file}', create_path=False):
-                            return False
-                if "default-permissions" in file:
-                    if self.check_file_existence(f'/product/etc/default-permissions/{file}'):
-                        continue
-                    else:
-                        if not self.move_file(file, f'/product/etc/default-permissions/{file}', create_path=False):
-                            return False                   
-            if self.check_file_existence(f'/product/priv-app/{apk_name.split(".")[0]}/{apk_name}'):
-                return True
-        else:
-            for file in additional_files:
-                file = str(file)
-                if "default-permissions" in file:
-                    if not self.move_file(file, f'/product/etc/default-permissions/{file}', create_path=False):
-                        return False
-                if "privapp-permissions" in file:
-                    if not self.move_file(file, f'/product/etc/permissions/{file}', create_path=False):
-                        return False
-            logger.log(f"Overwriting!", type="debug")
-
-        if not self.move_file(apk_name, f'/product/priv-app/{apk_name.split(".")[0]}/'):
-            return False
-        return True
+        for move in moves:
+            self.state.installed.pop(move[3], None)
+        # The moves touch different files, so they run side by side instead of one mv/chown sequence at a time.
+        return self.move_files([move[:3] for move in moves])
+
+    def move_files(self, moves: list[tuple[str, str, bool]]) -> bool:
+        return all([future.result() for future in [self.submit(self.move_file, *move) for move in moves]])
+
+    def push_many(self, files: list[Path]) -> list[int]:
+        # Independent files go over separate connections at the same time.
+        return [future.result() for future in [self.submit(self.push, file) for file in files]]
 
     def move_file(self, source_path: str, destination_path: str, create_path: Optional[bool] = True) -> bool:
         if create_path:
-            ret = self.device.shell2(f'mkdir -p {destination_path} && chmod 755 {destination_path}')
-            logger.log(f"Creating directory {destination_path} with 755 permissions", type="debug")
+            ret = self.shell2(f'mkdir -p {destination_path} && chmod 755 {destination_path}')
+            logger.log("Creating directory %s with 755 permissions", "debug", destination_path)
             if ret.returncode != 0:
                 return False
-        logger.log(f"Moving file /sdcard/TDTK/{source_path} to {destination_path}", type="debug")
-        ret = self.device.shell2(f'mv /sdcard/TDTK/{source_path} {destination_path}')
+        logger.log("Moving file %s/%s to %s", "debug", deviceFilesPath, source_path, destination_path)
+        ret = self.shell2(f'mv {deviceFilesPath}/{source_path} {destination_path}')
         if ret.returncode != 0:
-            logger.log(f"Failed to move file /sdcard/TDTK/{source_path} to {destination_path}, output: {ret.output}", type="plainFailure")
+            logger.log(f"Failed to move file {deviceFilesPath}/{source_path} to {destination_path}, output: {ret.output}", type="plainFailure")
             return False
         root, ext = os.path.splitext(destination_path)
         if not ext:
             destination_path = f"{destination_path}{source_path}"
-        ret = self.device.shell2(f'chown root:root {destination_path} && chmod 644 {destination_path}')
+        ret = self.shell2(f'chown root:root {destination_path} && chmod 644 {destination_path}')
         if ret.returncode != 0:
             logger.log(f"Failed to change ownership of {destination_path}, output: {ret.output}", type="plainFailure")
             return False
-        logger.log(f"Changing ownership for file {destination_path}", type="debug")
+        logger.log("Changing ownership for file %s", "debug", destination_path)
         return True
 
     def check_files_existence(self, file_paths: list[str]) -> bool:
-        for file_path in file_paths:
-            if not self.check_file_existence(file_path):
-                return False
-        return True
+        rets = self.shell2_many([f'[ -f {file_path} ]' for file_path in file_paths])
+        return all(ret.returncode == 0 for ret in rets)
 
     def check_file_existence(self, file_path: str) -> bool:
         command = f'[ -f {file_path} ]'
-        logger.log(f"File check command is {command}", type="debug")
-        ret = self.device.shell2(command)
-        logger.log(f"Return code for check command is {ret.returncode}", type="debug")
+        logger.log("File check command is %s", "debug", command)
+        ret = self.shell2(command)
+        logger.log("Return code for check command is %s", "debug", ret.returncode)
         if ret.returncode == 0:
             logger.log(f'File {file_path} already exists on the device, skipping...', type="result")
             return True
         return False
 
+    def refresh_state(self) -> None:
+        # One round trip tells us whether the device rebooted, adbd dropped root or /product is still RW.
+        with tracer.span("adb.refresh_state"):
+            ret = self.shell2('cat /proc/sys/kernel/random/boot_id; id -u; grep " /product " /proc/mounts')
+        lines = ret.output.splitlines()
+        boot_id = lines[0].strip() if lines else ""
+        uid = lines[1].strip() if len(lines) > 1 else ""
+        product_mount = lines[2].split() if len(lines) > 2 else []
+        event = self.state.update(boot_id, uid, product_mount)
+        if event:
+            logger.log("Device %s detected, dropping cached root and remount state", "debug", event)
+
+    def build_fingerprint(self) -> Optional[str]:
+        if self.state.fingerprint is None:
+            self.state.fingerprint = self.shell("getprop ro.build.fingerprint")
+        return self.state.fingerprint or None
+
     def remount(self, bail: Optional[bool] = False) -> bool:
-        ret = self.device.shell2("remount")
-        if ret == "inaccessible":
-            logger.log(f"Failed to remount device as RW!", type="plainFailure")
-            return False
-        if ret == "root":
-            if bail:
-                logger.log(f"Failed to remount device as RW!", type="plainFailure")
-                return False
-            if not self.root():
+        with self.state_lock:
+            if self.state.remounted:
+                logger.log("Device is already remounted as RW, skipping remount", "debug")
+                return True
+            with tracer.span("adb.remount"):
+                ret = self.shell2("remount")
+            if "inaccessible" in ret.output:
                 logger.log(f"Failed to remount device as RW!", type="plainFailure")
                 return False
-            ret = self.remount(bail=True)
-        return True
+            if "adb root" in ret.output:
+                if bail:
+                    logger.log(f"Failed to remount device as RW!", type="plainFailure")
+                    return False
+                self.state.rooted = False
+                if not self.root():
+                    logger.log(f"Failed to remount device as RW!", type="plainFailure")
+                    return False
+                return self.remount(bail=True)
+            if ret.returncode == 0:
+                self.state.remounted = True
+            return True
 
     def root(self) -> bool:
-        ret = self.device.root()
-        if ret == "cannot run as root":
-            return False
-        return True
+        with self.state_lock:
+            if self.state.rooted:
+                return True
+            with tracer.span("adb.root"):
+                ret = self.device.root()
+            if "cannot run as root" in ret:
+                return False
+            if self.shell_session:
+                self.shell_session.close()  # adbd restarts as root and takes the running shell with it.
+            self.state.rooted = True
+            return True
 
     def check(
         self,
@@ -205,23 +650,28 @@ class ADB:
         expected: str,
         timeout: Optional[int] = 2,
     ) -> bool:
+        with tracer.span("adb.check", check=check):
+            return self._check(check, expected, timeout)
+
+    def _check(self, check: str, expected: str, timeout: int) -> bool:
         starttime = time.time()
         halfway_time = starttime + timeout / 2  # Calculate the halfway time
         if isinstance(expected, str):
             while time.time() < starttime + timeout:
-                ret = self.device.shell(check)
-                logger.log(f"Command: {check}", type="debug")
-                logger.log(f"Command Output: {ret}", type="debug")
+                ret = self.shell(check)
+                logger.log("Command: %s", "debug", check)
+                logger.log("Command Output: %s", "debug", ret)
                 if expected in ret:
                     return True
                 # Check if halfway time has been reached
                 if time.time() >= halfway_time:
                     logger.log("Still waiting for expected outcome...", type="ratelimited")
-                time.sleep(0.2)  # Wait for a short duration before checking again
+                with tracer.span("adb.check.sleep"):
+                    time.sleep(0.2)  # Wait for a short duration before checking again
             return False
-        ret = self.device.shell2(check)
-        logger.log(f"Command: {check}", type="debug")
-        logger.log(f"Command Output: {ret.output}", type="debug")
+        ret = self.shell2(check)
+        logger.log("Command: %s", "debug", check)
+        logger.log("Command Output: %s", "debug", ret.output)
         return ret.returncode
 
     def acceptable(self, ret, expected) -> bool:
@@ -238,23 +688,45 @@ class ADB:
 
     def push(self, file_name, dest=None) -> int:
         if not dest:
-            logger.log(f"Pushing file {file_name} to /sdcard/TDTK/{file_name.stem}{file_name.suffix}", type="debug")
-            ret = self.device.sync.push(
-                file_name,
-                f"/sdcard/TDTK/{file_name.stem}{file_name.suffix}"
-            )
-        else:
-            logger.log(f"Pushing file {file_name} to {dest}", type="debug")
+            dest = f"{deviceFilesPath}/{file_name.stem}{file_name.suffix}"
+        size = os.path.getsize(file_name)
+        digest = hash_cache.hash(file_name)
+        if self.is_pushed(dest, digest, size):
+            logger.log("File %s is already on the device at %s, skipping push", "debug", file_name, dest)
+            return size
+        logger.log("Pushing file %s to %s", "debug", file_name, dest)
+        remaining()
+        start = time.perf_counter()
+        with tracer.span("adb.push", file=str(file_name), bytes=size), self.expire(f"Pushing {file_name}", None):
             ret = self.device.sync.push(
                 file_name,
                 dest
             )
+        indicator.add_push(self.serial, size, time.perf_counter() - start)
+        self.record_pushed(dest, digest)
         return ret
-    
-    def cleanup(self) -> int:
-        command = "rm -rf /sdcard/TDTK"
+
+    def is_pushed(self, dest: str, digest: str, size: int) -> bool:
+        # The manifest uses the sha256sum line format, the size check catches files moved or truncated since.
+        ret = self.shell2(f'[ "$(stat -c %s {dest} 2>/dev/null)" = "{size}" ] && grep -qxF "{digest}  {dest}" {manifestPath}')
+        return ret.returncode == 0
+
+    def record_pushed(self, dest: str, digest: str) -> None:
+        pattern = dest.replace(".", "\\.")
+        with self.manifest_lock:
+            ret = self.shell2(
+                f'mkdir -p {deviceFilesPath} && {{ grep -v "  {pattern}$" {manifestPath} 2>/dev/null; echo "{digest}  {dest}"; }} > {manifestPath}.tmp'
+                f' && mv {manifestPath}.tmp {manifestPath}'
+            )
+        if ret.returncode != 0:
+            logger.log("Failed to update the push manifest for %s, output: %s", "debug", dest, ret.output)
+
+    def cleanup(self, keep_files: Optional[bool] = False) -> int:
+        if keep_files:
+            return 0  # Pushed files and their manifest stay on the device for the next run.
+        command = f"rm -rf {deviceFilesPath}"
         try:
-            ret = self.device.shell2(command)
+            ret = self.shell2(command)
         except:
             return 1
         return ret.returncode
@@ -0,0 +1,14 @@
+import pytest
+from TDTK.core.adb import filesPath
+from TDTK.core.apk import ApkError, parse_manifest, read_manifest
+
+class Tests:
+    # Tests that the package name and versionCode come out of the binary manifest.
+    def test_read_manifest(self):
+        assert read_manifest(filesPath / "deviceinfo.apk") == ("ru.andr7e.deviceinfohw", 199)
+
+    # Tests that anything but an APK is reported instead of crashing the install.
+    def test_read_manifest_invalid(self):
+        assert read_manifest(filesPath / "hackbench") is None
+        with pytest.raises(ApkError):
+            parse_manifest(b"<manifest/>")
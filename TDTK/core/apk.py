@@ -0,0 +1,96 @@
+import functools
+import os
+import struct
+import zipfile
+from pathlib import Path
+from typing import Optional
+
+# Chunk types of the binary XML Android compiles AndroidManifest.xml into.
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_TYPE = 0x0003
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+RES_XML_START_ELEMENT_TYPE = 0x0102
+UTF8_FLAG = 1 << 8
+TYPE_STRING = 0x03
+# android:versionCode, matched by resource id when the attribute name was stripped from the pool.
+VERSION_CODE_ID = 0x0101021B
+
+class ApkError(Exception):
+    pass
+
+def read_length(data: bytes, offset: int, utf8: bool) -> tuple[int, int]:
+    if utf8:
+        length = data[offset]
+        if length & 0x80:
+            return ((length & 0x7F) << 8) | data[offset + 1], offset + 2
+        return length, offset + 1
+    length = struct.unpack_from("<H", data, offset)[0]
+    if length & 0x8000:
+        return ((length & 0x7FFF) << 16) | struct.unpack_from("<H", data, offset + 2)[0], offset + 4
+    return length, offset + 2
+
+def read_string_pool(data: bytes, offset: int) -> list[str]:
+    header_size, _, count, _, flags, strings_start = struct.unpack_from("<HIIIII", data, offset + 2)
+    utf8 = bool(flags & UTF8_FLAG)
+    strings = []
+    for index in range(count):
+        position = offset + strings_start + struct.unpack_from("<I", data, offset + header_size + index * 4)[0]
+        if utf8:
+            _, position = read_length(data, position, True)  # Length in characters, the byte length follows.
+            length, position = read_length(data, position, True)
+            strings.append(data[position:position + length].decode("utf-8", errors="replace"))
+        else:
+            length, position = read_length(data, position, False)
+            strings.append(data[position:position + length * 2].decode("utf-16-le", errors="replace"))
+    return strings
+
+def parse_manifest(data: bytes) -> tuple[str, int]:
+    if len(data) < 8 or struct.unpack_from("<H", data, 0)[0] != RES_XML_TYPE:
+        raise ApkError("AndroidManifest.xml is not binary XML")
+    strings, resource_ids = [], []
+    offset = struct.unpack_from("<H", data, 2)[0]
+    while offset + 8 <= len(data):
+        chunk_type, header_size, size = struct.unpack_from("<HHI", data, offset)
+        if size < 8:
+            break
+        if chunk_type == RES_STRING_POOL_TYPE:
+            strings = read_string_pool(data, offset)
+        elif chunk_type == RES_XML_RESOURCE_MAP_TYPE:
+            resource_ids = list(struct.unpack_from(f"<{(size - header_size) // 4}I", data, offset + header_size))
+        elif chunk_type == RES_XML_START_ELEMENT_TYPE:
+            # The first element is <manifest>, it carries both the package and the versionCode.
+            body = offset + header_size
+            name, attribute_start, attribute_size, attribute_count = struct.unpack_from("<4xIHHH", data, body)
+            if strings[name] != "manifest":
+                raise ApkError("AndroidManifest.xml does not start with <manifest>")
+            package, version_code = None, None
+            for index in range(attribute_count):
+                attribute = body + attribute_start + index * attribute_size
+                _, key, raw, data_type, value = struct.unpack_from("<IIi3xBI", data, attribute)
+                key_name = strings[key] if key < len(strings) else ""
+                text = strings[raw] if 0 <= raw < len(strings) else None
+                if key_name == "package":
+                    package = text
+                elif key_name == "versionCode" or (key < len(resource_ids) and resource_ids[key] == VERSION_CODE_ID):
+                    version_code = int(text) if data_type == TYPE_STRING and text else value
+            if not package:
+                raise ApkError("AndroidManifest.xml has no package name")
+            return package, version_code or 0
+        offset += size
+    raise ApkError("AndroidManifest.xml has no <manifest> element")
+
+@functools.lru_cache(maxsize=64)
+def _read_manifest(path: str, mtime: int, size: int) -> tuple[str, int]:
+    try:
+        with zipfile.ZipFile(path) as apk:
+            return parse_manifest(apk.read("AndroidManifest.xml"))
+    except (KeyError, zipfile.BadZipFile, struct.error, IndexError) as e:
+        raise ApkError(f"Failed to read the manifest of {path}: {e}")
+
+def read_manifest(path: Path) -> Optional[tuple[str, int]]:
+    # (package, versionCode) of a local APK, None when it cannot be parsed.
+    try:
+        stat = os.stat(path)
+        return _read_manifest(str(path), stat.st_mtime_ns, stat.st_size)
+    except (OSError, ApkError):
+        return None
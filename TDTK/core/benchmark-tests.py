@@ -0,0 +1,132 @@
+import json
+import os
+import statistics
+import time
+from argparse import Namespace
+from pathlib import Path
+import pytest
+from TDTK.core.adb import ADB
+from TDTK.core.fake_adb import Response
+from TDTK.core.logger import Logger
+from TDTK.core.modules import Modules
+from TDTK.core.sharding import DurationStore
+from TDTK.core.test_runner import TestRunner
+
+# Timings depend on the machine, they are only asserted with TDTK_BENCHMARK set. A plain run just checks the behaviour.
+# Plans of 10000 entries take a while, TDTK_BENCHMARK=full adds them.
+timed = bool(os.environ.get("TDTK_BENCHMARK"))
+sizes = [10, 100, 1000] + ([10000] if os.environ.get("TDTK_BENCHMARK") == "full" else [])
+
+class NullStream:
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+def report(name: str, **values):
+    # Printed for `pytest -s`, appended as JSON lines to TDTK_BENCHMARK_OUT for comparing runs.
+    print(f"\n{name}: " + ", ".join(f"{key}={value:.6g}" if isinstance(value, float) else f"{key}={value}"
+                                     for key, value in values.items()))
+    if os.environ.get("TDTK_BENCHMARK_OUT"):
+        with open(os.environ["TDTK_BENCHMARK_OUT"], "a") as out:
+            out.write(json.dumps({"benchmark": name, **values}) + "\n")
+
+def write_modules(directory: Path, count: int) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    for index in range(count):
+        (directory / f"bench{index}.json").write_text(json.dumps({
+            "noop": {"command": "true", "expected": 0, "resources": []},
+            "echo": {"command": "echo ok", "expected": "ok", "resources": []},
+        }))
+
+@pytest.fixture
+def quiet():
+    logger = Logger(None)
+    stream = logger.stream
+    logger.set_stream(NullStream())
+    yield
+    if logger.writer:
+        logger.writer.queue.join()
+    logger.set_stream(stream)
+
+def make_runner(tmp_path: Path, adb: ADB, **options) -> TestRunner:
+    write_modules(tmp_path / "modules", 1)
+    args = Namespace(debug=False, test_plan=None, module=None, history_enabled=False, **options)
+    runner = TestRunner(args, Modules(tmp_path / "modules", tmp_path / "catalog.json"))
+    runner.durations = DurationStore(tmp_path / "durations.json")
+    runner.sessions = [adb]
+    return runner
+
+class Tests:
+    # Measures what the runner itself adds per test on a device that answers instantly, from planning to the result.
+    @pytest.mark.parametrize("size", sizes)
+    def test_runner_overhead(self, tmp_path, quiet, fake_adb, size):
+        adb = fake_adb(f"bench-runner-{size}")
+        runner = make_runner(tmp_path, adb)
+        runner.test_plan = [{"test_name": f"noop {index}", "module": "bench0.noop"} for index in range(size)]
+        start = time.perf_counter()
+        runner.plan_tests()
+        runner.run_tests(adb)
+        elapsed = time.perf_counter() - start
+        assert runner.tests_passed == size
+        report("runner_overhead", size=size, seconds=elapsed, per_test_ms=elapsed / size * 1000,
+               round_trips_per_test=adb.device.counts["shell2"] / size)
+        if timed:
+            assert elapsed / size < 0.05
+
+    # Measures catalog indexing from scratch, the warm start that reuses the index and loading every definition.
+    @pytest.mark.parametrize("size", sizes)
+    def test_module_load(self, tmp_path, size):
+        write_modules(tmp_path / "modules", size)
+        timings = {}
+        for phase in ("cold", "warm"):
+            start = time.perf_counter()
+            modules = Modules(tmp_path / "modules", tmp_path / "catalog.json")
+            modules.load_modules()
+            timings[phase] = time.perf_counter() - start
+        start = time.perf_counter()
+        assert all(modules.available_modules.get(name) for name in modules.list_modules())
+        timings["definitions"] = time.perf_counter() - start
+        report("module_load", size=size, **{f"{phase}_ms": seconds * 1000 for phase, seconds in timings.items()})
+        if timed:
+            assert timings["warm"] <= timings["cold"] * 2
+
+    # Measures how much of a link's throughput a push keeps and what the digest check costs when it is skipped.
+    @pytest.mark.parametrize("megabytes", [1, 16] if timed else [1])
+    def test_push_throughput(self, tmp_path, fake_adb, megabytes):
+        throughput = 200e6
+        adb = fake_adb(f"bench-push-{megabytes}", latency=0.001, throughput=throughput)
+        path = tmp_path / "payload.bin"
+        path.write_bytes(os.urandom(megabytes << 20))
+        start = time.perf_counter()
+        assert adb.push(path, "/data/local/tmp/payload.bin") == megabytes << 20
+        pushed = time.perf_counter() - start
+        start = time.perf_counter()
+        adb.push(path, "/data/local/tmp/payload.bin")
+        skipped = time.perf_counter() - start
+        assert adb.device.counts["push"] == 1
+        efficiency = (megabytes << 20) / throughput / pushed
+        report("push_throughput", megabytes=megabytes, push_ms=pushed * 1000, effective_mb_s=(megabytes << 20) / pushed / 1e6,
+               efficiency=efficiency, skipped_ms=skipped * 1000)
+        if timed:
+            assert efficiency > 0.2
+
+    # Measures how long after the device state changes a polling check notices it.
+    def test_check_latency(self, quiet, fake_adb):
+        delay = 0.5
+        ready = {}
+
+        def state(command):
+            return "ready\n" if time.monotonic() >= ready["at"] else "waiting\n"
+
+        adb = fake_adb("bench-check", latency=0.002, responses=[Response(r"^cat /bench/state", state)])
+        samples = []
+        for _ in range(5):
+            ready["at"] = time.monotonic() + delay
+            assert adb.check("cat /bench/state", "ready", timeout=5)
+            samples.append(time.monotonic() - ready["at"])
+        report("check_latency", median_ms=statistics.median(samples) * 1000, max_ms=max(samples) * 1000,
+               polls=adb.device.counts["shell2"])
+        if timed:
+            assert statistics.median(samples) < 0.5
@@ -0,0 +1,33 @@
+import hashlib
+from TDTK.core.cache import HashCache, hash_cache
+
+class Tests:
+    # Tests that a file is hashed once and served from the cache while its mtime and size are unchanged.
+    def test_hash_is_cached(self, tmp_path, mocker):
+        file = tmp_path / "file.bin"
+        file.write_bytes(b"TDTK")
+        cache = HashCache(tmp_path / "hashes.json")
+        assert cache.hash(file) == hashlib.sha256(b"TDTK").hexdigest()
+
+        spy = mocker.spy(hashlib, "sha256")
+        assert HashCache(tmp_path / "hashes.json").hash(file) == hashlib.sha256(b"TDTK").hexdigest()
+        assert spy.call_count == 1  # Only the call in the assertion above.
+
+    # Tests that a changed file is hashed again.
+    def test_hash_changes_with_content(self, tmp_path):
+        file = tmp_path / "file.bin"
+        file.write_bytes(b"TDTK")
+        cache = HashCache(tmp_path / "hashes.json")
+        first = cache.hash(file)
+        file.write_bytes(b"TDTK, but longer")
+        assert cache.hash(file) != first
+
+    # Tests that the shared cache follows TDTK_CACHE_DIR, even once it was used with another directory.
+    def test_cache_dir(self, tmp_path, cache_dir, monkeypatch):
+        file = tmp_path / "file.bin"
+        file.write_bytes(b"TDTK")
+        hash_cache.hash(file)
+        assert str(file.resolve()) in (cache_dir / "hashes.json").read_text()
+        monkeypatch.setenv("TDTK_CACHE_DIR", str(tmp_path / "other"))
+        hash_cache.hash(file)
+        assert (tmp_path / "other" / "hashes.json").exists()
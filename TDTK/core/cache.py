@@ -0,0 +1,58 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+def cache_dir() -> Path:
+    # Looked up on every use, so TDTK_CACHE_DIR also applies when it is set after import.
+    return Path(os.environ.get("TDTK_CACHE_DIR", Path.home() / ".cache" / "TDTK"))
+
+def write_json(path: Path, data) -> None:
+    # Write to a sibling file first so a crash never leaves a truncated cache behind.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as entry:
+        json.dump(data, entry)
+    os.replace(tmp, path)
+
+def read_json(path: Path, fallback=None):
+    try:
+        with open(path) as entry:
+            return json.load(entry)
+    except (OSError, ValueError):
+        return fallback
+
+class HashCache:
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = path
+        self.entries = None
+        self.loaded = None
+        self.lock = threading.Lock()
+
+    def hash(self, file_path: Path) -> str:
+        file_path = Path(file_path)
+        stat = file_path.stat()
+        key = str(file_path.resolve())
+        path = self.path or cache_dir() / "hashes.json"
+        with self.lock:
+            if self.entries is None or self.loaded != path:
+                self.entries = read_json(path, {})
+                self.loaded = path
+            entry = self.entries.get(key)
+            if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                return entry["sha256"]
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as entry:
+            for chunk in iter(lambda: entry.read(1 << 20), b""):
+                digest.update(chunk)
+        with self.lock:
+            self.entries[key] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest.hexdigest()}
+            try:
+                write_json(path, self.entries)
+            except OSError:
+                pass  # The cache is an optimization, a read-only home must not break a run.
+        return digest.hexdigest()
+
+hash_cache = HashCache()
@@ -0,0 +1,50 @@
+import socket
+import time
+from types import SimpleNamespace
+from TDTK.core.capture import LogCapture, RingBuffer
+
+# Hands out socket pairs for the streamed commands, the test writes the "device" side itself.
+class StreamDevice:
+    def __init__(self):
+        self.ends = {}
+
+    def shell(self, command, stream=False):
+        host, device = socket.socketpair()
+        self.ends[command.split()[0]] = device
+        return SimpleNamespace(conn=host, close=host.close)
+
+def wait_for(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.01)
+    return condition()
+
+class Tests:
+    # Tests that the buffer stays within its size and slices report the lines evicted before them.
+    def test_ring_buffer(self):
+        buffer = RingBuffer(max_bytes=40)
+        for i in range(10):
+            buffer.append(f"line {i:03d}")
+        assert buffer.size <= 40
+        assert buffer.slice(8) == ["line 008", "line 009"]
+        assert buffer.slice(0, 7)[0] == "--- 6 earlier lines were dropped from the ring buffer ---"
+        assert buffer.slice(0, 7)[1:] == ["line 006"]
+
+    # Tests that a dump holds only what the device logged after the test's mark.
+    def test_capture_dump(self, tmp_path):
+        device = StreamDevice()
+        capture = LogCapture(SimpleNamespace(device=device, serial="dev1"), tmp_path)
+        capture.grace = 0
+        capture.start()
+        assert wait_for(lambda: len(device.ends) == 2)
+        device.ends["logcat"].sendall(b"before\n")
+        assert wait_for(lambda: capture.readers[0].buffer.mark() == 1)
+        marks = capture.mark()
+        device.ends["logcat"].sendall(b"during 1\r\nduring 2\n")
+        device.ends["dmesg"].sendall(b"kernel\n")
+        assert wait_for(lambda: capture.readers[0].buffer.mark() == 3 and capture.readers[1].buffer.mark() == 1)
+        paths = capture.dump(marks, "Wi-Fi Connection", 0)
+        capture.stop()
+        assert [path.name for path in paths] == ["Wi-Fi_Connection-1.logcat.txt", "Wi-Fi_Connection-1.dmesg.txt"]
+        assert paths[0].read_text() == "during 1\nduring 2\n"
+        assert paths[1].read_text() == "kernel\n"
@@ -0,0 +1,122 @@
+import re
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Optional, TYPE_CHECKING
+from TDTK.core.logger import Logger
+
+if TYPE_CHECKING:
+    from TDTK.core.adb import ADB
+
+logger = Logger(None)
+
+class RingBuffer:
+    # Keeps the newest lines within max_bytes, every line gets a sequence number so marks survive eviction.
+    def __init__(self, max_bytes: int = 4 << 20):
+        self.max_bytes = max_bytes
+        self.lines = deque()
+        self.size = 0
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def append(self, line: str) -> None:
+        with self.lock:
+            self.lines.append((self.next, line))
+            self.next += 1
+            self.size += len(line) + 1
+            while self.size > self.max_bytes and self.lines:
+                self.size -= len(self.lines.popleft()[1]) + 1
+
+    def mark(self) -> int:
+        with self.lock:
+            return self.next
+
+    def slice(self, start: int, end: Optional[int] = None) -> list[str]:
+        with self.lock:
+            end = self.next if end is None else end
+            first = self.lines[0][0] if self.lines else self.next
+            lines = [line for number, line in self.lines if start <= number < end]
+        if first > start:
+            lines.insert(0, f"--- {min(first, end) - start} earlier lines were dropped from the ring buffer ---")
+        return lines
+
+class LogStream(threading.Thread):
+    # Follows one device command into a ring buffer, reconnecting after adbd restarts or reboots.
+    def __init__(self, adb: "ADB", name: str, command: str, max_bytes: int):
+        super().__init__(name=f"TDTK-{name}-{adb.serial}", daemon=True)
+        self.adb = adb
+        self.stream_name = name
+        self.command = command
+        self.buffer = RingBuffer(max_bytes)
+        self.stop_event = threading.Event()
+        self.connection = None
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.connection = self.adb.device.shell(self.command, stream=True)
+                self.connection.conn.settimeout(None)
+                partial = b""
+                while not self.stop_event.is_set():
+                    chunk = self.connection.conn.recv(65536)
+                    if not chunk:
+                        break
+                    *complete, partial = (partial + chunk).split(b"\n")
+                    for line in complete:
+                        self.handle(line.decode("utf-8", errors="replace").rstrip("\r"))
+            except Exception as e:
+                if not self.stop_event.is_set():
+                    logger.log("%s capture on %s interrupted: %s", "debug", self.stream_name, self.adb.serial, e)
+            finally:
+                self.close()
+            self.stop_event.wait(1)
+
+    def handle(self, line: str):
+        self.buffer.append(line)
+
+    def close(self):
+        connection, self.connection = self.connection, None
+        if connection:
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+    def stop(self):
+        self.stop_event.set()
+        self.close()  # Unblocks the pending recv.
+
+class LogCapture:
+    # Background logcat and dmesg per device, a test's slice only reaches the disk when it failed.
+    streams = {"logcat": "logcat -v threadtime -T 1", "dmesg": "dmesg -w"}
+    grace = 0.5
+
+    def __init__(self, adb: "ADB", directory: Path, max_bytes: int = 4 << 20):
+        self.adb = adb
+        self.directory = Path(directory)
+        self.readers = [LogStream(adb, name, command, max_bytes) for name, command in self.streams.items()]
+
+    def start(self):
+        for reader in self.readers:
+            reader.start()
+
+    def stop(self):
+        for reader in self.readers:
+            reader.stop()
+
+    def mark(self) -> dict[str, int]:
+        return {reader.stream_name: reader.buffer.mark() for reader in self.readers}
+
+    def dump(self, start: dict[str, int], test_name: str, iteration: int) -> list[Path]:
+        time.sleep(self.grace)  # Lines logged right before the failure are still on their way from the device.
+        name = re.sub(r"[^A-Za-z0-9_.-]+", "_", test_name)
+        directory = self.directory / re.sub(r"[^A-Za-z0-9_.-]+", "_", self.adb.serial or "device")
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for reader in self.readers:
+            lines = reader.buffer.slice(start.get(reader.stream_name, 0))
+            path = directory / f"{name}-{iteration + 1}.{reader.stream_name}.txt"
+            path.write_text("\n".join(lines) + "\n" if lines else "")
+            paths.append(path)
+        return paths
@@ -0,0 +1,49 @@
+import io
+import pytest
+from TDTK.core.adb import ADB, DeviceState
+from TDTK.core.fake_adb import FakeAdbDevice
+from TDTK.core.logger import Logger
+from TDTK.core.modules import Module, SubModule
+from TDTK.core.planner import Planner
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # Hashes, the catalog, durations and history of a test never touch or come from the developer's cache.
+    path = tmp_path / "cache"
+    monkeypatch.setenv("TDTK_CACHE_DIR", str(path))
+    return path
+
+@pytest.fixture
+def fake_adb():
+    # The ADB singleton of serial on a fresh fake device, or on the given one, with nothing cached from earlier tests.
+    def make(serial: str, device=None, **kwargs) -> ADB:
+        adb = ADB(serial)
+        adb.device = device if device is not None else FakeAdbDevice(serial, **kwargs)
+        adb.state = DeviceState()
+        adb.shell_session = None
+        adb.device_timeout = None
+        return adb
+    return make
+
+@pytest.fixture
+def make_planner(mocker):
+    # A planner over modules given as {module: {submodule: definition}}, commands default to the submodule name.
+    def make(definitions: dict) -> Planner:
+        available_modules = {}
+        for module_name, submodules in definitions.items():
+            available_modules[module_name] = Module(None, module_name, {
+                name: SubModule(module_name, {"command": name, "expected": 0, **data}) for name, data in submodules.items()
+            })
+        return Planner(mocker.Mock(available_modules=available_modules))
+    return make
+
+@pytest.fixture
+def output():
+    # Everything logged during the test, complete once the logger's writer is closed.
+    logger = Logger(None)
+    stream = logger.stream
+    buffer = io.StringIO()
+    logger.set_stream(buffer)
+    yield buffer
+    logger.close()
+    logger.set_stream(stream)
@@ -0,0 +1,32 @@
+import argparse
+import threading
+from TDTK.core.daemon import Handler, Server, stop, submit
+
+# Answers submissions without devices, echoing the plan back as output.
+class EchoDaemon:
+    def run(self, args, cwd, stream):
+        stream.write(f"running {args.test_plan} in {cwd}\n")
+        return 3
+
+class Tests:
+    # Tests that a submission streams the output back and returns the run's exit code.
+    def test_submit(self, tmp_path, capsys):
+        path = tmp_path / "daemon.sock"
+        server = Server(str(path), Handler)
+        server.daemon = EchoDaemon()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            assert submit(argparse.Namespace(test_plan="plan.json"), path) == 3
+            assert capsys.readouterr().out.startswith("running plan.json in ")
+            assert stop(path)
+            thread.join(5)
+            assert not thread.is_alive()
+        finally:
+            server.server_close()
+
+    # Tests that the CLI runs locally when no daemon is listening.
+    def test_submit_without_daemon(self, tmp_path):
+        assert submit(argparse.Namespace(test_plan="plan.json"), tmp_path / "daemon.sock") is None
+        (tmp_path / "daemon.sock").touch()
+        assert submit(argparse.Namespace(test_plan="plan.json"), tmp_path / "daemon.sock") is None
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from pathlib import Path
+from typing import Optional
+from TDTK.core.cache import cache_dir
+
+def socket_path() -> Path:
+    return Path(os.environ.get("TDTK_DAEMON_SOCKET", cache_dir() / "daemon.sock"))
+
+# Both sides speak JSON lines: the client sends one request, the daemon streams {"out": text} and ends with {"exit": code}.
+def send(connection: socket.socket, message: dict) -> None:
+    connection.sendall(json.dumps(message).encode() + b"\n")
+
+def submit(args: argparse.Namespace, path: Optional[Path] = None) -> Optional[int]:
+    # Returns the exit code of the run on the daemon, or None when no daemon is listening.
+    path = Path(path or socket_path())
+    if not path.exists():
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(str(path))
+    except OSError:
+        connection.close()
+        return None
+    with connection, connection.makefile("rb") as replies:
+        send(connection, {"args": vars(args), "cwd": os.getcwd()})
+        for line in replies:
+            message = json.loads(line)
+            if "out" in message:
+                sys.stdout.write(message["out"])
+                sys.stdout.flush()
+            elif "exit" in message:
+                return message["exit"]
+    return 1  # The daemon went away in the middle of the run.
+
+def stop(path: Optional[Path] = None) -> bool:
+    path = Path(path or socket_path())
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(str(path))
+            send(connection, {"stop": True})
+            connection.recv(1)
+        return True
+    except OSError:
+        return False
+
+class ClientStream:
+    # Stands in for stdout while a submission runs, a client that hung up only loses its own output.
+    def __init__(self, connection: socket.socket):
+        self.connection = connection
+        self.connected = True
+
+    def write(self, text: str) -> None:
+        if not self.connected:
+            return
+        try:
+            send(self.connection, {"out": text})
+        except OSError:
+            self.connected = False
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        request = json.loads(line)
+        if request.get("stop"):
+            send(self.connection, {"exit": 0})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        code = self.server.daemon.run(argparse.Namespace(**request["args"]), request.get("cwd"), ClientStream(self.connection))
+        try:
+            send(self.connection, {"exit": code})
+        except OSError:
+            pass
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class Daemon:
+    # Keeps the imports, the module catalog and the per-device ADB sessions (root, remount, shell) alive between runs.
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or socket_path())
+        self.lock = threading.Lock()
+        from TDTK.core.adb import ADB
+        from TDTK.core.logger import Logger
+        from TDTK.core.modules import Modules
+        self.logger = Logger(None)
+        self.modules = Modules()
+        self.modules.load_modules()
+        for adb in ADB.attached():
+            adb.refresh_state()
+            adb.root()
+            self.logger.log(f"Device {adb.serial} is ready", type="plain")
+
+    def run(self, args: argparse.Namespace, cwd: Optional[str], stream: ClientStream) -> int:
+        from TDTK.core.adb import ADB
+        from TDTK.core.test_runner import TestRunner
+        from TDTK.core.tracing import tracer
+        # Submissions queue up, a run owns the working directory, the logger and the devices until it finishes.
+        with self.lock:
+            previous = os.getcwd()
+            args.progress = False
+            try:
+                if cwd:
+                    os.chdir(cwd)
+                self.logger.set_stream(stream)
+                tracer.reset()
+                ADB.forget_default()
+                self.modules.load_modules()
+                runner = TestRunner(args, modules=self.modules)
+                runner.start()
+                return 0
+            except SystemExit as e:
+                return e.code if isinstance(e.code, int) else 1
+            except Exception as e:
+                self.logger.log(f"Daemon run failed: {e}", type="fatal")
+                return 1
+            finally:
+                self.logger.close()
+                self.logger.set_stream(None)
+                os.chdir(previous)
+
+    def serve(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self.path.unlink()  # Left behind by a daemon that did not shut down cleanly.
+        server = Server(str(self.path), Handler)
+        server.daemon = self
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+        self.logger.log(f"TDTK daemon listening on {self.path}", type="plainSpaced")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.path.unlink(missing_ok=True)
@@ -0,0 +1,22 @@
+import time
+import pytest
+from TDTK.core.deadline import TimeoutExpired, budget, remaining
+
+class Tests:
+    # Tests that nested budgets only shorten the deadline and clip operation timeouts.
+    def test_budget(self):
+        assert remaining(30) == 30
+        with budget(10):
+            assert remaining(30) <= 10
+            with budget(60):
+                assert remaining() <= 10
+            with budget(until=time.monotonic() + 1):
+                assert remaining(30) <= 1
+        assert remaining() is None
+
+    # Tests that a spent budget fails every further operation right away.
+    def test_budget_exhausted(self):
+        with budget(0.01):
+            time.sleep(0.02)
+            with pytest.raises(TimeoutExpired):
+                remaining(30)
@@ -0,0 +1,32 @@
+import contextlib
+import contextvars
+import time
+from typing import Optional
+
+# Monotonic time by which the current test (or plan) has to be done, carried into worker threads by asyncio.
+current = contextvars.ContextVar("deadline", default=None)
+
+class TimeoutExpired(TimeoutError):
+    pass
+
+@contextlib.contextmanager
+def budget(seconds: Optional[float] = None, until: Optional[float] = None):
+    # Nested budgets only ever shorten the deadline.
+    deadlines = [deadline for deadline in (current.get(), until) if deadline is not None]
+    if seconds:
+        deadlines.append(time.monotonic() + seconds)
+    token = current.set(min(deadlines) if deadlines else None)
+    try:
+        yield
+    finally:
+        current.reset(token)
+
+def remaining(timeout: Optional[float] = None) -> Optional[float]:
+    # The timeout an operation may use, clipped to the budget, raises once the budget is spent.
+    deadline = current.get()
+    if deadline is None:
+        return timeout
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutExpired("Time budget exhausted")
+    return min(timeout, left) if timeout else left
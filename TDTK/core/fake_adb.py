@@ -0,0 +1,165 @@
+import os
+import re
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional, Union
+import adbutils
+
+class Response:
+    # A scripted shell reply, output may be a callable of the command for replies that change over time.
+    def __init__(self, pattern: str, output: Union[str, Callable[[str], str]] = "", returncode: int = 0,
+                 latency: Optional[float] = None):
+        self.pattern = re.compile(pattern)
+        self.output = output
+        self.returncode = returncode
+        self.latency = latency
+
+    def reply(self, command: str) -> tuple[str, int]:
+        return (self.output(command) if callable(self.output) else self.output), self.returncode
+
+class FakeStream:
+    def __init__(self, output: str):
+        self.conn, device = socket.socketpair()
+        device.sendall(output.encode())
+        device.close()
+
+    def close(self):
+        self.conn.close()
+
+class FakeShell(threading.Thread):
+    # The device end of an interactive `sh`, answers the sentinel framed commands a ShellSession writes.
+    frame = re.compile(rb'\( (.*?)\n\) </dev/null 2>&1; __rc=\$\?; echo; echo "(\S+) \$__rc"\n', re.DOTALL)
+
+    def __init__(self, device: "FakeAdbDevice"):
+        super().__init__(name=f"TDTK-fake-sh-{device.serial}", daemon=True)
+        self.device = device
+        self.conn, self.end = socket.socketpair()
+        self.start()
+
+    def run(self):
+        buffer = b""
+        try:
+            while chunk := self.end.recv(65536):
+                buffer += chunk
+                while match := self.frame.search(buffer):
+                    buffer = buffer[match.end():]
+                    ret = self.device.shell2(match.group(1).decode())
+                    self.end.sendall(f"{ret.output}\n{match.group(2).decode()} {ret.returncode}\n".encode())
+        except (OSError, adbutils.AdbError):
+            pass  # Hanging up makes the session fall back to plain shell2 calls, which report the error.
+        finally:
+            self.end.close()
+
+    def close(self):
+        self.conn.close()
+
+class FakeSync:
+    def __init__(self, device: "FakeAdbDevice"):
+        self.device = device
+
+    def push(self, src, dst: str, *args, **kwargs) -> int:
+        size = os.path.getsize(src) if isinstance(src, (str, Path)) else len(src.read())
+        self.device.wait(self.device.latency + (size / self.device.throughput if self.device.throughput else 0))
+        with self.device.lock:
+            self.device.files[str(dst)] = size
+            self.device.counts["push"] += 1
+            self.device.pushed_bytes += size
+        return size
+
+class FakeAdbDevice:
+    # In-process stand-in for adbutils.AdbDevice with a configurable round trip latency, push throughput and replies.
+    # Without a script it behaves like a rooted device: files pushed are there, installs succeed, nothing else prints.
+    def __init__(self, serial: str = "fake", latency: float = 0.0, throughput: Optional[float] = None,
+                 responses: Optional[list[Response]] = None, root_latency: float = 0.0, install_latency: float = 0.0,
+                 device_timeout: bool = False):
+        self.serial = serial
+        self.latency = latency
+        self.throughput = throughput
+        self.responses = responses or []
+        self.root_latency = root_latency
+        self.install_latency = install_latency
+        self.device_timeout = device_timeout
+        self.boot_id = "fake-boot"
+        self.files = {}
+        self.manifest = {}
+        self.pushed_bytes = 0
+        self.counts = {"shell2": 0, "shell": 0, "push": 0, "root": 0, "install": 0}
+        self.lock = threading.Lock()
+        self.sync = FakeSync(self)
+
+    def wait(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def reply(self, command: str) -> tuple[str, int, Optional[float]]:
+        for response in self.responses:
+            if response.pattern.search(command):
+                return (*response.reply(command), response.latency)
+        return (*self.builtin(command), None)
+
+    def builtin(self, command: str) -> tuple[str, int]:
+        # Just enough of a device for the commands TDTK itself sends.
+        if command.startswith("cat /proc/sys/kernel/random/boot_id"):
+            return f"{self.boot_id}\n0\n/dev/block/dm-1 /product ext4 rw,seclabel 0 0\n", 0
+        if command == "command -v timeout":
+            return ("/system/bin/timeout\n", 0) if self.device_timeout else ("", 1)
+        if command.startswith("getprop ro.build.fingerprint"):
+            return "fake/fake/fake:14/FAKE/1:userdebug/test-keys\n", 0
+        if match := re.match(r'\[ "\$\(stat -c %s (\S+) 2>/dev/null\)" = "(\d+)" \] && grep -qxF "(\w+)  \S+"', command):
+            dest, size, digest = match.groups()
+            with self.lock:
+                return "", 0 if self.files.get(dest) == int(size) and self.manifest.get(dest) == digest else 1
+        if match := re.search(r'echo "(\w+)  (\S+)"; }', command):
+            with self.lock:
+                self.manifest[match.group(2)] = match.group(1)
+            return "", 0
+        if match := re.fullmatch(r"\[ -f (\S+) \]", command):
+            with self.lock:
+                return "", 0 if match.group(1) in self.files else 1
+        if "pm install" in command:
+            self.wait(self.install_latency)
+            with self.lock:
+                self.counts["install"] += 1
+            return "Success\n", 0
+        if command.startswith("p=$(pm path"):
+            return "", 1
+        return "", 0
+
+    def shell2(self, command: str, timeout: Optional[float] = None, **kwargs) -> adbutils.ShellReturn:
+        output, returncode, latency = self.reply(command)
+        self.wait(self.latency if latency is None else latency)
+        with self.lock:
+            self.counts["shell2"] += 1
+        return adbutils.ShellReturn(command=command, returncode=returncode, output=output)
+
+    def shell(self, command: str, stream: bool = False, timeout: Optional[float] = None, **kwargs):
+        if stream and command == "sh":
+            return FakeShell(self)
+        output, _, latency = self.reply(command)
+        self.wait(self.latency if latency is None else latency)
+        with self.lock:
+            self.counts["shell"] += 1
+        return FakeStream(output) if stream else output.rstrip()
+
+    def root(self) -> str:
+        self.wait(self.root_latency)
+        with self.lock:
+            self.counts["root"] += 1
+        return "adbd is already running as root"
+
+    def install(self, path, *args, **kwargs) -> None:
+        self.sync.push(path, f"/data/local/tmp/{Path(path).name}")
+        self.shell2(f"pm install -r -t /data/local/tmp/{Path(path).name}")
+
+class FakeAdbClient:
+    # Drop-in for adbutils.AdbClient that lists the given fake devices.
+    def __init__(self, devices: list[FakeAdbDevice], *args, **kwargs):
+        self.devices = devices
+
+    def device_list(self) -> list[FakeAdbDevice]:
+        return list(self.devices)
+
+    def device(self, serial: Optional[str] = None, **kwargs) -> FakeAdbDevice:
+        return next(device for device in self.devices if serial is None or device.serial == serial)
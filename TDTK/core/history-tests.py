@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+from TDTK.core.history import History, compare_runs, gate
+
+def record_run(history, label, times):
+    history.start_run("plan-hackbench.json", label)
+    for iteration, value in enumerate(times):
+        history.record("dev1", "fingerprint", "Hackbench", "cli.hackbench.run", iteration, "passed", 1.0,
+                       {"time": value}, {"time": ("s", "lower")})
+    return history.run_id
+
+class Tests:
+    # Tests that a slower build is flagged while noise within the threshold is not.
+    def test_compare_runs(self, tmp_path):
+        history = History(tmp_path / "history.db")
+        baseline = record_run(history, "good", [1.00, 1.02, 0.98, 1.01])
+        noisy = record_run(history, "noisy", [1.01, 1.03, 0.99, 1.02])
+        slow = record_run(history, "slow", [1.20, 1.22, 1.19, 1.21])
+        assert not any(comparison.regression for comparison in compare_runs(history, baseline, noisy))
+        comparisons = {comparison.name: comparison for comparison in compare_runs(history, baseline, slow)}
+        assert comparisons["time"].regression and not comparisons["duration"].regression
+        history.close()
+
+    # Tests that gate exits non-zero on a regression against a labelled baseline, compare does not.
+    def test_gate(self, tmp_path):
+        history = History(tmp_path / "history.db")
+        record_run(history, "good", [1.00, 1.02, 0.98, 1.01])
+        record_run(history, None, [1.20, 1.22, 1.19, 1.21])
+        history.close()
+        args = SimpleNamespace(command="gate", run="latest", baseline="good", threshold=5.0, sigma=2.0,
+                               device=None, history=tmp_path / "history.db")
+        assert gate(args) == 1
+        args.command = "compare"
+        assert gate(args) == 0
+        args.baseline = "missing"
+        assert gate(args) == 2
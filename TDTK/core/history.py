@@ -0,0 +1,180 @@
+import math
+import sqlite3
+import statistics
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from TDTK.core.cache import cache_dir
+from TDTK.core.logger import Logger
+
+logger = Logger(None)
+
+schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    plan TEXT,
+    label TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    device TEXT,
+    fingerprint TEXT,
+    test TEXT NOT NULL,
+    module TEXT,
+    iteration INTEGER,
+    status TEXT,
+    duration REAL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    result_id INTEGER NOT NULL REFERENCES results(id),
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    unit TEXT,
+    better TEXT
+);
+CREATE INDEX IF NOT EXISTS results_run ON results(run_id);
+CREATE INDEX IF NOT EXISTS metrics_result ON metrics(result_id);
+"""
+
+class History:
+    # Every measured iteration of every run, so a build can be held against any earlier one.
+    commit_every = 50
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = Path(path or cache_dir() / "history.db")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(schema)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.run_id = None
+
+    def start_run(self, plan: Optional[str] = None, label: Optional[str] = None) -> int:
+        with self.lock:
+            cursor = self.connection.execute("INSERT INTO runs (started, plan, label) VALUES (?, ?, ?)",
+                                             (time.time(), plan, label))
+            self.connection.commit()
+            self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def record(self, device: Optional[str], fingerprint: Optional[str], test: str, module: Optional[str],
+               iteration: int, status: str, duration: float, metrics: dict[str, float], units: dict = None) -> None:
+        units = units or {}
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO results (run_id, device, fingerprint, test, module, iteration, status, duration)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.run_id, device, fingerprint, test, module, iteration, status, duration),
+            )
+            self.connection.executemany(
+                "INSERT INTO metrics (result_id, name, value, unit, better) VALUES (?, ?, ?, ?, ?)",
+                [(cursor.lastrowid, name, value, *units.get(name, ("", "lower"))) for name, value in metrics.items()],
+            )
+            # Batched commits keep sqlite's fsyncs off the test loop.
+            self.pending += 1
+            if self.pending >= self.commit_every:
+                self.connection.commit()
+                self.pending = 0
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+    def runs(self, limit: int = 20) -> list[tuple]:
+        return self.connection.execute(
+            "SELECT id, started, plan, label FROM runs ORDER BY id DESC LIMIT ?", (limit,)
+        ).fetchall()
+
+    def find_run(self, reference: str, before: Optional[int] = None, plan: Optional[str] = None) -> Optional[int]:
+        # A run id, a label, "latest", or "previous" (the last run of the same plan before the candidate).
+        if reference.isdigit():
+            row = self.connection.execute("SELECT id FROM runs WHERE id = ?", (int(reference),)).fetchone()
+        elif reference == "latest":
+            row = self.connection.execute("SELECT MAX(id) FROM runs WHERE id IN (SELECT run_id FROM results)").fetchone()
+        elif reference == "previous":
+            row = self.connection.execute(
+                "SELECT MAX(id) FROM runs WHERE id < ? AND plan IS ? AND id IN (SELECT run_id FROM results)",
+                (before or 0, plan),
+            ).fetchone()
+        else:
+            row = self.connection.execute("SELECT MAX(id) FROM runs WHERE label = ?", (reference,)).fetchone()
+        return row[0] if row else None
+
+    def plan(self, run_id: int) -> Optional[str]:
+        row = self.connection.execute("SELECT plan FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def samples(self, run_id: int, device: Optional[str] = None) -> dict[tuple[str, str], tuple[list[float], str, str]]:
+        # (test, measurement) -> (values, unit, better), the duration of passed iterations is a measurement too.
+        samples = {}
+        filters, parameters = "run_id = ? AND status = 'passed'", [run_id]
+        if device:
+            filters += " AND device = ?"
+            parameters.append(device)
+        for test, duration in self.connection.execute(f"SELECT test, duration FROM results WHERE {filters}", parameters):
+            samples.setdefault((test, "duration"), ([], "s", "lower"))[0].append(duration)
+        for test, name, value, unit, better in self.connection.execute(
+            f"SELECT test, name, value, unit, better FROM metrics JOIN results ON results.id = metrics.result_id"
+            f" WHERE {filters}", parameters
+        ):
+            samples.setdefault((test, name), ([], unit or "", better or "lower"))[0].append(value)
+        return samples
+
+class Comparison:
+    def __init__(self, test: str, name: str, unit: str, better: str, baseline: list[float], candidate: list[float],
+                 threshold: float, sigma: float) -> None:
+        self.test = test
+        self.name = name
+        self.unit = unit
+        self.baseline = statistics.fmean(baseline)
+        self.candidate = statistics.fmean(candidate)
+        self.change = (self.candidate - self.baseline) / abs(self.baseline) * 100 if self.baseline else 0.0
+        # Welch's standard error, a single sample on either side leaves only the percentage threshold.
+        error = math.sqrt(sum(statistics.variance(values) / len(values) for values in (baseline, candidate)
+                              if len(values) > 1))
+        worse = self.candidate - self.baseline if better == "lower" else self.baseline - self.candidate
+        self.regression = worse > 0 and abs(self.change) > threshold and worse > sigma * error
+        self.improvement = worse < 0 and abs(self.change) > threshold and -worse > sigma * error
+
+def compare_runs(history: History, baseline: int, candidate: int, threshold: float = 5.0, sigma: float = 2.0,
+                 device: Optional[str] = None) -> list[Comparison]:
+    baseline_samples = history.samples(baseline, device)
+    comparisons = []
+    for key, (values, unit, better) in sorted(history.samples(candidate, device).items()):
+        if key in baseline_samples:
+            comparisons.append(Comparison(*key, unit, better, baseline_samples[key][0], values, threshold, sigma))
+    return comparisons
+
+def gate(args) -> int:
+    history = History(args.history)
+    try:
+        candidate = history.find_run(args.run)
+        if candidate is None:
+            logger.log(f'Run "{args.run}" was not found in {history.path}', type="plainFailure")
+            return 2
+        baseline = history.find_run(args.baseline, before=candidate, plan=history.plan(candidate))
+        if baseline is None:
+            logger.log(f'No baseline run "{args.baseline}" for run {candidate} in {history.path}', type="plainFailure")
+            return 2
+        comparisons = compare_runs(history, baseline, candidate, args.threshold, args.sigma, args.device)
+    finally:
+        history.close()
+    logger.log(f"Run {candidate} against baseline run {baseline} (threshold {args.threshold:g}%, {args.sigma:g} sigma):",
+               type="summarySpaced")
+    for comparison in comparisons:
+        line = (f"{comparison.test} {comparison.name}: {comparison.baseline:.4g}{comparison.unit} -> "
+                f"{comparison.candidate:.4g}{comparison.unit} ({comparison.change:+.1f}%)")
+        if comparison.regression:
+            logger.log(f"{line} regression", type="failure")
+        else:
+            logger.log(f"{line}{' improvement' if comparison.improvement else ''}", type="result")
+    regressions = sum(comparison.regression for comparison in comparisons)
+    logger.log(f"{len(comparisons)} measurements compared, {regressions} regressions.", type="summarySpaced")
+    if not comparisons:
+        return 2
+    return 1 if regressions and args.command == "gate" else 0
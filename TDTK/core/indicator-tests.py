@@ -0,0 +1,50 @@
+import io
+import threading
+from TDTK.core.indicator import Indicator
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+class Tests:
+    # Tests that devices starting and finishing from many threads while the block redraws leave nothing behind.
+    def test_threads(self):
+        terminal = Terminal()
+        indicator = Indicator(terminal, max_fps=200)
+        assert indicator.start()
+        thread = indicator.thread
+        assert indicator.start() and indicator.thread is thread
+        errors = []
+
+        def device(serial):
+            try:
+                for iteration in range(200):
+                    indicator.update(serial, test=f"test {iteration // 10}", iteration=iteration)
+                    indicator.add_push(serial, 1024, 0.001)
+                    with indicator.lock:
+                        terminal.write(indicator.wrap(f"[{serial}] line {iteration}\n"))
+                indicator.finish(serial)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=device, args=(f"dev{index}",)) for index in range(8)]
+        for device_thread in threads:
+            device_thread.start()
+        for device_thread in threads:
+            device_thread.join()
+        assert errors == []
+        assert indicator.devices == {}
+        assert indicator.render() == ""
+        indicator.stop()
+        assert not thread.is_alive()
+        assert all(f"[dev{index}] line 199\n" in terminal.getvalue() for index in range(8))
+
+    # Tests that without a terminal nothing is drawn and updates are ignored.
+    def test_not_a_terminal(self):
+        stream = io.StringIO()
+        indicator = Indicator(stream)
+        assert not indicator.start()
+        indicator.update("dev1", test="test")
+        indicator.finish("dev1")
+        indicator.stop()
+        assert indicator.devices == {} and stream.getvalue() == ""
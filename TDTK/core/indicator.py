@@ -1,64 +1,118 @@
-from progress.spinner import Spinner
-from progress import SHOW_CURSOR
-from multiprocessing import Process, Pipe
+import shutil
+import sys
+import threading
 import time
+from typing import Optional
 
-# DONT LOOK AT THIS CODE, ITS A MESS AND I KNOW IT BUT IT WORKS SO I DONT CARE :D
+class DeviceProgress:
+    def __init__(self, serial: str):
+        self.serial = serial
+        self.test = ""
+        self.iteration = 0
+        self.started = time.monotonic()
+        self.pushed_bytes = 0
+        self.push_seconds = 0.0
 
-class TDTKSpinner(Spinner):
-    done = False
-
-    def update(self):
-        if not self.done:
-            i = self.index % len(self.phases)
-            message = self.message % self
-            line = ''.join([message, self.phases[i]])
-            self.writeln(line)
-
-    def finish(self):
-        # Hide progress bar
-        self.done = True
-        if self.file and self.is_tty():
-            print(file=self.file)
-            if self._hidden_cursor:
-                print(SHOW_CURSOR, end='', file=self.file)
-                self._hidden_cursor = False
-
-    def stop(self):
-        self.done = True
-        self.finish()
+    def throughput(self) -> Optional[float]:
+        return self.pushed_bytes / self.push_seconds if self.push_seconds > 0 else None
 
 class Indicator:
-    def __init__(self) -> None:
-        self.spinner = TDTKSpinner('')
+    # Live block of one line per device drawn below the log, redrawn from a thread at a capped rate.
+    phases = "⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏"
+
+    def __init__(self, stream=None, max_fps: float = 4):
+        self.stream = stream or sys.stdout
+        self.interval = 1 / max_fps
+        self.devices = {}
+        self.drawn = 0
+        self.frame = 0
         self.run = False
-        self.process_started = False  # New flag to track whether the process is started
-        self.parent_conn, self.child_conn = Pipe()
-        self._process = Process(target=self.next, args=(self.child_conn,), daemon=True)
+        self.lock = threading.RLock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def is_tty(self) -> bool:
+        return hasattr(self.stream, "isatty") and self.stream.isatty()
 
-    def start(self):
+    def start(self) -> bool:
+        # Without a terminal the indicator stays inert and the regular log is the only output.
+        if self.run or not self.is_tty():
+            return self.run
         self.run = True
-        self.spinner.done = False  # Reset the done attribute
-        if not self.process_started:
-            self._process.start()
-            self.process_started = True
-        else:
-            self.parent_conn.send("start")
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.next, name="TDTK-indicator", daemon=True)
+        self.thread.start()
+        return True
 
     def stop(self):
-        self.spinner.done = True
-        self.spinner.stop()
+        if not self.run:
+            return
         self.run = False
-        self.parent_conn.send("stop")
+        self.stop_event.set()
+        self.thread.join()
+        with self.lock:
+            self.stream.write(self.erase())
+            self.stream.flush()
+            self.devices.clear()
+
+    def update(self, serial: str, test: Optional[str] = None, iteration: Optional[int] = None):
+        if not self.run:
+            return
+        with self.lock:
+            device = self.devices.setdefault(serial, DeviceProgress(serial))
+            if test is not None and test != device.test:
+                device.test = test
+                device.started = time.monotonic()
+            if iteration is not None:
+                device.iteration = iteration
+                device.started = time.monotonic()
+
+    def add_push(self, serial: str, size: int, seconds: float):
+        if not self.run:
+            return
+        with self.lock:
+            device = self.devices.setdefault(serial, DeviceProgress(serial))
+            device.pushed_bytes += size
+            device.push_seconds += seconds
+
+    def finish(self, serial: str):
+        with self.lock:
+            self.devices.pop(serial, None)
+
+    def erase(self) -> str:
+        erase = f"\033[{self.drawn}F\033[J" if self.drawn else ""
+        self.drawn = 0
+        return erase
+
+    def render(self) -> str:
+        if not self.run or not self.devices:
+            return ""
+        width = shutil.get_terminal_size().columns - 1
+        now = time.monotonic()
+        lines = []
+        for index, device in enumerate(sorted(self.devices.values(), key=lambda device: device.serial or "")):
+            elapsed = int(now - device.started)
+            phase = self.phases[(self.frame + index) % len(self.phases)]
+            line = f"{phase} {device.serial}  {device.test or 'idle'}"
+            if device.iteration:
+                line += f"  #{device.iteration}"
+            line += f"  {elapsed // 60:02d}:{elapsed % 60:02d}"
+            throughput = device.throughput()
+            if throughput:
+                line += f"  push {throughput / (1 << 20):.1f} MB/s"
+            lines.append(line[:width] + "\n")
+        self.drawn = len(lines)
+        return "".join(lines)
+
+    def wrap(self, text: str) -> str:
+        # Called with self.lock held by whoever writes to the stream, keeps the block below any new output.
+        return f"{self.erase()}{text}{self.render()}"
+
+    def next(self):
+        while not self.stop_event.wait(self.interval):
+            with self.lock:
+                self.frame += 1
+                self.stream.write(self.wrap(""))
+                self.stream.flush()
 
-    def next(self, conn):
-        while self.run:
-            time.sleep(0.1)  # Adjust the sleep time based on your needs
-            if not self.spinner.done:
-                self.spinner.next()
-            if conn.poll():  # Check if there's a message from the parent process
-                message = conn.recv()
-                if message == "stop":
-                    break
-                elif message == "start":
-                    self.process_started = True
+indicator = Indicator()
@@ -1,40 +1,109 @@
-from TDTK.core.logger import log
+import io
+import threading
+import pytest
+from TDTK.core.logger import LogColors, Logger
 
-# Tests that the function logs a message with no type specified.  
+@pytest.fixture
+def logger():
+    logger = Logger(None)
+    logger.close()  # Earlier tests may have left a writer running or a device bound to this thread.
+    stream, overlay, debug = logger.stream, logger.overlay, logger.debug
+    logger.set_stream(None)
+    logger.set_overlay(None)
+    logger.bind_device(None)
+    logger.debug = False
+    yield logger
+    logger.close()
+    logger.set_stream(stream)
+    logger.set_overlay(overlay)
+    logger.debug = debug
+
+def plain(message):
+    return f"{LogColors.INFO}{message}{LogColors.END}\n"
+
+class Strict:
+    # Fails the test if it is ever rendered.
+    def __str__(self):
+        raise AssertionError("formatted a message that was never printed")
+
+# Tests that the function logs a message with no type specified.
 class Tests:
-    def test_log_no_type(self, capsys):
+    def test_log_no_type(self, logger, capsys):
         message = "This is a test message"
-        log(message)
+        logger.log(message)
         # Assert that the message was printed with no type and no indentation
-        assert f"{message}\n" == capsys.readouterr().out
+        assert plain(message) == capsys.readouterr().out
 
-    def test_log_valid_type(self, capsys):
+    def test_log_valid_type(self, logger, capsys):
         message = "This is a test message"
-        log(message, type="result")
+        logger.log(message, type="result")
         # Assert that the message was printed with the correct type and indentation
-        assert f"  - {message}\n" in capsys.readouterr().out
+        assert f"  - {message}{LogColors.END}\n" in capsys.readouterr().out
 
-    def test_log_invalid_type(self, capsys):
+    def test_log_invalid_type(self, logger, capsys):
         message = "This is a test message"
-        log(message, type="invalid")
+        logger.log(message, type="invalid")
         # Assert that the message was printed with no type and no indentation
-        assert f"{message}\n" == capsys.readouterr().out
+        assert capsys.readouterr().out.endswith(plain(message))
 
-    def test_log_non_string_type(self, capsys):
+    def test_log_non_string_type(self, logger, capsys):
         message = "This is a test message"
-        log(message, type=str(123))
+        logger.log(message, type=str(123))
         # Assert that the message was printed with no type and no indentation
-        assert f"{message}\n" == capsys.readouterr().out
+        assert capsys.readouterr().out.endswith(plain(message))
 
-    def test_log_large_message(self, capsys):
+    def test_log_large_message(self, logger, capsys):
         message = "a" * 1000
-        log(message, type="result")
+        logger.log(message, type="result")
         # Assert that the message was printed with the correct type and indentation
-        assert f"  - {message}\n" in capsys.readouterr().out
+        assert f"  - {message}{LogColors.END}\n" in capsys.readouterr().out
 
-    def test_log_empty_string_type(self, capsys):
+    def test_log_empty_string_type(self, logger, capsys):
         message = "This is a test message"
-        log(message, type="")
+        logger.log(message, type="")
         # Assert that the message was printed with no type and no indentation
-        assert f"{message}\n" == capsys.readouterr().out
+        assert plain(message) == capsys.readouterr().out
+
+    # Tests that debug arguments are only %-formatted once debug output is enabled.
+    def test_lazy_debug_args(self, logger, capsys):
+        logger.log("Skipped %s", "debug", Strict())
+        assert capsys.readouterr().out == ""
+        logger.debug = True
+        logger.log("Printed %s of %d", "debug", "one", 2)
+        assert "DEBUG: Printed one of 2" in capsys.readouterr().out
+
+    # Tests that lines logged from many threads all reach the terminal and the log file, in order per thread.
+    def test_writer_thread(self, logger, tmp_path):
+        output = io.StringIO()
+        logger.set_stream(output)
+        logger.open(tmp_path / "run.log")
+        writer = logger.writer
+        logger.open(tmp_path / "run.log")
+        assert logger.writer is writer
+
+        def log_lines(thread):
+            for line in range(500):
+                logger.log("thread %s line %s", "plain", thread, line)
+
+        threads = [threading.Thread(target=log_lines, args=(thread,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logger.close()
+        assert not writer.is_alive()
+        lines = (tmp_path / "run.log").read_text().splitlines()
+        assert len(lines) == 2000
+        assert [line for line in lines if line.startswith("thread 3 ")] == [f"thread 3 line {line}" for line in range(500)]
+        assert output.getvalue().count(LogColors.END) == 2000
 
+    # Tests that a full queue makes the logging thread wait instead of dropping the line.
+    def test_writer_overflow(self, logger):
+        output = io.StringIO()
+        logger.set_stream(output)
+        logger.open()
+        logger.writer.queue.maxsize = 1
+        for line in range(200):
+            logger.log("line %s", "plain", line)
+        logger.close()
+        assert output.getvalue().count(LogColors.END) == 200
@@ -1,6 +1,12 @@
 # Logger for TDTK
+import atexit
+import contextlib
+import queue
+import sys
+import threading
 from datetime import datetime
 from time import time
+from typing import Optional
 
 class LogColors:
     INFO = "\033[96m"
@@ -28,6 +34,62 @@ class LogTypes:
     def get(self, type, fallback):
         return getattr(self, type, fallback)
 
+    def compile(self) -> dict:
+        # Every type is rendered once into (colored head, colored tail, plain head, plain tail).
+        templates = {}
+        for name, log_type in vars(LogTypes).items():
+            if not isinstance(log_type, dict):
+                continue
+            indent = "  " * log_type["indent"]
+            prefix = log_type.get("prefix", "")
+            suffix = log_type.get("suffix", "")
+            templates[name] = (f"{log_type['color']}{indent}{prefix}", f"{suffix}{LogColors.END}\n",
+                               f"{indent}{prefix}", f"{suffix}\n")
+        return templates
+
+class LogWriter(threading.Thread):
+    # Batches lines from a bounded queue so logging threads do not wait on the terminal or the log file.
+    # Once the writer falls a full queue behind they do wait rather than lose lines, overflows counts how often.
+    def __init__(self, write, log_file: Optional[str] = None, max_queue: int = 4096, max_batch: int = 256):
+        super().__init__(name="TDTK-log-writer", daemon=True)
+        self.write = write
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.max_batch = max_batch
+        self.overflows = 0
+        self.file = open(log_file, "a") if log_file else None
+
+    def put(self, line: str, plain: str):
+        try:
+            self.queue.put_nowait((line, plain))
+        except queue.Full:
+            self.overflows += 1
+            self.queue.put((line, plain))
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = [item for item in batch if item is not None]
+            if lines:
+                self.write("".join(line for line, _ in lines))
+                if self.file:
+                    self.file.write("".join(plain for _, plain in lines))
+                    self.file.flush()
+            for _ in batch:
+                self.queue.task_done()
+            if None in batch:
+                break
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        if self.file:
+            self.file.close()
+
 class Logger:
     _instance = None
     
@@ -37,35 +99,124 @@ class Logger:
         return cls._instance
     
     def __init__(self, caller) -> None:
+        # Modules grab the singleton with Logger(None) at import, which must not undo the runner's setup.
+        if caller is None and getattr(self, "initialized", False):
+            return
+        self.initialized = True
         self.ratelimit_threshold = 2
         self.ratelimit_last_log_time = 0
         self.types = LogTypes()
+        self.templates = self.types.compile()
+        self.fallback = self.templates["plain"]
+        if not hasattr(self, "context"):
+            self.context = threading.local()
+        if not hasattr(self, "writer"):
+            self.writer = None
+            self.overlay = None
+            self.stream = None
+            atexit.register(self.close)
         self.caller = caller
         if hasattr(caller, "debug"):
             self.debug = caller.debug
         else:
             self.debug = False
-    
-    def log(self, message: str, type: str = ""):
-        if not self.debug == True and type == "debug":
+
+    def enabled(self, type: str) -> bool:
+        return self.debug == True or type != "debug"
+
+    def log(self, message: str, type: str = "", *args):
+        # Arguments are %-formatted only once the message is known to be printed.
+        if type == "debug" and not self.debug == True:
             return
-        log_type = self.types.get(type, {"prefix": "", "indent": 0, "color": LogColors.INFO, "found": False})
-        if not log_type.get("found", True):
-            self.log(f'Log Type for message: "{message}" was not defined.', type="failure")
+        if args:
+            message = message % args
+        template = self.templates.get(type)
+        if template is None:
+            template = self.fallback
+            if type:
+                self.log(f'Log Type for message: "{message}" was not defined.', type="failure")
         if type == "ratelimited":
             current_time = time()
             if current_time - self.ratelimit_last_log_time < 1 / self.ratelimit_threshold:
                 return
             self.ratelimit_last_log_time = current_time
 
-        indent = "  " * log_type["indent"]
-        color = log_type["color"]
-        prefix = log_type.get("prefix", "")
-        suffix = log_type.get("suffix", "")
-        print(f"{color}{indent}{prefix}{message}{suffix}{LogColors.END}")
+        device = getattr(self.context, "device", None)
+        if device:
+            message = f"[{device}] {message}"
+        head, tail, plain_head, plain_tail = template
+        buffer = getattr(self.context, "buffer", None)
+        if buffer is not None:
+            buffer.append((f"{head}{message}{tail}", f"{plain_head}{message}{plain_tail}"))
+        elif self.writer:
+            self.writer.put(f"{head}{message}{tail}", f"{plain_head}{message}{plain_tail}")
+        else:
+            self.write(f"{head}{message}{tail}")
+
+    @contextlib.contextmanager
+    def capture(self):
+        # Holds back everything the current thread logs, emit() prints it later in one piece.
+        buffer = []
+        self.context.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self.context.buffer = None
+
+    def emit(self, lines: list[tuple[str, str]]):
+        if self.writer:
+            for line, plain in lines:
+                self.writer.put(line, plain)
+        elif lines:
+            self.write("".join(line for line, _ in lines))
+
+    def write(self, text: str):
+        stream = self.stream or sys.stdout
+        overlay = self.overlay
+        if overlay:
+            # A live display below the log is erased and redrawn around every write.
+            with overlay.lock:
+                stream.write(overlay.wrap(text))
+                stream.flush()
+        else:
+            stream.write(text)
+            stream.flush()
+
+    def set_stream(self, stream):
+        self.stream = stream
+
+    def set_overlay(self, overlay):
+        self.overlay = overlay
+
+    def open(self, log_file: Optional[str] = None):
+        if self.writer:
+            return
+        self.writer = LogWriter(self.write, log_file)
+        self.writer.start()
+
+    def close(self):
+        writer, self.writer = self.writer, None
+        if writer:
+            writer.close()
+            if writer.overflows:
+                self.log("Logging waited on a full writer queue %s times", "debug", writer.overflows)
+
+    def bind_device(self, serial: str):
+        # Tag every message logged from the current thread with the device serial.
+        self.context.device = serial
 
-    def log_summary(self, total_tests: int, passed: int, failed: int, errors: int):
+    def log_summary(self, total_tests: int, passed: int, failed: int, errors: int, devices: dict = None):
         self.log("Test Execution Summary:", type="summarySpaced")
+        if devices and len(devices) > 1:
+            for serial, counts in devices.items():
+                self.log(f"Device {serial}:", type="subsection")
+                self.log(f"Total parsed tests: {counts['total_tests']}", type="result")
+                self.log(f"Passed: {counts['tests_passed']}", type="result")
+                if counts["tests_failed"] > 0:
+                    self.log(f"Failed: {counts['tests_failed']}", type="failure")
+                if counts["errors"] > 0:
+                    self.log(f"Errors: {counts['errors']}", type="failure")
+            self.log("All devices:", type="subsection")
         self.log(f"Total parsed tests: {total_tests}", type="result")
         self.log(f"Passed: {passed}", type="result")
         if failed > 0:
@@ -79,4 +230,7 @@ class Logger:
             self.log(f'Test Plan: {self.caller.test_plan}', type="plain")
         if hasattr(self.caller, "device"):
             self.log(f'Device: {self.caller.device.serial}', type="plain")
+        elif getattr(self.caller, "sessions", None):
+            serials = [session.serial for session in self.caller.sessions if session.device]
+            self.log(f'Device{"s" if len(serials) > 1 else ""}: {", ".join(serials)}', type="plain")
         self.log(f'Date: {datetime.today().strftime("%b %d, %Y")}', type="plain")
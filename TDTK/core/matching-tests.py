@@ -0,0 +1,18 @@
+from TDTK.core.matching import Matcher, is_valid_match
+
+class Tests:
+    # Tests plain regex matches and numeric predicates on the first group.
+    def test_feed(self):
+        assert Matcher({"regex": "Boot completed"}).feed("I/boot: Boot completed in 10s")
+        matcher = Matcher({"regex": "Time: ([0-9.]+)", "predicate": "< 2.5"})
+        assert matcher.feed("Time: 1.234")
+        assert not matcher.feed("Time: 3.0")
+        assert not matcher.feed("Running")
+
+    # Tests that malformed match definitions are rejected when the module is indexed.
+    def test_is_valid_match(self):
+        assert is_valid_match({"regex": "x", "predicate": ">= -1e3", "max_lines": 10})
+        assert not is_valid_match({"regex": "("})
+        assert not is_valid_match({"regex": "x", "predicate": "about 3"})
+        assert not is_valid_match({"regex": "x", "max_lines": 0})
+        assert not is_valid_match("x")
@@ -0,0 +1,49 @@
+import operator
+import re
+from collections import deque
+from typing import Optional
+
+operators = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge, "==": operator.eq, "!=": operator.ne}
+predicate_pattern = re.compile(r"^\s*(<=|>=|==|!=|<|>)\s*(-?[0-9]+(?:\.[0-9]*)?(?:[eE][-+]?[0-9]+)?)\s*$")
+
+class Matcher:
+    # Decides line by line whether a streamed command has produced what the submodule waits for.
+    def __init__(self, definition: dict):
+        self.pattern = re.compile(definition["regex"])
+        predicate = predicate_pattern.match(definition["predicate"]) if definition.get("predicate") else None
+        self.compare = operators[predicate.group(1)] if predicate else None
+        self.threshold = float(predicate.group(2)) if predicate else None
+        self.max_lines = definition.get("max_lines", 200)
+        self.max_line_bytes = definition.get("max_line_bytes", 65536)
+
+    def feed(self, line: str) -> bool:
+        match = self.pattern.search(line)
+        if not match:
+            return False
+        if self.compare is None:
+            return True
+        try:
+            value = float(match.group(1) if match.groups() else match.group(0))
+        except ValueError:
+            return False
+        return self.compare(value, self.threshold)
+
+    def buffer(self) -> deque:
+        # Only the tail of a verbose command is kept around for the log and metric extraction.
+        return deque(maxlen=self.max_lines)
+
+def is_valid_match(definition) -> bool:
+    if not isinstance(definition, dict) or not isinstance(definition.get("regex"), str):
+        return False
+    try:
+        re.compile(definition["regex"])
+    except re.error:
+        return False
+    if definition.get("predicate") is not None and not (
+        isinstance(definition["predicate"], str) and predicate_pattern.match(definition["predicate"])
+    ):
+        return False
+    return all(isinstance(definition.get(key, 1), int) and definition.get(key, 1) > 0 for key in ("max_lines", "max_line_bytes"))
+
+def compile_match(definition: Optional[dict]) -> Optional[Matcher]:
+    return Matcher(definition) if definition else None
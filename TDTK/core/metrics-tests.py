@@ -0,0 +1,24 @@
+import pytest
+from TDTK.core.metrics import compile_metrics, extract_metrics, is_valid_metrics, summarize
+
+class Tests:
+    # Tests that declared metrics are pulled out of hackbench style output.
+    def test_extract_metrics(self):
+        metrics = compile_metrics({"time": {"regex": "Time: ([0-9.]+)", "unit": "s"}, "missing": {"regex": "Nope: (\\d+)"}})
+        assert extract_metrics(metrics, "Running in process mode\nTime: 1.234\n") == {"time": 1.234}
+
+    # Tests that malformed metric definitions are rejected.
+    def test_invalid_metrics(self):
+        assert is_valid_metrics({"time": {"regex": "Time: ([0-9.]+)"}})
+        assert not is_valid_metrics({"time": "Time: ([0-9.]+)"})
+        assert not is_valid_metrics({"time": {"regex": "Time: ([0-9.]+"}})
+
+    # Tests the summary statistics against hand computed values.
+    def test_summarize(self):
+        stats = summarize([4.0, 1.0, 3.0, 2.0, 5.0])
+        assert stats["min"] == 1.0
+        assert stats["mean"] == 3.0
+        assert stats["median"] == 3.0
+        assert stats["p95"] == pytest.approx(4.8)
+        assert stats["stddev"] == pytest.approx(1.5811, abs=1e-4)
+        assert summarize([2.0])["stddev"] == 0.0
@@ -0,0 +1,102 @@
+import math
+import re
+import statistics
+import threading
+from typing import Optional
+from TDTK.core.logger import Logger
+
+logger = Logger(None)
+
+class Metric:
+    def __init__(self, name: str, definition: dict):
+        self.name = name
+        self.pattern = re.compile(definition["regex"], re.MULTILINE)
+        self.unit = definition.get("unit", "")
+        self.scale = definition.get("scale", 1)
+        self.better = definition.get("better", "lower")
+
+    def extract(self, output: str) -> Optional[float]:
+        match = self.pattern.search(output or "")
+        if not match:
+            return None
+        try:
+            return float(match.group(1) if match.groups() else match.group(0)) * self.scale
+        except ValueError:
+            return None
+
+def is_valid_metrics(metrics) -> bool:
+    if not isinstance(metrics, dict):
+        return False
+    for definition in metrics.values():
+        if not isinstance(definition, dict) or not isinstance(definition.get("regex"), str):
+            return False
+        if definition.get("better", "lower") not in ("lower", "higher"):
+            return False
+        try:
+            re.compile(definition["regex"])
+        except re.error:
+            return False
+    return True
+
+def compile_metrics(metrics: Optional[dict]) -> list[Metric]:
+    return [Metric(name, definition) for name, definition in (metrics or {}).items()]
+
+def extract_metrics(metrics: list[Metric], output: str) -> dict[str, float]:
+    values = {}
+    for metric in metrics:
+        value = metric.extract(output)
+        if value is None:
+            logger.log('Metric "%s" was not found in the command output', "debug", metric.name)
+        else:
+            values[metric.name] = value
+    return values
+
+def percentile(samples: list[float], fraction: float) -> float:
+    # Linear interpolation between closest ranks, the same method as numpy's default.
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * fraction
+    lower, upper = math.floor(position), math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    return {
+        "count": len(samples),
+        "min": min(samples),
+        "mean": statistics.fmean(samples),
+        "median": statistics.median(samples),
+        "p95": percentile(samples, 0.95),
+        "stddev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+    }
+
+class MetricCollector:
+    def __init__(self):
+        self.samples = {}
+        self.units = {}
+        self.lock = threading.Lock()
+
+    def add(self, serial: Optional[str], test_name: str, metrics: list[Metric], values: dict[str, float]):
+        with self.lock:
+            for metric in metrics:
+                self.units[(test_name, metric.name)] = metric.unit
+                if metric.name in values:
+                    self.samples.setdefault((test_name, serial), {}).setdefault(metric.name, []).append(values[metric.name])
+
+    def summaries(self) -> dict:
+        return {
+            key: {name: summarize(samples) for name, samples in metrics.items()}
+            for key, metrics in self.samples.items()
+        }
+
+    def log_summary(self):
+        if not self.samples:
+            return
+        logger.log("Metrics Summary:", type="summarySpaced")
+        for (test_name, serial), metrics in sorted(self.summaries().items(), key=lambda item: (item[0][0], item[0][1] or "")):
+            logger.log(f'{test_name}{f" on {serial}" if serial else ""}:', type="subsection")
+            for name, stats in metrics.items():
+                unit = self.units.get((test_name, name), "")
+                logger.log(
+                    f"{name} ({stats['count']} samples): min {stats['min']:.4g}{unit}, mean {stats['mean']:.4g}{unit}, "
+                    f"median {stats['median']:.4g}{unit}, p95 {stats['p95']:.4g}{unit}, stddev {stats['stddev']:.4g}{unit}",
+                    type="result"
+                )
@@ -0,0 +1,54 @@
+import asyncio
+import json
+from TDTK.core.adb import ADB
+from TDTK.core.fake_adb import FakeAdbDevice
+from TDTK.core.modules import Modules, SubModule
+
+def write_module(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data))
+
+class Tests:
+    # Tests that the index lists modules without parsing them and that definitions load on lookup.
+    def test_catalog_is_lazy(self, tmp_path, mocker):
+        write_module(tmp_path / "modules" / "device.json", {"wake": {"command": "input keyevent KEYCODE_WAKEUP", "expected": 0}})
+        write_module(tmp_path / "modules" / "cli" / "bench.json", {"run": {"command": "bench", "expected": ""}, "broken": {}})
+        Modules(tmp_path / "modules", tmp_path / "catalog.json").load_modules()
+
+        modules = Modules(tmp_path / "modules", tmp_path / "catalog.json")
+        load_module = mocker.spy(modules, "load_module")
+        assert modules.list_modules() == {"cli.bench": ["run"], "device": ["wake"]}
+        assert load_module.call_count == 0
+        assert modules.available_modules.get("device").get_submodule("wake").expected == 0
+        assert modules.available_modules.get("missing") is None
+        assert load_module.call_count == 1
+
+    # Tests that only changed files are parsed again when the index is refreshed.
+    def test_catalog_rebuilds_changed_files(self, tmp_path, mocker):
+        write_module(tmp_path / "modules" / "device.json", {"wake": {"command": "wake", "expected": 0}})
+        write_module(tmp_path / "modules" / "wifi.json", {"enable": {"command": "svc wifi enable", "expected": 0}})
+        Modules(tmp_path / "modules", tmp_path / "catalog.json").load_modules()
+
+        write_module(tmp_path / "modules" / "wifi.json", {"disable": {"command": "svc wifi disable", "expected": 0}})
+        modules = Modules(tmp_path / "modules", tmp_path / "catalog.json")
+        index_module = mocker.spy(modules, "index_module")
+        assert modules.list_modules() == {"device": ["wake"], "wifi": ["disable"]}
+        assert [call.args[0].name for call in index_module.call_args_list] == ["wifi.json"]
+
+    # Tests that pushes work from inside a running event loop and that one failed push fails the submodule.
+    def test_push_files(self, tmp_path, mocker):
+        mocker.patch("TDTK.core.modules.thisPath", tmp_path)
+        (tmp_path / "files").mkdir()
+        for name in ("a.bin", "b.bin"):
+            (tmp_path / "files" / name).write_bytes(name.encode())
+        adb = ADB("push-files")
+        adb.device = FakeAdbDevice("push-files")
+        submodule = SubModule("bench", {"command": "bench", "expected": 0, "files": ["a.bin", "b.bin"]})
+
+        async def from_loop():
+            return submodule.push_files(adb)
+
+        assert asyncio.run(from_loop())
+        assert adb.device.counts["push"] == 2
+        mocker.patch.object(adb, "push", side_effect=lambda file, dest=None: 0 if file.name == "b.bin" else 1)
+        assert not submodule.push_files(adb)
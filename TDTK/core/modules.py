@@ -1,14 +1,23 @@
+import hashlib
 import json
 import os
+import threading
 import time
+from collections.abc import Mapping
 from pathlib import Path
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 from TDTK.core.logger import Logger
-from TDTK.core.adb import ADB
+from TDTK.core.cache import cache_dir, read_json, write_json
+from TDTK.core.metrics import compile_metrics, is_valid_metrics
+from TDTK.core.matching import compile_match, is_valid_match
+from TDTK.core.tracing import tracer
+from TDTK.core.deadline import remaining
 from enum import Enum
 
+if TYPE_CHECKING:
+    from TDTK.core.adb import ADB
+
 logger = Logger(None)
-adb = ADB()
 thisPath = Path(__file__).parent
 
 class ValidationResult(Enum):
@@ -18,6 +27,9 @@ class ValidationResult(Enum):
     MISSING_EXPECTED_OUTPUT = 3
     INVALID_FILE_FIELD = 4
     INVALID_DEPENDS_FIELD = 5
+    INVALID_METRICS_FIELD = 6
+    INVALID_RESOURCES_FIELD = 7
+    INVALID_MATCH_FIELD = 8
 
 def is_valid_module(submodule):
     if not isinstance(submodule, dict):
@@ -30,59 +42,158 @@ def is_valid_module(submodule):
         return ValidationResult.INVALID_FILE_FIELD
     if submodule.get("depends") and not isinstance(submodule.get("depends"), str):
         return ValidationResult.INVALID_DEPENDS_FIELD
+    if submodule.get("metrics") is not None and not is_valid_metrics(submodule.get("metrics")):
+        return ValidationResult.INVALID_METRICS_FIELD
+    resources = submodule.get("resources")
+    if resources is not None and (not isinstance(resources, list) or not all(isinstance(resource, str) for resource in resources)):
+        return ValidationResult.INVALID_RESOURCES_FIELD
+    if submodule.get("match") is not None and not is_valid_match(submodule.get("match")):
+        return ValidationResult.INVALID_MATCH_FIELD
     return ValidationResult.VALID
 
+validation_messages = {
+    ValidationResult.NOT_DICT: 'Method "{key}" in {path} is not a dict, it has been skipped!',
+    ValidationResult.MISSING_COMMAND_OR_TYPE: 'Method "{key}" in {path} is missing a command or type, it has been skipped!',
+    ValidationResult.MISSING_EXPECTED_OUTPUT: 'Method "{key}" in {path} is missing an expected output, it has been skipped!',
+    ValidationResult.INVALID_FILE_FIELD: 'Invalid "file" field in method "{key}" of {path}, it has been skipped!',
+    ValidationResult.INVALID_DEPENDS_FIELD: 'Invalid "depends" field in method "{key}" of {path}, it has been skipped!',
+    ValidationResult.INVALID_METRICS_FIELD: 'Invalid "metrics" field in method "{key}" of {path}, it has been skipped!',
+    ValidationResult.INVALID_RESOURCES_FIELD: 'Invalid "resources" field in method "{key}" of {path}, it has been skipped!',
+    ValidationResult.INVALID_MATCH_FIELD: 'Invalid "match" field in method "{key}" of {path}, it has been skipped!',
+}
+
+class ModuleCatalog(Mapping):
+    # Read-only view over the index, module definitions are only parsed when looked up.
+    def __init__(self, modules):
+        self.modules = modules
+
+    def __getitem__(self, container: str):
+        module = self.modules.load_container(container)
+        if module is None:
+            raise KeyError(container)
+        return module
+
+    def __iter__(self):
+        return iter(self.modules.containers())
+
+    def __len__(self):
+        return len(self.modules.containers())
+
+    def __repr__(self):
+        return f"ModuleCatalog({list(self)})"
+
 class Modules:
-    def __init__(self):
-        self.available_modules = {}
-        self.load_modules()
+    index_version = 4
 
-    def load_module(self, filepath: Path):
+    def __init__(self, dir: Path = None, index_path: Path = None):
+        self.dir = dir or thisPath / "modules"
+        self.index_path = index_path or cache_dir() / "catalog.json"
+        self.index = None
+        self.loaded = {}
+        self.container_index = None
+        self.lock = threading.RLock()
+        self.available_modules = ModuleCatalog(self)
+
+    def container_name(self, filepath: Path) -> str:
         module_name = filepath.stem
-        with open(filepath) as entry:
-            submodules = {}
-            try:
-                module_data = json.load(entry)
-            except:
-                logger.log(f'Failed to load {filepath}, it has been skipped!', 'plainFailure')
-                return
-            for key in module_data:
-                submodule = module_data[key]
-                result = is_valid_module(submodule)
-                case = {
-                    ValidationResult.VALID: lambda: (
-                        logger.log(f'Method "{key}" in {os.path.relpath(filepath)} has been validated!', "debug"),
-                        submodules.update({key: SubModule(module_name, submodule)})
-                    ),
-                    ValidationResult.NOT_DICT: lambda: logger.log(f'Method "{key}" in {os.path.relpath(filepath)} is not a dict, it has been skipped!', "plainFailure"),
-                    ValidationResult.MISSING_COMMAND_OR_TYPE: lambda: logger.log(f'Method "{key}" in {os.path.relpath(filepath)} is missing a command or type, it has been skipped!', "plainFailure"),
-                    ValidationResult.MISSING_EXPECTED_OUTPUT: lambda: logger.log(f'Method "{key}" in {os.path.relpath(filepath)} is missing an expected output, it has been skipped!', "plainFailure"),
-                    ValidationResult.INVALID_FILE_FIELD: lambda: logger.log(f'Invalid "file" field in method "{key}" of {os.path.relpath(filepath)}, it has been skipped!', "plainFailure"),
-                    ValidationResult.INVALID_DEPENDS_FIELD: lambda: logger.log(f'Invalid "depends" field in method "{key}" of {os.path.relpath(filepath)}, it has been skipped!', "plainFailure")
-                }
-                result_func = case.get(result, lambda: None)
-                result_func()
-            container = filepath.stem if filepath.parent.stem.endswith('modules') else filepath.parent.stem + '.' + module_name
-            if submodules:
-                self.available_modules[container] = Module(self, module_name, submodules)
+        return module_name if filepath.parent.stem.endswith('modules') else filepath.parent.stem + '.' + module_name
+
+    def index_module(self, filepath: Path, stat: os.stat_result, digest: str) -> dict:
+        entry = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest,
+                 "container": self.container_name(filepath), "submodules": [], "problems": []}
+        try:
+            module_data = json.loads(filepath.read_bytes())
+        except ValueError:
+            entry["problems"].append(f'Failed to load {filepath}, it has been skipped!')
+            return entry
+        for key, submodule in module_data.items():
+            result = is_valid_module(submodule)
+            if result == ValidationResult.VALID:
+                logger.log('Method "%s" in %s has been validated!', "debug", key, os.path.relpath(filepath))
+                entry["submodules"].append(key)
+            else:
+                entry["problems"].append(validation_messages[result].format(key=key, path=os.path.relpath(filepath)))
+        return entry
 
     def load_modules(self, dir: Path = None):
-        if not dir:
-            dir = thisPath / "modules"
-        if not dir.is_dir():
-            return
-        for entry in dir.iterdir():
-            if entry.is_file() and entry.name.endswith('.json'):
-                logger.log(f'Scanning file {entry.name} for modules.', "debug")
-                self.load_module(entry)
-            elif entry.is_dir():
-                self.load_modules(entry)
-        logger.log(f"Available modules, {self.available_modules}", "debug")
-
-    def run(self, module_name: str, submodule_name: str, parameters: Optional[list[str]]):
+        # Only files whose mtime and size changed are read, and only reparsed when their hash changed too.
+        dir = dir or self.dir
+        with self.lock:
+            cached = read_json(self.index_path, {})
+            if cached.get("version") != self.index_version or cached.get("root") != str(dir):
+                cached = {}
+            files = cached.get("files", {})
+            index, changed = {}, not cached
+            for filepath in sorted(dir.rglob("*.json")) if dir.is_dir() else []:
+                key = str(filepath.relative_to(dir))
+                stat = filepath.stat()
+                entry = files.get(key)
+                if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                    index[key] = entry
+                    continue
+                digest = hashlib.sha256(filepath.read_bytes()).hexdigest()
+                if entry and entry["sha256"] == digest:
+                    entry = {**entry, "mtime": stat.st_mtime_ns}
+                else:
+                    logger.log('Scanning file %s for modules.', "debug", filepath.name)
+                    entry = self.index_module(filepath, stat, digest)
+                index[key] = entry
+                changed = True
+            changed = changed or set(index) != set(files)
+            if changed:
+                try:
+                    write_json(self.index_path, {"version": self.index_version, "root": str(dir), "files": index})
+                except OSError:
+                    logger.log("Failed to write the module index to %s", "debug", self.index_path)
+            if self.index is not None:
+                # Containers parsed from a file that changed since are parsed again on their next lookup.
+                for key, entry in self.index.items():
+                    if index.get(key, {}).get("sha256") != entry["sha256"]:
+                        self.loaded.pop(entry["container"], None)
+            self.index = index
+            self.container_index = None
+            for entry in index.values():
+                for problem in entry["problems"]:
+                    logger.log(problem, "plainFailure")
+        logger.log("Available modules, %s", "debug", self.available_modules)
+
+    def containers(self) -> dict[str, tuple[str, dict]]:
+        if self.index is None:
+            self.load_modules()
+        # Built once per index, every catalog lookup goes through it.
+        if self.container_index is None:
+            self.container_index = {entry["container"]: (key, entry) for key, entry in self.index.items() if entry["submodules"]}
+        return self.container_index
+
+    def load_container(self, container: str):
+        with self.lock:
+            if container in self.loaded:
+                return self.loaded[container]
+            found = self.containers().get(container)
+            self.loaded[container] = self.load_module(self.dir / found[0], found[1]["submodules"]) if found else None
+            return self.loaded[container]
+
+    def load_module(self, filepath: Path, names: Optional[list[str]] = None):
+        module_name = filepath.stem
+        try:
+            with open(filepath) as entry:
+                module_data = json.load(entry)
+        except (OSError, ValueError):
+            logger.log(f'Failed to load {filepath}, it has been skipped!', 'plainFailure')
+            return None
+        submodules = {
+            key: SubModule(module_name, submodule) for key, submodule in module_data.items()
+            if (names is None or key in names) and is_valid_module(submodule) == ValidationResult.VALID
+        }
+        return Module(self, module_name, submodules) if submodules else None
+
+    def list_modules(self) -> dict[str, list[str]]:
+        return {container: entry["submodules"] for container, (_, entry) in sorted(self.containers().items())}
+
+    def run(self, module_name: str, submodule_name: str, parameters: Optional[list[str]], adb: Optional["ADB"] = None):
         module = self.available_modules.get(module_name)
         if module:
-            return module.run(submodule_name, parameters)
+            return module.run(submodule_name, parameters, adb)
         else:
             logger.log(f'Module "{module_name}" not found!', "failure")
             return False
@@ -94,8 +205,16 @@ class SubModule:
         self.files = [Path(file) for file in data.get("files", [])]  # Store multiple files as a list of Paths
         self.parent_name = name
         self.repeat = data.get("repeat", 0)
+        self.volatile = data.get("volatile", False)
+        self.metrics = compile_metrics(data.get("metrics"))
+        resources = data.get("resources")
+        self.resources = frozenset(resources) if resources is not None else None  # None: may touch anything.
+        self.matcher = compile_match(data.get("match"))
 
-    def run(self, parameters: Optional[list[str]]):
+    def run(self, parameters: Optional[list[str]], adb: Optional["ADB"] = None):
+        if not adb:
+            from TDTK.core.adb import ADB
+            adb = ADB.default()
         command = getattr(self, "command", None)
         check = getattr(self, "check", None)
         expected = getattr(self, "expected", None)
@@ -103,17 +222,22 @@ class SubModule:
         command_type = getattr(self, "type", "")
         overwrite = getattr(self, "overwrite", None)
         wait = getattr(self, "wait", None)
+        command_timeout = getattr(self, "command_timeout", None)
         silent = getattr(self, "silent", True)
-        logger.log(f'''
-                   Command is "{command}",
-                   check is "{check}",
-                   expected is "{expected}",
-                   timeout is "{timeout}",
-                   wait is "{wait}",
-                   silent is "{silent}",
-                   repeat is "{self.repeat}"
-        ''', "debug")
-        if not "push" in command_type and not self.push_files():
+        logger.log('''
+                   Command is "%s",
+                   check is "%s",
+                   expected is "%s",
+                   timeout is "%s",
+                   wait is "%s",
+                   silent is "%s",
+                   repeat is "%s"
+        ''', "debug", command, check, expected, timeout, wait, silent, self.repeat)
+        # An identical build already on the device needs neither the push nor the install.
+        if adb.is_installed(command_type, self.files, overwrite):
+            logger.log(f'{self.files[0]} is already installed on the device, skipping install', "result")
+            return True
+        if not "push" in command_type and not self.push_files(adb):
             return False
         ret = adb.run(
             command=command,
@@ -125,25 +249,31 @@ class SubModule:
             files=self.files,
             overwrite=overwrite,
             silent=silent,
-            repeat=self.repeat
+            repeat=self.repeat,
+            command_timeout=command_timeout,
+            matcher=self.matcher
         )
         if wait:
             logger.log(f'Waiting {wait} seconds for completion', "plainSpaced")
-            time.sleep(wait)
+            with tracer.span("wait", seconds=wait):
+                time.sleep(remaining(wait))
         return ret
 
-    def push_files(self):
+    def push_files(self, adb: "ADB"):
+        file_paths = []
         for file in self.files:
             file_path = thisPath / "files" / file
-            if file_path.is_file():
-                logger.log(f'Pushing file {file_path} to device!', "debug")
-                ret = adb.push(file_path)
-                if not ret > 0:
-                    logger.log(f'Failed to push "{file_path}"!', 'plainFailure')
-            else:
+            if not file_path.is_file():
                 logger.log(f'This module requires a file, "{file}", which was not found, skipping!', "plainFailure")
                 return False
-        return True
+            file_paths.append(file_path)
+        if not file_paths:
+            return True
+        logger.log('Pushing files %s to device!', "debug", file_paths)
+        failed = [file_path for file_path, ret in zip(file_paths, adb.push_many(file_paths)) if not ret > 0]
+        for file_path in failed:
+            logger.log(f'Failed to push "{file_path}"!', 'plainFailure')
+        return not failed
 
 class Module:
     def __init__(self, modules, name, submodules):
@@ -151,8 +281,8 @@ class Module:
         self.modules = modules
         self.submodules = submodules
 
-    def run(self, submodule_name: str, parameters: Optional[list[str]]):
-        logger.log(f"Attempting to run {self.name}.{submodule_name}", "debug")
+    def run(self, submodule_name: str, parameters: Optional[list[str]], adb: Optional["ADB"] = None):
+        logger.log("Attempting to run %s.%s", "debug", self.name, submodule_name)
         submodule = self.get_submodule(submodule_name)
         if not submodule:
             logger.log(f'Submodule "{submodule_name}" not found!', "failure")
@@ -160,16 +290,16 @@ class Module:
         if submodule.depends:
             depends = submodule.depends.split(".")
             if len(depends) < 2: # single word in depends, external module
-                logger.log(f"{self.name}.{submodule_name} depends on {submodule.parent_name}.{submodule.depends}!", "debug")
-                ret = self.run(submodule.depends, None)
+                logger.log("%s.%s depends on %s.%s!", "debug", self.name, submodule_name, submodule.parent_name, submodule.depends)
+                ret = self.run(submodule.depends, None, adb)
                 if not ret:
                     return ret
             if len(depends) > 1: # multi words in depends, local module
-                logger.log(f"{self.name}.{submodule_name} depends on {submodule.depends}!", "debug")
-                ret = self.modules.run(depends[0], depends[1], None)
+                logger.log("%s.%s depends on %s!", "debug", self.name, submodule_name, submodule.depends)
+                ret = self.modules.run(depends[0], depends[1], None, adb)
                 if not ret:
                     return ret
-        return submodule.run(parameters)
+        return submodule.run(parameters, adb)
 
     def get_submodule(self, name: str) -> Optional[SubModule]:
         return self.submodules.get(name, None)
@@ -0,0 +1,64 @@
+import pytest
+from TDTK.core.modules import SubModule
+from TDTK.core.planner import PlanError
+
+class Tests:
+    # Tests that prerequisites run once per device and are reused by later tests.
+    def test_dependencies_are_memoized(self, make_planner, mocker):
+        planner = make_planner({
+            "device": {"wake": {}, "unlock": {"depends": "wake"}},
+            "app": {"launch": {"depends": "device.unlock"}},
+        })
+        run = mocker.patch.object(SubModule, "run", autospec=True, return_value=True)
+        adb = mocker.Mock(serial="dev1", state=mocker.Mock(boot_id="boot"))
+        assert planner.run("app.launch", None, adb)
+        assert planner.run("app.launch", None, adb)
+        assert [call.args[0].command for call in run.call_args_list] == ["wake", "unlock", "launch", "launch"]
+
+    # Tests that volatile prerequisites and reboots force prerequisites to run again.
+    def test_volatile_and_reboot(self, make_planner, mocker):
+        planner = make_planner({"wifi": {"enable": {"volatile": True}, "connect": {"depends": "enable"}},
+                                        "cli": {"push": {}, "run": {"depends": "push"}}})
+        run = mocker.patch.object(SubModule, "run", autospec=True, return_value=True)
+        adb = mocker.Mock(serial="dev1", state=mocker.Mock(boot_id="boot"))
+        planner.run("wifi.connect", ["ssid"], adb)
+        planner.run("wifi.connect", ["ssid"], adb)
+        planner.run("cli.run", None, adb)
+        adb.state.boot_id = "rebooted"
+        planner.run("cli.run", None, adb)
+        assert [call.args[0].command for call in run.call_args_list] == [
+            "enable", "connect", "enable", "connect", "push", "run", "push", "run"
+        ]
+
+    # Tests that cycles and missing targets are reported before anything runs.
+    def test_plan_problems(self, make_planner):
+        planner = make_planner({"loop": {"a": {"depends": "b"}, "b": {"depends": "a"}, "c": {"depends": "missing"}}})
+        with pytest.raises(PlanError):
+            planner.resolve("loop.a")
+        problems = planner.check([{"module": "loop.a"}, {"module": "loop.c"}])
+        assert set(problems) == {"loop.a", "loop.c"}
+
+    # Tests that a reboot since the last command is noticed before prerequisites are skipped.
+    def test_reboot_is_refreshed(self, make_planner, mocker):
+        planner = make_planner({"cli": {"push": {}, "run": {"depends": "push"}}})
+        run = mocker.patch.object(SubModule, "run", autospec=True, return_value=True)
+        adb = mocker.Mock(serial="dev1", state=mocker.Mock(boot_id="boot"))
+        boot_ids = iter(["boot", "rebooted"])
+        adb.refresh_state.side_effect = lambda: setattr(adb.state, "boot_id", next(boot_ids))
+        planner.run("cli.run", None, adb)
+        planner.run("cli.run", None, adb)
+        assert [call.args[0].command for call in run.call_args_list] == ["push", "run", "push", "run"]
+
+    # Tests that a test checks the boot id once, however many prerequisites it runs.
+    def test_one_refresh_per_test(self, make_planner, fake_adb):
+        planner = make_planner({"device": {"wake": {}, "unlock": {"depends": "wake"}, "check": {"depends": "unlock", "volatile": True}}})
+        adb = fake_adb("refresh-once")
+        refreshes = []
+        refresh_state = adb.refresh_state
+        adb.refresh_state = lambda: refreshes.append(1) or refresh_state()
+        try:
+            assert planner.run("device.check", None, adb)
+            assert planner.run("device.check", None, adb)
+        finally:
+            del adb.refresh_state
+        assert len(refreshes) == 2
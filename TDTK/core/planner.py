@@ -0,0 +1,116 @@
+import threading
+from typing import Iterable, Optional, TYPE_CHECKING
+from TDTK.core.logger import Logger
+from TDTK.core.modules import Modules, SubModule
+from TDTK.core.tracing import tracer
+
+if TYPE_CHECKING:
+    from TDTK.core.adb import ADB
+
+logger = Logger(None)
+
+class PlanError(Exception):
+    pass
+
+class Planner:
+    def __init__(self, modules: Modules):
+        self.modules = modules
+        self.order = {}
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def lookup(self, node: str) -> Optional[SubModule]:
+        module_name, _, submodule_name = node.rpartition(".")
+        module = self.modules.available_modules.get(module_name)
+        return module.get_submodule(submodule_name) if module else None
+
+    def dependency(self, node: str) -> Optional[str]:
+        submodule = self.lookup(node)
+        if not submodule or not submodule.depends:
+            return None
+        if "." in submodule.depends:
+            return submodule.depends
+        return f"{node.rpartition('.')[0]}.{submodule.depends}"
+
+    def resolve(self, node: str) -> list[str]:
+        # Prerequisites of a node in the order they have to run, the node itself excluded.
+        if node in self.order:
+            return self.order[node]
+        path = [node]
+        while dependency := self.dependency(path[-1]):
+            if dependency in path:
+                raise PlanError(f'Dependency cycle detected: {" -> ".join(path + [dependency])}')
+            if not self.lookup(dependency):
+                raise PlanError(f'"{path[-1]}" depends on "{dependency}", which was not found')
+            path.append(dependency)
+        self.order[node] = path[:0:-1]
+        return self.order[node]
+
+    def resources(self, node: str) -> Optional[frozenset]:
+        # Everything the node and its prerequisites touch, None as soon as one of them did not declare it.
+        try:
+            chain = self.resolve(node) + [node]
+        except PlanError:
+            return None
+        resources = frozenset()
+        for member in chain:
+            submodule = self.lookup(member)
+            if submodule is None or submodule.resources is None:
+                return None
+            resources |= submodule.resources
+        return resources
+
+    def check(self, tests: Iterable[dict]) -> dict[str, str]:
+        problems, seen = {}, set()
+        for test in tests:
+            node = test.get("module") if isinstance(test, dict) else None
+            if not isinstance(node, str) or node in seen:
+                continue
+            seen.add(node)
+            if not self.lookup(node):
+                continue  # Malformed entries and missing targets are reported by TestRunner.validate_test.
+            try:
+                self.resolve(node)
+            except PlanError as e:
+                problems[node] = str(e)
+        return problems
+
+    def session(self, adb: "ADB") -> set:
+        adb.refresh_state()  # The cached boot id would miss a reboot since the last command.
+        with self.lock:
+            session = self.sessions.setdefault(adb.serial, {"boot_id": None, "satisfied": set()})
+            if session["boot_id"] != adb.state.boot_id:
+                # A reboot undoes whatever the prerequisites did.
+                session["boot_id"] = adb.state.boot_id
+                session["satisfied"].clear()
+            return session["satisfied"]
+
+    def is_satisfied(self, satisfied: set, node: str) -> bool:
+        with self.lock:
+            return node in satisfied
+
+    def satisfy(self, satisfied: set, node: str) -> None:
+        if not self.lookup(node).volatile:
+            with self.lock:
+                satisfied.add(node)
+
+    def run(self, node: str, parameters: Optional[list[str]], adb: "ADB") -> bool:
+        satisfied = self.session(adb)
+        for dependency in self.resolve(node):
+            if self.is_satisfied(satisfied, dependency):
+                logger.log('Dependency "%s" of "%s" is already satisfied, skipping', "debug", dependency, node)
+                continue
+            logger.log('Running dependency "%s" of "%s"', "debug", dependency, node)
+            if self.run_node(dependency, None, adb, "dependency") is not True:
+                logger.log('Dependency "%s" of "%s" has failed!', "debug", dependency, node)
+                return False
+            self.satisfy(satisfied, dependency)
+        ret = self.run_node(node, parameters, adb, "submodule")
+        if ret is True and not parameters:
+            self.satisfy(satisfied, node)
+        return ret
+
+    def run_node(self, node: str, parameters: Optional[list[str]], adb: "ADB", kind: str) -> bool:
+        module_name, _, submodule_name = node.rpartition(".")
+        with tracer.scope(module=module_name, submodule=submodule_name), tracer.span(kind):
+            return self.lookup(node).run(parameters, adb)
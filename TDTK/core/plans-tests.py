@@ -0,0 +1,68 @@
+import json
+from argparse import Namespace
+import pytest
+from TDTK.core.modules import Modules
+from TDTK.core.planner import PlanError
+from TDTK.core.plans import TestPlan
+from TDTK.core.test_runner import TestRunner
+
+def write_plan(path, entries):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(entries))
+    return path
+
+class Tests:
+    # Tests that a matrix expands to the product of its values, named by template or by the bound values.
+    def test_matrix(self, tmp_path):
+        plan = TestPlan(write_plan(tmp_path / "plan.json", [
+            {"test_name": "Hackbench {groups}x{loops}", "module": "cli.hackbench.run",
+             "parameters": ["-g", "{groups}", "-l", "{loops}"], "matrix": {"groups": [1, 4], "loops": [100, 1000]}},
+            {"test_name": "Wi-Fi", "module": "wifi.connect", "matrix": {"ssid": ["home", "lab"], "security": ["wpa2"]}},
+        ]))
+        tests = list(plan)
+        assert [test["test_name"] for test in tests] == [
+            "Hackbench 1x100", "Hackbench 1x1000", "Hackbench 4x100", "Hackbench 4x1000",
+            "Wi-Fi [ssid=home, security=wpa2]", "Wi-Fi [ssid=lab, security=wpa2]",
+        ]
+        assert tests[1]["parameters"] == ["-g", "1", "-l", "1000"]
+        assert tests[5]["parameters"] == ["lab", "wpa2"]
+        assert all("matrix" not in test for test in tests)
+        assert list(plan) == tests  # Every iteration expands the plan again.
+
+    # Tests that includes resolve relative to the including file and are only read once the walk reaches them.
+    def test_include(self, tmp_path):
+        write_plan(tmp_path / "sweeps" / "wifi.json", [{"test_name": "Wi-Fi", "module": "wifi.connect"}])
+        plan = TestPlan(write_plan(tmp_path / "plan.json", [
+            {"test_name": "Install", "module": "app.cts.install"},
+            {"include": "sweeps/wifi.json"},
+            {"include": "missing.json"},
+        ]))
+        tests = iter(plan)
+        assert next(tests)["test_name"] == "Install"
+        assert next(tests)["test_name"] == "Wi-Fi"
+        with pytest.raises(PlanError):
+            next(tests)
+
+    # Tests that include cycles and malformed matrices are reported.
+    def test_errors(self, tmp_path):
+        write_plan(tmp_path / "a.json", [{"include": "b.json"}])
+        write_plan(tmp_path / "b.json", [{"include": "a.json"}])
+        with pytest.raises(PlanError, match="Include cycle"):
+            list(TestPlan(tmp_path / "a.json"))
+        with pytest.raises(PlanError, match="matrix"):
+            list(TestPlan(write_plan(tmp_path / "matrix.json", [{"test_name": "x", "module": "a.b", "matrix": {"n": []}}])))
+        with pytest.raises(PlanError, match="list of tests"):
+            TestPlan(write_plan(tmp_path / "object.json", {"test_name": "x"}))
+
+    # Tests that every distinct module reference is checked once no matter how many entries use it.
+    def test_checks_are_cached(self, tmp_path, mocker):
+        write_plan(tmp_path / "modules" / "bench.json", {"run": {"command": "bench", "expected": 0}})
+        runner = TestRunner(Namespace(debug=False), Modules(tmp_path / "modules", tmp_path / "catalog.json"))
+        check_module = mocker.spy(runner, "check_module")
+        tests = list(TestPlan(write_plan(tmp_path / "plan.json", [
+            {"test_name": "Bench", "module": "bench.run", "matrix": {"n": list(range(50))}},
+            {"test_name": "Missing", "module": "bench.missing", "matrix": {"n": list(range(50))}},
+        ])))
+        assert sum(1 for test in tests if runner.check_test(test)) == 50
+        assert runner.errors == 50
+        assert check_module.call_count == 2
@@ -0,0 +1,80 @@
+import itertools
+import json
+import re
+from pathlib import Path
+from typing import Iterator
+from TDTK.core.planner import PlanError
+
+placeholder = re.compile(r"\{(\w+)\}")
+
+def read_plan(path: Path) -> list:
+    try:
+        with open(path) as plan_file:
+            entries = json.load(plan_file)
+    except OSError as e:
+        raise PlanError(f"Failed to read test plan {path}: {e.strerror}")
+    except json.JSONDecodeError:
+        raise PlanError(f"Invalid test plan JSON in {path}")
+    if not isinstance(entries, list):
+        raise PlanError(f"Test plan {path} must be a list of tests")
+    return entries
+
+def substitute(value, bindings: dict):
+    if isinstance(value, str):
+        return placeholder.sub(lambda match: str(bindings[match.group(1)]) if match.group(1) in bindings else match.group(0), value)
+    if isinstance(value, list):
+        return [substitute(item, bindings) for item in value]
+    return value
+
+def is_valid_matrix(matrix) -> bool:
+    return isinstance(matrix, dict) and bool(matrix) and all(
+        re.fullmatch(r"\w+", name) and isinstance(values, list) and values for name, values in matrix.items()
+    )
+
+def expand_matrix(test: dict) -> Iterator[dict]:
+    # One entry per combination, {name} in test_name and parameters is replaced by the combination's value.
+    matrix = test["matrix"]
+    if not is_valid_matrix(matrix):
+        raise PlanError(f'Invalid "matrix" in test "{test.get("test_name")}", expected an object of non-empty value lists')
+    template = {key: value for key, value in test.items() if key != "matrix"}
+    name = template.get("test_name")
+    named = isinstance(name, str) and any(match.group(1) in matrix for match in placeholder.finditer(name))
+    for values in itertools.product(*matrix.values()):
+        bindings = dict(zip(matrix, values))
+        entry = dict(template)
+        if "parameters" in template:
+            entry["parameters"] = substitute(template["parameters"], bindings)
+        else:
+            entry["parameters"] = [str(value) for value in values]
+        if isinstance(name, str):
+            # Every combination needs its own name, durations and history are keyed by it.
+            entry["test_name"] = substitute(name, bindings) if named else \
+                f'{name} [{", ".join(f"{key}={value}" for key, value in bindings.items())}]'
+        yield entry
+
+def expand(entries: list, path: Path, stack: tuple[Path, ...]) -> Iterator:
+    for entry in entries:
+        if isinstance(entry, dict) and "include" in entry:
+            if not isinstance(entry["include"], str):
+                raise PlanError(f'Invalid "include" in test plan {path}, expected a path')
+            included = (path.parent / entry["include"]).resolve()
+            if included in stack:
+                raise PlanError(f'Include cycle detected: {" -> ".join(str(plan) for plan in stack + (included,))}')
+            yield from expand(read_plan(included), included, stack + (included,))
+        elif isinstance(entry, dict) and "matrix" in entry:
+            yield from expand_matrix(entry)
+        else:
+            yield entry
+
+class TestPlan:
+    # A plan file with its includes and matrices, expanded entry by entry every time it is iterated
+    # so a sweep of any size never sits in memory as a whole. Included files are only read once reached.
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries = read_plan(self.path)
+
+    def __iter__(self) -> Iterator:
+        return expand(self.entries, self.path, (self.path.resolve(),))
+
+    def __repr__(self):
+        return f"TestPlan({self.path})"
@@ -0,0 +1,57 @@
+import time
+import pytest
+from TDTK.core.adb import ShellSession
+from TDTK.core.fake_adb import FakeAdbDevice, Response
+from TDTK.core.matching import Matcher
+from TDTK.core.replay import ReplayDevice, ReplayError, load, normalize, record_devices
+
+class Tests:
+    # Tests that shell2, session commands, streams and pushes are recorded and answered again in the same order.
+    def test_record_and_replay(self, tmp_path, fake_adb):
+        polls = iter(["waiting\n", "ready\n"])
+        device = FakeAdbDevice("replay-1", responses=[
+            Response(r"^cat /state", lambda command: next(polls)),
+            Response(r"bench", "warming up\nTime: 1.5\nmore\n", latency=0.05),
+        ])
+        adb = fake_adb("replay-1", device)
+        payload = tmp_path / "payload.bin"
+        payload.write_bytes(b"x" * 1024)
+        recorder = record_devices([adb], tmp_path / "recording.jsonl")
+        assert adb.shell("cat /state") == "waiting"
+        adb.shell_session = ShellSession(adb.device)
+        assert adb.shell("cat /state") == "ready"
+        assert adb.stream("bench", Matcher({"regex": r"Time: (\S+)", "predicate": "< 2"}))
+        assert adb.push(payload, "/data/local/tmp/payload.bin") == 1024
+        recorder.close()
+
+        events = load(tmp_path / "recording.jsonl")["replay-1"]
+        assert [event["op"] for event in events if event["op"] != "shell2"] == ["stream", "push"]
+        replay = fake_adb("replay-1", ReplayDevice("replay-1", events, "max"))
+        assert replay.shell("cat /state") == "waiting"
+        replay.shell_session = ShellSession(replay.device)
+        assert replay.shell("cat /state") == "ready"
+        assert replay.shell("cat /state") == "ready"  # The last reply keeps answering.
+        assert replay.stream("bench", Matcher({"regex": r"Time: (\S+)", "predicate": "< 2"}))
+        assert replay.last_output == "warming up\nTime: 1.5"
+        assert replay.push(payload, "/data/local/tmp/payload.bin") == 1024
+        assert replay.device.misses == []
+
+    # Tests that recorded speed waits as long as the device took and maximum speed does not wait at all.
+    def test_speed(self, fake_adb):
+        events = [{"serial": "replay-2", "op": "shell2", "command": "sleep", "returncode": 0, "output": "", "elapsed": 0.2}]
+        for speed, slow in (("recorded", True), ("max", False)):
+            adb = fake_adb("replay-2", ReplayDevice("replay-2", events, speed))
+            start = time.perf_counter()
+            adb.shell2("sleep", session=False)
+            assert (time.perf_counter() - start >= 0.2) == slow
+
+    # Tests that an operation missing from the recording fails loudly and that kill timeouts do not break matching.
+    def test_divergence(self):
+        events = [{"serial": "replay-3", "op": "shell2", "command": "timeout -k 2 118 sh -c true", "returncode": 0,
+                   "output": "", "elapsed": 0}]
+        device = ReplayDevice("replay-3", events, "max")
+        assert device.shell2("timeout -k 2 37 sh -c true").returncode == 0
+        assert normalize("timeout -k 2 37 sh -c true") == "timeout -k 2 N sh -c true"
+        with pytest.raises(ReplayError):
+            device.shell2("reboot")
+        assert device.misses == ["shell2 reboot"]
@@ -0,0 +1,301 @@
+import json
+import re
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Optional
+import adbutils
+from TDTK.core.fake_adb import FakeAdbDevice, FakeShell
+from TDTK.core.logger import Logger
+
+logger = Logger(None)
+
+transcript_version = 1
+
+class ReplayError(adbutils.AdbError):
+    pass
+
+def normalize(command: str) -> str:
+    # The device side kill timeout follows the remaining budget, which differs from run to run.
+    return re.sub(r"^timeout -k 2 \d+ ", "timeout -k 2 N ", command)
+
+def encode(data: bytes) -> str:
+    # Chunks may split a UTF-8 sequence, surrogateescape keeps the exact bytes through JSON.
+    return data.decode("utf-8", errors="surrogateescape")
+
+def decode(text: str) -> bytes:
+    return text.encode("utf-8", errors="surrogateescape")
+
+class Recorder:
+    # Appends one JSON line per device operation, shared by every device of a run.
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.file = open(self.path, "w")
+        self.lock = threading.Lock()
+        self.write({"version": transcript_version, "recorded": time.time()})
+
+    def write(self, event: dict) -> None:
+        with self.lock:
+            if self.file:
+                self.file.write(json.dumps(event) + "\n")
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file:
+                self.file.close()
+            self.file = None
+
+class RecordingSocket:
+    # Sits between ADB and the real stream socket, sees every byte in both directions.
+    def __init__(self, conn, on_send=None, on_recv=None):
+        self.conn = conn
+        self.on_send = on_send
+        self.on_recv = on_recv
+
+    def settimeout(self, timeout):
+        self.conn.settimeout(timeout)
+
+    def sendall(self, data: bytes):
+        if self.on_send:
+            self.on_send(data)
+        self.conn.sendall(data)
+
+    def recv(self, size: int) -> bytes:
+        chunk = self.conn.recv(size)
+        if self.on_recv:
+            self.on_recv(chunk)
+        return chunk
+
+class RecordingStream:
+    # A streamed command, recorded as its chunks with their offsets once either end hangs up.
+    def __init__(self, device: "RecordingDevice", command: str, connection):
+        self.device = device
+        self.command = command
+        self.connection = connection
+        self.start = time.perf_counter()
+        self.chunks = []
+        self.closed_by = "host"
+        self.recorded = False
+        self.conn = RecordingSocket(connection.conn, on_recv=self.received)
+
+    def received(self, chunk: bytes):
+        if chunk:
+            self.chunks.append([round(time.perf_counter() - self.start, 6), encode(chunk)])
+        else:
+            self.closed_by = "device"
+
+    def close(self):
+        try:
+            self.connection.close()
+        finally:
+            if not self.recorded:
+                self.recorded = True
+                self.device.record("stream", self.start, command=self.command, chunks=self.chunks, closed_by=self.closed_by)
+
+class RecordingSession:
+    # The interactive `sh` of a ShellSession, every framed command is recorded as if it was a shell2 call.
+    def __init__(self, device: "RecordingDevice", connection):
+        self.device = device
+        self.connection = connection
+        self.pending = deque()
+        self.buffer = b""
+        self.conn = RecordingSocket(connection.conn, on_send=self.sent, on_recv=self.received)
+
+    def sent(self, data: bytes):
+        start = time.perf_counter()
+        for match in FakeShell.frame.finditer(data):
+            self.pending.append((match.group(1).decode(), match.group(2), start))
+
+    def received(self, chunk: bytes):
+        self.buffer += chunk
+        while self.pending:
+            command, sentinel, start = self.pending[0]
+            marker = b"\n" + sentinel + b" "
+            position = self.buffer.find(marker)
+            end = self.buffer.find(b"\n", position + len(marker)) if position >= 0 else -1
+            if end < 0:
+                return
+            output = self.buffer[:position].decode("utf-8", errors="replace")
+            returncode = int(self.buffer[position + len(marker):end])
+            self.buffer = self.buffer[end + 1:]
+            self.pending.popleft()
+            self.device.record("shell2", start, command=command, returncode=returncode, output=output)
+
+    def close(self):
+        self.connection.close()
+
+class RecordingSync:
+    def __init__(self, device: "RecordingDevice"):
+        self.device = device
+
+    def push(self, src, dst: str, *args, **kwargs) -> int:
+        start = time.perf_counter()
+        ret = self.device.device.sync.push(src, dst, *args, **kwargs)
+        self.device.record("push", start, dst=str(dst), size=ret)
+        return ret
+
+class RecordingDevice:
+    # Wraps a real device and records what ADB asks of it, everything else passes straight through.
+    def __init__(self, device: adbutils.AdbDevice, recorder: Recorder):
+        self.device = device
+        self.recorder = recorder
+        self.serial = device.serial
+        self.sync = RecordingSync(self)
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def record(self, op: str, start: float, **fields) -> None:
+        self.recorder.write({"serial": self.serial, "op": op, **fields, "elapsed": round(time.perf_counter() - start, 6)})
+
+    def shell2(self, command: str, *args, **kwargs) -> adbutils.ShellReturn:
+        start = time.perf_counter()
+        ret = self.device.shell2(command, *args, **kwargs)
+        self.record("shell2", start, command=command, returncode=ret.returncode, output=ret.output)
+        return ret
+
+    def shell(self, command: str, stream: bool = False, **kwargs):
+        if stream:
+            connection = self.device.shell(command, stream=True, **kwargs)
+            return RecordingSession(self, connection) if command == "sh" else RecordingStream(self, command, connection)
+        start = time.perf_counter()
+        output = self.device.shell(command, **kwargs)
+        self.record("shell", start, command=command, output=output)
+        return output
+
+    def root(self) -> str:
+        start = time.perf_counter()
+        output = self.device.root()
+        self.record("root", start, output=output)
+        return output
+
+    def install(self, path, *args, **kwargs):
+        start = time.perf_counter()
+        ret = self.device.install(path, *args, **kwargs)
+        self.record("install", start, path=Path(path).name)
+        return ret
+
+class ReplayStream(threading.Thread):
+    # Plays a recorded stream back, at its recorded pace unless the replay runs at maximum speed.
+    def __init__(self, event: Optional[dict], paced: bool):
+        super().__init__(name="TDTK-replay-stream", daemon=True)
+        self.event = event
+        self.paced = paced
+        self.conn, self.end = socket.socketpair()
+        self.stopped = threading.Event()
+        self.start()
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            for offset, text in self.event["chunks"] if self.event else []:
+                if self.paced and self.stopped.wait(max(0, offset - (time.perf_counter() - start))):
+                    return
+                self.end.sendall(decode(text))
+            if self.event and self.event.get("closed_by") == "device":
+                return
+            self.stopped.wait()  # The recording ended by hanging up on a stream that was still going.
+        except OSError:
+            pass
+        finally:
+            self.end.close()
+
+    def close(self):
+        self.stopped.set()
+        self.conn.close()
+
+class ReplaySync:
+    def __init__(self, device: "ReplayDevice"):
+        self.device = device
+
+    def push(self, src, dst: str, *args, **kwargs) -> int:
+        event = self.device.next("push", str(dst))
+        self.device.wait(self.device.delay(event))
+        return event["size"]
+
+class ReplayDevice(FakeAdbDevice):
+    # Answers every operation from the transcript, in recorded order per command.
+    def __init__(self, serial: str, events: list[dict], speed: str = "recorded"):
+        super().__init__(serial)
+        self.speed = speed
+        self.queues = defaultdict(deque)
+        for event in events:
+            self.queues[(event["op"], self.key(event))].append(event)
+        self.misses = []
+        self.sync = ReplaySync(self)
+
+    def key(self, event: dict) -> str:
+        return normalize(event.get("command") or event.get("dst") or event.get("path") or "")
+
+    def next(self, op: str, key: str) -> dict:
+        with self.lock:
+            queue = self.queues.get((op, normalize(key)))
+            if not queue:
+                self.misses.append(f"{op} {key}")
+                raise ReplayError(f'{op} "{key}" on {self.serial} is not in the recording')
+            # The last reply keeps answering, a check that polls longer than recorded sees the final state.
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def delay(self, event: dict) -> float:
+        return event.get("elapsed", 0) if self.speed == "recorded" else 0
+
+    def reply(self, command: str) -> tuple[str, int, Optional[float]]:
+        event = self.next("shell2", command)
+        return event["output"], event["returncode"], self.delay(event)
+
+    def shell(self, command: str, stream: bool = False, **kwargs):
+        if stream and command == "sh":
+            return FakeShell(self)
+        if stream:
+            if ("stream", normalize(command)) not in self.queues:
+                self.next("stream", command)
+            with self.lock:
+                queue = self.queues[("stream", normalize(command))]
+                event = queue.popleft() if queue else None
+            # Streams reconnected more often than recorded stay silent rather than repeating themselves.
+            return ReplayStream(event, self.speed == "recorded")
+        event = self.next("shell", command)
+        self.wait(self.delay(event))
+        return event["output"]
+
+    def root(self) -> str:
+        event = self.next("root", "")
+        self.wait(self.delay(event))
+        return event["output"]
+
+    def install(self, path, *args, **kwargs) -> None:
+        self.wait(self.delay(self.next("install", Path(path).name)))
+
+def load(path: Path) -> dict[str, list[dict]]:
+    # Events of a transcript grouped by device serial, in recorded order.
+    devices = {}
+    with open(path) as transcript:
+        header = json.loads(transcript.readline() or "{}")
+        if header.get("version") != transcript_version:
+            raise ReplayError(f"{path} is not a TDTK recording of version {transcript_version}")
+        for line in transcript:
+            if line.strip():
+                event = json.loads(line)
+                devices.setdefault(event["serial"], []).append(event)
+    return devices
+
+def replay_devices(path: Path, speed: str = "recorded", serials: Optional[list[str]] = None) -> list:
+    from TDTK.core.adb import ADB
+    sessions = []
+    for serial, events in load(path).items():
+        if serials and serial not in serials:
+            continue
+        adb = ADB(serial)
+        adb.device = ReplayDevice(serial, events, speed)
+        sessions.append(adb)
+    logger.log("Replaying %s devices from %s at %s speed", "debug", len(sessions), path, speed)
+    return sessions
+
+def record_devices(sessions: list, path: Path) -> Recorder:
+    recorder = Recorder(path)
+    for adb in sessions:
+        if adb.device:
+            adb.device = RecordingDevice(adb.device, recorder)
+    return recorder
@@ -0,0 +1,32 @@
+import json
+import xml.etree.ElementTree as ElementTree
+from TDTK.core.results import ResultSink, read_results, write_junit
+
+class Tests:
+    # Tests that every result is a line on disk as soon as it is recorded.
+    def test_sink_streams_lines(self, tmp_path):
+        sink = ResultSink(str(tmp_path / "results.jsonl"))
+        sink.record({"test_name": "Hackbench", "status": "passed", "metrics": {"time": 1.2}})
+        assert json.loads((tmp_path / "results.jsonl").read_text()) == {"test_name": "Hackbench", "status": "passed", "metrics": {"time": 1.2}}
+        sink.close()
+
+    # Tests that output snippets are bounded.
+    def test_sink_snippet(self, tmp_path):
+        sink = ResultSink(str(tmp_path / "results.jsonl"), snippet_size=4)
+        assert sink.snippet("abcdefgh") == "...efgh"
+        sink.close()
+
+    # Tests that the JUnit report groups the stream per device from a single read.
+    def test_write_junit(self, tmp_path, mocker):
+        sink = ResultSink(str(tmp_path / "results.jsonl"))
+        for device, status in [("dev1", "passed"), ("dev2", "error"), ("dev1", "failed")]:
+            sink.record({"test_name": "Test", "module": "device.wake", "device": device, "status": status, "duration": 0.5, "output": "<out>"})
+        sink.close()
+        reads = mocker.patch("TDTK.core.results.read_results", wraps=read_results)
+        write_junit(str(tmp_path / "results.jsonl"), str(tmp_path / "junit.xml"))
+        assert reads.call_count == 1
+        suites = ElementTree.parse(tmp_path / "junit.xml").getroot().findall("testsuite")
+        assert [(suite.get("name"), suite.get("tests"), suite.get("failures"), suite.get("errors")) for suite in suites] == [
+            ("dev1", "2", "1", "0"), ("dev2", "1", "0", "1")
+        ]
+        assert len(list(read_results(str(tmp_path / "results.jsonl")))) == 3
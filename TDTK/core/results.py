@@ -0,0 +1,79 @@
+import json
+import threading
+import time
+from collections import Counter
+from typing import Optional
+from xml.sax.saxutils import quoteattr, escape
+from TDTK.core.logger import Logger
+
+logger = Logger(None)
+
+class ResultSink:
+    # One JSON line per test iteration, written as it finishes so nothing but the file buffer is held in memory.
+    def __init__(self, path: str, flush_every: int = 1, flush_interval: float = 5.0, snippet_size: int = 512):
+        self.path = path
+        self.file = open(path, "w", buffering=1 << 16)
+        self.flush_every = max(flush_every, 1)
+        self.flush_interval = flush_interval
+        self.snippet_size = snippet_size
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def snippet(self, output: Optional[str]) -> str:
+        output = output or ""
+        return output if len(output) <= self.snippet_size else "..." + output[-self.snippet_size:]
+
+    def record(self, result: dict) -> None:
+        line = json.dumps(result, default=str) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.pending += 1
+            if self.pending >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.pending = 0
+                self.last_flush = time.monotonic()
+
+    def close(self) -> None:
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+def read_results(path: str):
+    with open(path) as results_file:
+        for line in results_file:
+            if line.strip():
+                yield json.loads(line)
+
+def write_junit(results_path: str, junit_path: str) -> None:
+    # One pass over the stream, cases are bucketed per device since JUnit wants each suite's totals up front.
+    totals = {}
+    cases = {}
+    for result in read_results(results_path):
+        device = result.get("device") or "default"
+        suite = totals.setdefault(device, Counter())
+        suite["tests"] += 1
+        suite["time"] += result.get("duration", 0)
+        name = f'{result["test_name"]} #{result.get("iteration", 0) + 1}'
+        case = (f'    <testcase classname={quoteattr(result.get("module", ""))} name={quoteattr(name)} '
+                f'time="{result.get("duration", 0):.3f}">')
+        if result["status"] in ("failed", "timeout"):
+            suite["failures"] += 1
+            case += f'<failure message={quoteattr(result["status"])}>{escape(result.get("output", ""))}</failure>'
+        elif result["status"] == "error":
+            suite["errors"] += 1
+            case += f'<error message="error">{escape(result.get("output", ""))}</error>'
+        elif result.get("output"):
+            case += f'<system-out>{escape(result["output"])}</system-out>'
+        cases.setdefault(device, []).append(case + '</testcase>\n')
+    with open(junit_path, "w") as junit_file:
+        junit_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n')
+        for device, suite in totals.items():
+            junit_file.write(
+                f'  <testsuite name={quoteattr(device)} tests="{suite["tests"]}" failures="{suite["failures"]}" '
+                f'errors="{suite["errors"]}" time="{suite["time"]:.3f}">\n'
+            )
+            junit_file.writelines(cases[device])
+            junit_file.write('  </testsuite>\n')
+        junit_file.write('</testsuites>\n')
+    logger.log(f"JUnit report written to {junit_path}", type="plain")
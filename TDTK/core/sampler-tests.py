@@ -0,0 +1,49 @@
+import math
+import socket
+import subprocess
+import time
+from types import SimpleNamespace
+from TDTK.core.sampler import Sampler
+
+# Runs the sampler loop in a local `sh`, Linux has the same /proc files a device has.
+class LocalDevice:
+    def shell(self, command, stream=False):
+        host, device = socket.socketpair()
+        process = subprocess.Popen(["sh", "-c", command], stdin=subprocess.DEVNULL, stdout=device.fileno())
+        device.close()
+
+        def close():
+            host.close()
+            process.kill()
+        return SimpleNamespace(conn=host, close=close)
+
+class Tests:
+    # Tests that samples become equally long numeric series and per-test summaries.
+    def test_handle(self):
+        sampler = Sampler(SimpleNamespace(serial="dev1"))
+        sampler.handle("S 10.0 100 0 100 800 0 0 0;1800000 2400000 ;45000 52000 ;8000000 4000000 ")
+        sampler.handle("S 11.0 150 0 150 850 50 0 0;1800000 2400000 ;47000 53500 ;8000000 3000000 ")
+        start = sampler.mark()
+        sampler.handle("S 12.0 250 0 250 850 50 0 0;300000 ;48000 ;8000000 2000000 ")
+        sampler.handle("garbage")
+        assert len({len(values) for values in sampler.series.values()}) == 1
+        assert list(sampler.series["cpu_util"]) == [50.0, 100.0]
+        assert math.isnan(sampler.series["freq_cpu1_mhz"][1])
+        assert sampler.summary(start) == {
+            "cpu_util": {"mean": 100.0, "min": 100.0, "max": 100.0},
+            "temp_max": {"mean": 48.0, "min": 48.0, "max": 48.0},
+            "mem_available_mb": {"mean": 1953.125, "min": 1953.125, "max": 1953.125},
+            "freq_cpu0_mhz": {"mean": 300.0, "min": 300.0, "max": 300.0},
+        }
+
+    # Tests the device loop itself against a real /proc.
+    def test_loop(self):
+        sampler = Sampler(SimpleNamespace(serial="local", device=LocalDevice()), interval=0.05)
+        sampler.start()
+        end = time.monotonic() + 5
+        while sampler.mark() < 3 and time.monotonic() < end:
+            time.sleep(0.05)
+        sampler.stop()
+        summary = sampler.summary(0)
+        assert 0 <= summary["cpu_util"]["mean"] <= 100
+        assert summary["mem_available_mb"]["min"] > 0
@@ -0,0 +1,87 @@
+import math
+import threading
+from array import array
+from typing import Optional, TYPE_CHECKING
+from TDTK.core.capture import LogStream
+
+if TYPE_CHECKING:
+    from TDTK.core.adb import ADB
+
+# One line per sample, read with shell builtins only so the loop forks nothing but sleep.
+script = (
+    "while :; do"
+    " read up _ < /proc/uptime; read _ u n s i w q sq _ < /proc/stat;"
+    " printf 'S %s %s %s %s %s %s %s %s;' $up $u $n $s $i $w $q $sq;"
+    " for f in /sys/devices/system/cpu/cpu[0-9]*/cpufreq/scaling_cur_freq; do v=-; read v 2>/dev/null < $f; printf '%s ' $v; done;"
+    " printf ';';"
+    " for f in /sys/class/thermal/thermal_zone*/temp; do v=-; read v 2>/dev/null < $f; printf '%s ' $v; done;"
+    " printf ';';"
+    " while read k v _; do case $k in MemTotal:|MemAvailable:) printf '%s ' $v;; esac; done < /proc/meminfo;"
+    " echo; sleep {interval};"
+    " done"
+)
+
+def number(text: str) -> float:
+    try:
+        return float(text)
+    except ValueError:
+        return math.nan
+
+class Sampler(LogStream):
+    # Device side: a single shell loop. Host side: one array of doubles per series, indexed by sample.
+    def __init__(self, adb: "ADB", interval: float = 1.0):
+        super().__init__(adb, "sampler", script.format(interval=interval), 0)
+        self.series = {"time": array("d"), "cpu_util": array("d"), "temp_max": array("d"), "mem_available_mb": array("d")}
+        self.previous = None
+        self.lock = threading.Lock()
+
+    def handle(self, line: str):
+        parts = line.split(";")
+        if len(parts) != 4 or not parts[0].startswith("S "):
+            return
+        stat = [number(value) for value in parts[0].split()[1:]]
+        if len(stat) != 8:
+            return
+        uptime, counters = stat[0], stat[1:]
+        previous, self.previous = self.previous, counters
+        if previous is None:
+            return  # Utilization needs two samples.
+        total = sum(counters) - sum(previous)
+        idle = (counters[3] + counters[4]) - (previous[3] + previous[4])
+        row = {
+            "time": uptime,
+            "cpu_util": (total - idle) / total * 100 if total > 0 else math.nan,
+            "mem_available_mb": math.nan,
+        }
+        for core, value in enumerate(parts[1].split()):
+            row[f"freq_cpu{core}_mhz"] = number(value) / 1000
+        temps = [number(value) for value in parts[2].split()]
+        # Zones report millidegrees on most devices and degrees on a few.
+        temps = [value / 1000 if value > 1000 else value for value in temps if value == value]
+        row["temp_max"] = max(temps) if temps else math.nan
+        memory = [number(value) for value in parts[3].split()]
+        if len(memory) == 2:
+            row["mem_available_mb"] = memory[1] / 1024
+        with self.lock:
+            length = len(self.series["time"])
+            for name, value in row.items():
+                if name not in self.series:
+                    self.series[name] = array("d", [math.nan] * length)
+                self.series[name].append(value)
+            for name, values in self.series.items():
+                if len(values) == length:
+                    values.append(math.nan)  # A core went offline, keep every series the same length.
+
+    def mark(self) -> int:
+        with self.lock:
+            return len(self.series["time"])
+
+    def summary(self, start: int, end: Optional[int] = None) -> dict[str, dict[str, float]]:
+        with self.lock:
+            window = {name: values[start:end] for name, values in self.series.items() if name != "time"}
+        summary = {}
+        for name, values in window.items():
+            values = [value for value in values if value == value]
+            if values:
+                summary[name] = {"mean": round(sum(values) / len(values), 3), "min": min(values), "max": max(values)}
+        return summary
@@ -0,0 +1,56 @@
+import threading
+import time
+from TDTK.core.scheduler import ResourceScheduler, conflicts
+
+class Tests:
+    # Tests the conflict rules: shared names, undeclared resources and exclusive ones.
+    def test_conflicts(self):
+        assert not conflicts(frozenset({"wifi"}), frozenset({"screen"}))
+        assert not conflicts(frozenset(), frozenset({"screen"}))
+        assert conflicts(frozenset({"wifi", "screen"}), frozenset({"screen"}))
+        assert conflicts(None, frozenset())
+        assert conflicts(frozenset({"cpu-exclusive"}), frozenset({"audio"}))
+
+    # Tests that unrelated entries overlap, conflicting ones keep plan order and output comes back in plan order.
+    def test_run(self):
+        entries = [("install", frozenset({"package-manager"})), ("audio", frozenset({"audio"})),
+                   ("install-2", frozenset({"package-manager"})), ("bench", frozenset({"cpu-exclusive"})),
+                   ("wifi", frozenset({"wifi"}))]
+        started, finished = {}, {}
+        lock = threading.Lock()
+
+        def work(name):
+            with lock:
+                started[name] = time.monotonic()
+            time.sleep(0.05)
+            with lock:
+                finished[name] = time.monotonic()
+            return name
+
+        emitted = []
+        ResourceScheduler(entries, parallel=4).run(work, lambda index, name: emitted.append(name))
+        assert emitted == [name for name, _ in entries]
+        assert started["audio"] < finished["install"]  # Overlapped.
+        assert started["install-2"] >= finished["install"]
+        assert started["bench"] >= max(finished["install"], finished["audio"], finished["install-2"])
+        assert started["wifi"] >= finished["bench"]  # Never jumps ahead of an earlier conflicting entry.
+
+    # Tests that entries are read from the iterator as they are needed, never more than lookahead ahead of a slow one.
+    def test_lookahead(self):
+        read = []
+        slow_done = threading.Event()
+
+        def entries():
+            for index in range(20):
+                read.append((index, slow_done.is_set()))
+                yield index, frozenset()
+
+        def work(index):
+            time.sleep(0.2 if index == 0 else 0.01)
+            if index == 0:
+                slow_done.set()
+            return index
+
+        results = ResourceScheduler(entries(), parallel=2, lookahead=5).run(work)
+        assert results == list(range(20))
+        assert [index for index, after in read if not after] == list(range(5))
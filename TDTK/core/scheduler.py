@@ -0,0 +1,90 @@
+import threading
+from typing import Callable, Iterable, Optional
+
+def conflicts(first: Optional[frozenset], second: Optional[frozenset]) -> bool:
+    # Undeclared resources (None) and "*-exclusive" ones conflict with everything.
+    if first is None or second is None:
+        return True
+    if any(resource.endswith("-exclusive") for resource in first | second):
+        return True
+    return bool(first & second)
+
+class ResourceScheduler:
+    # Starts plan entries as soon as nothing running and nothing earlier still waiting conflicts with them,
+    # so conflicting entries keep their plan order while unrelated ones overlap. Entries are read from the
+    # iterable as they are needed, never more than lookahead past the oldest one not emitted yet.
+    def __init__(self, entries: Iterable[tuple[object, Optional[frozenset]]], parallel: int = 2, lookahead: int = 256) -> None:
+        self.entries = iter(entries)
+        self.parallel = max(parallel, 1)
+        self.lookahead = max(lookahead, self.parallel)
+        self.condition = threading.Condition()
+
+    def startable(self, entries: dict, pending: list[int], running: set[int]) -> list[int]:
+        started = []
+        for position, index in enumerate(pending):
+            if len(running) + len(started) >= self.parallel:
+                break
+            resources = entries[index][1]
+            if any(conflicts(resources, entries[other][1]) for other in running | set(started)):
+                continue
+            if any(conflicts(resources, entries[other][1]) for other in pending[:position]):
+                continue
+            started.append(index)
+        return started
+
+    def run(self, work: Callable[[object], object], emit: Optional[Callable[[int, object], None]] = None) -> list:
+        # work(entry) runs on a worker thread, emit(index, result) is called on this thread in plan order.
+        # Without emit the results are returned in plan order instead.
+        entries = {}
+        pending = []
+        running = set()
+        results = {}
+        errors = {}
+        collected = []
+        read = 0
+        emitted = 0
+        exhausted = False
+
+        def worker(index):
+            try:
+                result = work(entries[index][0])
+            except BaseException as e:
+                error, result = e, None
+            else:
+                error = None
+            with self.condition:
+                results[index] = result
+                if error is not None:
+                    errors[index] = error
+                running.discard(index)
+                self.condition.notify()
+
+        with self.condition:
+            while True:
+                while not exhausted and read - emitted < self.lookahead:
+                    try:
+                        entries[read] = next(self.entries)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.append(read)
+                    read += 1
+                for index in self.startable(entries, pending, running):
+                    pending.remove(index)
+                    running.add(index)
+                    threading.Thread(target=worker, args=(index,), name=f"TDTK-test-{index}", daemon=True).start()
+                window = emitted
+                while emitted < read and emitted not in running and emitted not in pending:
+                    if emitted in errors:
+                        raise errors[emitted]
+                    result = results.pop(emitted)
+                    del entries[emitted]
+                    if emit:
+                        emit(emitted, result)
+                    else:
+                        collected.append(result)
+                    emitted += 1
+                if exhausted and emitted == read:
+                    return collected
+                if emitted == window:
+                    self.condition.wait()  # Emitting moves the lookahead on, otherwise only a finished entry helps.
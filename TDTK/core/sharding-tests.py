@@ -0,0 +1,62 @@
+import threading
+from TDTK.core.sharding import DurationStore, ShardQueue, group_tests
+
+class Tests:
+    # Tests that installs stay with the entries depending on them and explicit groups are kept together, in plan order.
+    def test_group_tests(self, make_planner):
+        planner = make_planner({
+            "app": {"install": {"type": "app-install"}, "launch": {"depends": "install"}},
+            "cli": {"a": {}, "b": {}, "c": {}},
+        })
+        tests = [
+            {"test_name": "launch", "module": "app.launch"},
+            {"test_name": "a", "module": "cli.a", "group": "x"},
+            {"test_name": "install", "module": "app.install"},
+            {"test_name": "b", "module": "cli.b"},
+            {"test_name": "c", "module": "cli.c", "group": "x"},
+        ]
+        groups = [[test["test_name"] for test in group] for group in group_tests(tests, planner)]
+        assert sorted(groups) == [["a", "c"], ["b"], ["launch", "install"]]
+
+    # Tests that entries of one module and entries sharing a side effect free prerequisite spread across devices.
+    def test_independent_entries_spread(self, make_planner, tmp_path):
+        planner = make_planner({
+            "cli": {"hackbench": {}},
+            "device": {"wake": {}, "unlock": {"depends": "wake"}},
+            "app": {"a": {"depends": "device.unlock"}, "b": {"depends": "device.unlock"}},
+        })
+        tests = [{"test_name": f"hackbench {i}", "module": "cli.hackbench"} for i in range(8)]
+        tests += [{"test_name": "unlock", "module": "device.unlock"}, {"test_name": "a", "module": "app.a"},
+                  {"test_name": "b", "module": "app.b"}]
+        groups = group_tests(tests, planner)
+        assert len(groups) == len(tests)
+        queue = ShardQueue(groups, ["dev1", "dev2"], DurationStore(tmp_path / "durations.json"))
+        assert [len(queue.queues[serial]) for serial in ("dev1", "dev2")] == [6, 5]
+
+    # Tests that durations are balanced and persisted across runs.
+    def test_duration_store(self, tmp_path):
+        store = DurationStore(tmp_path / "durations.json")
+        store.add({"module": "m.a", "test_name": "a"}, 4)
+        store.add({"module": "m.a", "test_name": "a"}, 14)
+        store.save()
+        store = DurationStore(tmp_path / "durations.json")
+        assert store.estimate({"module": "m.a", "test_name": "a", "repeat": 1}) == 7 * 2
+        assert store.estimate({"module": "m.b", "test_name": "b"}) == 7
+
+    # Tests that every group runs exactly once when idle devices steal work.
+    def test_work_stealing(self, tmp_path):
+        store = DurationStore(tmp_path / "durations.json")
+        for i in range(20):
+            store.add({"module": "m.t", "test_name": str(i)}, i + 1)
+        groups = [[{"module": "m.t", "test_name": str(i)}] for i in range(20)]
+        queue = ShardQueue(groups, ["dev1", "dev2", "dev3"], store)
+        assert max(queue.loads.values()) - min(queue.loads.values()) <= 20
+        done = []
+        # dev3 never asks for work, the other two have to finish its share.
+        workers = [threading.Thread(target=lambda serial=serial: done.extend(iter(lambda: queue.next(serial), None)))
+                   for serial in ("dev1", "dev2")]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert sorted(group[0]["test_name"] for group in done) == sorted(str(i) for i in range(20))
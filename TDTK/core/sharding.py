@@ -0,0 +1,125 @@
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Optional
+from TDTK.core.cache import cache_dir, read_json, write_json
+from TDTK.core.planner import Planner, PlanError
+
+def test_key(test: dict) -> str:
+    return f'{test.get("module")}:{test.get("test_name")}'
+
+def iterations(test: dict) -> int:
+    repeat = test.get("repeat", 0)
+    return test.get("warmup", 0) + (repeat + 1 if repeat > 0 else 1)
+
+class DurationStore:
+    # Moving average of the seconds one iteration of a plan entry took, kept across runs.
+    weight = 0.3
+    default = 10.0
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = path or cache_dir() / "durations.json"
+        self.entries = read_json(self.path, {})
+        self.median = None
+        self.changed = False
+        self.lock = threading.Lock()
+
+    def estimate(self, test: dict) -> float:
+        with self.lock:
+            known = self.entries.get(test_key(test))
+            if known is None and self.entries:
+                # Unknown tests are assumed to be as long as a typical known one, sorted once until the next add.
+                if self.median is None:
+                    self.median = sorted(self.entries.values())[len(self.entries) // 2]
+                known = self.median
+        return (known if known is not None else self.default) * iterations(test)
+
+    def add(self, test: dict, seconds: float) -> None:
+        key = test_key(test)
+        with self.lock:
+            previous = self.entries.get(key)
+            self.entries[key] = seconds if previous is None else previous + self.weight * (seconds - previous)
+            self.median = None
+            self.changed = True
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.changed:
+                return
+            try:
+                write_json(self.path, self.entries)
+            except OSError:
+                pass  # The durations only steer sharding, a read-only home must not break a run.
+            self.changed = False
+
+def has_side_effects(submodule) -> bool:
+    # Installs and pushes leave state behind that is worth reusing, a volatile step is redone anyway.
+    return not submodule.volatile and bool(getattr(submodule, "type", "") or submodule.files)
+
+def group_tests(tests: list, planner: Planner) -> list[list]:
+    # Entries sharing a "group" key stay together, and so does an entry with the first entry running one of its
+    # prerequisites that has side effects. Entries of the same module are otherwise independent.
+    parents = list(range(len(tests)))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def union(first, second):
+        parents[find(second)] = find(first)
+
+    groups, owners = {}, {}
+    for index, test in enumerate(tests):
+        if not isinstance(test, dict):
+            continue
+        if test.get("group") is not None:
+            union(groups.setdefault(str(test["group"]), index), index)
+        if isinstance(test.get("module"), str):
+            owners.setdefault(test["module"], index)
+    for index, test in enumerate(tests):
+        if not isinstance(test, dict) or not isinstance(test.get("module"), str) or not planner.lookup(test["module"]):
+            continue
+        try:
+            chain = planner.resolve(test["module"])
+        except PlanError:
+            continue
+        for node in chain:
+            if node in owners and has_side_effects(planner.lookup(node)):
+                union(owners[node], index)
+    grouped = {}
+    for index, test in enumerate(tests):
+        grouped.setdefault(find(index), []).append(test)  # Plan order is kept inside a group.
+    return list(grouped.values())
+
+class ShardQueue:
+    # Groups are dealt out longest first to the least loaded device, idle devices then steal from the busiest one.
+    def __init__(self, groups: list[list], serials: list[str], durations: DurationStore) -> None:
+        self.durations = durations
+        self.queues = {serial: deque() for serial in serials}
+        self.loads = {serial: 0.0 for serial in serials}
+        self.lock = threading.Lock()
+        costs = [(self.cost(group), group) for group in groups]
+        for cost, group in sorted(costs, key=lambda item: -item[0]):
+            serial = min(serials, key=lambda serial: self.loads[serial])
+            self.queues[serial].append((cost, group))
+            self.loads[serial] += cost
+
+    def cost(self, group: list) -> float:
+        return sum(self.durations.estimate(test) for test in group if isinstance(test, dict))
+
+    def next(self, serial: str) -> Optional[list]:
+        with self.lock:
+            queue = self.queues[serial]
+            if queue:
+                cost, group = queue.popleft()
+                self.loads[serial] -= cost
+                return group
+            busiest = max(self.queues, key=lambda other: self.loads[other] if self.queues[other] else -1)
+            if not self.queues[busiest]:
+                return None
+            # Stealing from the back takes the shortest remaining group, the owner keeps its long ones.
+            cost, group = self.queues[busiest].pop()
+            self.loads[busiest] -= cost
+            return group
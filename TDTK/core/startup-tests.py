@@ -0,0 +1,28 @@
+import time
+from TDTK.core.logger import Logger
+from TDTK.core.startup import StartupProfiler
+
+class Tests:
+    # Tests that a startup over budget is reported as a failure once, and that phases after the report are ignored.
+    def test_budget(self, output):
+        profiler = StartupProfiler()
+        profiler.enable(budget=1)
+        with profiler.phase("imports"):
+            time.sleep(0.01)
+        assert not profiler.report()
+        assert profiler.report()
+        with profiler.phase("late"):
+            pass
+        Logger(None).close()
+        assert [name for name, _ in profiler.phases] == ["imports"]
+        assert "imports: " in output.getvalue()
+        assert "over the budget of 1 ms!" in output.getvalue()
+
+    # Tests that a profiler that was never enabled or stays within its budget passes.
+    def test_within_budget(self, output):
+        assert StartupProfiler().report()
+        profiler = StartupProfiler()
+        profiler.enable(budget=60000)
+        assert profiler.report()
+        Logger(None).close()
+        assert "over the budget" not in output.getvalue()
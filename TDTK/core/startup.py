@@ -0,0 +1,42 @@
+import time
+from contextlib import contextmanager
+
+# Kept dependency free so it can be imported before anything else it measures.
+class StartupProfiler:
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self.phases = []
+        self.enabled = False
+        self.budget = 0
+        self.reported = False
+
+    def enable(self, budget: float = 0) -> None:
+        self.enabled = True
+        self.budget = budget
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if not self.reported:
+                self.phases.append((name, time.perf_counter() - start))
+
+    def report(self) -> bool:
+        if not self.enabled or self.reported:
+            return True
+        self.reported = True
+        from TDTK.core.logger import Logger
+        logger = Logger(None)
+        total = (time.perf_counter() - self.origin) * 1000
+        logger.log("Startup Profile:", type="summarySpaced")
+        for name, seconds in self.phases:
+            logger.log(f"{name}: {seconds * 1000:.1f} ms", type="result")
+        logger.log(f"Total: {total:.1f} ms", type="result")
+        if self.budget and total > self.budget:
+            logger.log(f"Startup took {total:.1f} ms, over the budget of {self.budget:g} ms!", type="failure")
+            return False
+        return True
+
+profiler = StartupProfiler()
@@ -0,0 +1,127 @@
+import json
+from argparse import Namespace
+import adbutils
+import pytest
+from TDTK.core.fake_adb import FakeAdbDevice, Response
+from TDTK.core.modules import Modules
+from TDTK.core.replay import ReplayError
+from TDTK.core.sharding import DurationStore
+from TDTK.core.test_runner import TestRunner
+
+def write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data))
+    return path
+
+class DivergingDevice(FakeAdbDevice):
+    # A replay that has everything but the commands mentioning "unrecorded".
+    def __init__(self, serial):
+        super().__init__(serial, responses=[Response(r"echo ok", "ok\n")])
+        self.misses = []
+
+    def reply(self, command):
+        if "unrecorded" in command:
+            self.misses.append(f"shell2 {command}")
+            raise ReplayError(f'shell2 "{command}" on {self.serial} is not in the recording')
+        return super().reply(command)
+
+class FailingDevice(FakeAdbDevice):
+    # The transport gives up on "stuck" and adbd errors out on "broken".
+    def __init__(self, serial):
+        super().__init__(serial, responses=[Response(r"echo ok", "ok\n")])
+
+    def reply(self, command):
+        if "stuck" in command:
+            raise adbutils.AdbTimeout("read timeout")
+        if "broken" in command:
+            raise adbutils.AdbError("device offline")
+        return super().reply(command)
+
+class Tests:
+    # Tests that validation exits 0 for a sound plan, 1 otherwise, and never prints a run summary.
+    def test_validate_exit_code(self, tmp_path, output):
+        write_json(tmp_path / "modules" / "bench.json", {"run": {"command": "bench", "expected": 0}})
+        modules = Modules(tmp_path / "modules", tmp_path / "catalog.json")
+        for entries, code in (([{"test_name": "Bench", "module": "bench.run"}], 0),
+                              ([{"test_name": "Bench", "module": "bench.run"}, {"test_name": "Gone", "module": "bench.gone"}], 1)):
+            plan = write_json(tmp_path / "plan.json", entries)
+            runner = TestRunner(Namespace(debug=False, test_plan=str(plan), module="", validate=True), modules)
+            with pytest.raises(SystemExit) as exit:
+                runner.validate_plan()
+            assert exit.value.code == code
+        assert "1 of 2 tests in the test plan are valid." in output.getvalue()
+        assert "Total parsed tests" not in output.getvalue()
+
+    # Tests that a cached problem is reported with each entry's own name, braces in the reference included.
+    def test_check_problems(self, tmp_path, output):
+        write_json(tmp_path / "modules" / "bench.json", {"run": {"command": "bench", "expected": 0}})
+        runner = TestRunner(Namespace(debug=False), Modules(tmp_path / "modules", tmp_path / "catalog.json"))
+        assert runner.check_test({"test_name": "Bench", "module": "bench.run"}).command == "bench"
+        assert not runner.check_test({"test_name": "First", "module": "sweep{n}.run"})
+        assert not runner.check_test({"test_name": "Second", "module": "sweep{n}.run"})
+        assert not runner.check_test({"test_name": "Third", "module": "bench.gone"})
+        runner.logger.close()
+        assert "Module 'sweep{n}' not found for test 'First'!" in output.getvalue()
+        assert "Module 'sweep{n}' not found for test 'Second'!" in output.getvalue()
+        assert "Submodule 'gone' not found in module 'bench' for test 'Third'!" in output.getvalue()
+        assert runner.errors == 3
+
+    # Tests that two devices running the plan side by side each keep their own counts, and the totals add up.
+    def test_run_on_devices(self, tmp_path, output, fake_adb):
+        write_json(tmp_path / "modules" / "bench.json", {"echo": {"command": "echo ok", "expected": "ok", "resources": []}})
+        runner = TestRunner(Namespace(debug=False, test_plan=None, module=None, history_enabled=False),
+                            Modules(tmp_path / "modules", tmp_path / "catalog.json"))
+        runner.durations = DurationStore(tmp_path / "durations.json")
+        runner.sessions = [fake_adb("counts-1", responses=[Response(r"echo ok", "ok\n")]),
+                           fake_adb("counts-2", responses=[Response(r"echo ok", "failed\n", 1)])]
+        runner.test_plan = [{"test_name": f"Echo {index}", "module": "bench.echo"} for index in range(3)] + \
+            [{"test_name": "Gone", "module": "bench.gone"}]
+        runner.plan_tests()
+        runner.run_on_devices(runner.run_tests)
+        assert runner.device_counts == {
+            "counts-1": {"total_tests": 3, "tests_passed": 3, "errors": 1},
+            "counts-2": {"total_tests": 3, "tests_failed": 3, "errors": 1},
+        }
+        assert (runner.total_tests, runner.tests_passed, runner.tests_failed, runner.errors) == (6, 3, 3, 2)
+
+    # Tests that a replay leaving the recording fails that test only, and the run still finishes with the misses listed.
+    def test_replay_divergence(self, tmp_path, output, fake_adb):
+        write_json(tmp_path / "modules" / "bench.json", {
+            "echo": {"command": "echo ok", "expected": "ok", "resources": []},
+            "new": {"command": "unrecorded", "expected": 0, "resources": []},
+        })
+        results = tmp_path / "results.jsonl"
+        runner = TestRunner(Namespace(debug=False, test_plan=None, module=None, history_enabled=False, results=str(results)),
+                            Modules(tmp_path / "modules", tmp_path / "catalog.json"))
+        runner.open_sink()
+        runner.durations = DurationStore(tmp_path / "durations.json")
+        runner.sessions = [fake_adb("diverging", DivergingDevice("diverging"))]
+        runner.test_plan = [{"test_name": "New", "module": "bench.new"}, {"test_name": "Echo", "module": "bench.echo"}]
+        runner.plan_tests()
+        runner.run_on_devices(runner.run_tests)
+        with pytest.raises(SystemExit):
+            runner.finish()
+        assert (runner.tests_passed, runner.errors) == (1, 1)
+        assert [json.loads(line)["status"] for line in results.read_text().splitlines()] == ["error", "passed"]
+        assert "1 operations were not recorded" in output.getvalue()
+        assert "shell2 unrecorded" in output.getvalue()
+
+    # Tests that transport timeouts and adb errors are recorded per test and the plan moves on.
+    def test_adb_errors(self, tmp_path, output, fake_adb):
+        write_json(tmp_path / "modules" / "bench.json", {
+            "echo": {"command": "echo ok", "expected": "ok", "resources": []},
+            "stuck": {"command": "stuck", "expected": 0, "resources": []},
+            "broken": {"command": "broken", "expected": 0, "resources": []},
+        })
+        results = tmp_path / "results.jsonl"
+        runner = TestRunner(Namespace(debug=False, test_plan=None, module=None, history_enabled=False, results=str(results)),
+                            Modules(tmp_path / "modules", tmp_path / "catalog.json"))
+        runner.open_sink()
+        runner.durations = DurationStore(tmp_path / "durations.json")
+        runner.sessions = [fake_adb("failing", FailingDevice("failing"))]
+        runner.test_plan = [{"test_name": name.title(), "module": f"bench.{name}"} for name in ("stuck", "broken", "echo")]
+        runner.plan_tests()
+        runner.run_on_devices(runner.run_tests)
+        runner.close_sink()
+        assert [json.loads(line)["status"] for line in results.read_text().splitlines()] == ["timeout", "error", "passed"]
+        assert (runner.tests_passed, runner.tests_failed, runner.errors) == (1, 1, 1)
@@ -1,47 +1,236 @@
-import json
 import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, TYPE_CHECKING
 from TDTK.core.logger import Logger
-from TDTK.core.modules import Modules, Module
-from TDTK.core.adb import ADB
+from TDTK.core.modules import Modules, Module, SubModule
+from TDTK.core.planner import Planner, PlanError
+from TDTK.core.plans import TestPlan
+from TDTK.core.metrics import MetricCollector, extract_metrics
+from TDTK.core.results import ResultSink, write_junit
+from TDTK.core.sharding import DurationStore, ShardQueue, group_tests
+from TDTK.core.deadline import budget, remaining
+from TDTK.core.scheduler import ResourceScheduler
+from TDTK.core.startup import profiler
+from TDTK.core.tracing import tracer
+from TDTK.core.indicator import indicator
+
+if TYPE_CHECKING:
+    from TDTK.core.adb import ADB
 
 class TestRunner:
-    def __init__(self, args):
+    # Parallel runs read at most this many plan entries past the oldest one still running or not yet printed.
+    lookahead = 256
+
+    def __init__(self, args, modules: Optional[Modules] = None):
         self.args = args
         self.debug = args.debug
         self.logger = Logger(self)
-        self.modules = Modules()
-        self.adb = ADB()
+        self.logger.open(getattr(args, "log_file", None))
+        self.modules = modules or Modules()
+        self.planner = Planner(self.modules)
+        self.checked = {}
+        self.sessions = []
+        self.lock = threading.Lock()
+        self.device_counts = {}
+        self.metrics = MetricCollector()
+        self.sink = None
+        self.durations = DurationStore()
+        self.shards = None
+        self.history = None
+        self.plan_deadline = None
+        self.captures = {}
+        self.samplers = {}
+        self.recorder = None
         self.total_tests = 0
         self.tests_passed = 0
         self.tests_failed = 0
         self.errors = 0
 
     def start(self):
-        self.setup_logger()
-        self.detect_device()
-        self.load_modules()
+        if getattr(self.args, "trace", None):
+            tracer.enable()
+        if getattr(self.args, "validate", False):
+            self.validate_plan()
+        self.open_sink()
+        self.open_history()
+        with profiler.phase("device discovery"):
+            self.sessions = self.select_devices()
+            self.setup_logger()
+            self.detect_device()
+        self.start_captures()
+        self.start_samplers()
+        with profiler.phase("module catalog"):
+            self.load_modules()
+        if not profiler.report():
+            sys.exit(2)
+        if getattr(self.args, "progress", True) and indicator.start():
+            self.logger.set_overlay(indicator)
+        if getattr(self.args, "plan_timeout", None):
+            self.plan_deadline = time.monotonic() + self.args.plan_timeout
         if self.args.test_plan:
             self.load_test_suite()
-            self.run_tests()
+            self.plan_tests()
+            if getattr(self.args, "shard", False):
+                self.plan_shards()
+                self.run_on_devices(self.run_shard)
+            else:
+                self.run_on_devices(self.run_tests)
         elif self.args.module:
             test = {
                 "test_name": self.args.module,
                 "module": self.args.module
             }
-            if self.validate_test(test):
-                self.run_test(test)
+            self.run_on_devices(lambda adb: self.validate_test(test, adb) and self.run_test(test, adb))
         self.finish()
 
+    def open_sink(self):
+        results = getattr(self.args, "results", None)
+        junit = getattr(self.args, "junit", None)
+        if junit and not results:
+            results = f"{junit}.jsonl"
+        if results:
+            self.sink = ResultSink(results, flush_every=getattr(self.args, "flush_every", 1) or 1)
+
+    def close_sink(self):
+        if not self.sink:
+            return
+        self.sink.close()
+        junit = getattr(self.args, "junit", None)
+        if junit:
+            write_junit(self.sink.path, junit)
+        self.logger.log(f"Results written to {self.sink.path}", type="plain")
+        self.sink = None
+
+    def open_history(self):
+        if not getattr(self.args, "history_enabled", True):
+            return
+        from TDTK.core.history import History
+        plan = Path(self.args.test_plan).name if self.args.test_plan else self.args.module
+        try:
+            self.history = History(getattr(self.args, "history", None))
+            self.history.start_run(plan, getattr(self.args, "label", None))
+        except Exception as e:
+            self.logger.log(f"Performance history disabled, failed to open the database: {e}", type="plainFailure")
+            self.history = None
+
+    def close_history(self):
+        if not self.history:
+            return
+        self.history.close()
+        self.logger.log("Measurements recorded as run %s in %s", "debug", self.history.run_id, self.history.path)
+        self.history = None
+
+    def close_replay(self):
+        if self.recorder:
+            self.recorder.close()
+            self.logger.log(f"Device session recorded to {self.recorder.path}", type="plain")
+            self.recorder = None
+
+    def log_replay_misses(self):
+        for adb in self.sessions:
+            misses = getattr(adb.device, "misses", None)
+            if misses:
+                self.logger.log(f"Replay of {adb.serial} diverged from the recording, {len(misses)} operations were not recorded:",
+                                type="plainFailure")
+                for miss in dict.fromkeys(misses):
+                    self.logger.log(miss, type="failure")
+
+    def select_devices(self) -> list["ADB"]:
+        with profiler.phase("import adb"):
+            from TDTK.core.adb import ADB
+        if getattr(self.args, "replay", None):
+            from TDTK.core.replay import replay_devices
+            serials = [serial.strip() for serial in self.args.device_id.split(",") if serial.strip()] if self.args.device_id else None
+            sessions = replay_devices(self.args.replay, getattr(self.args, "replay_speed", "recorded"), serials)
+        elif getattr(self.args, "all_devices", False) or (getattr(self.args, "shard", False) and not self.args.device_id):
+            sessions = ADB.attached()
+        elif self.args.device_id:
+            sessions = [ADB(serial.strip()) for serial in self.args.device_id.split(",") if serial.strip()]
+        else:
+            sessions = [ADB.default()]
+        for adb in sessions:
+            adb.timeout = getattr(self.args, "command_timeout", None) or adb.timeout
+        if getattr(self.args, "record", None):
+            from TDTK.core.replay import record_devices
+            self.recorder = record_devices(sessions, self.args.record)
+        return sessions
+
     def setup_logger(self):
         self.logger.start()
 
     def detect_device(self):
-        if self.adb.device:
-            device_id = self.adb.device.serial
-            self.logger.log(f"Device detected with ID: {device_id}", type="debug")
-        else:
+        for adb in self.sessions:
+            if adb.device:
+                self.logger.log("Device detected with ID: %s", "debug", adb.serial)
+        missing = [adb for adb in self.sessions if not adb.device]
+        if missing and self.args.device_id:
+            self.logger.log(f"Device(s) not found: {self.args.device_id}", type="plainFailure")
+        self.sessions = [adb for adb in self.sessions if adb.device]
+        if not self.sessions:
             self.logger.log("No devices detected, bailing!", type="plainFailure")
             self.finish()
+        if getattr(self.args, "shell_session", False):
+            for adb in self.sessions:
+                adb.use_shell_session()
+        for adb in self.sessions:
+            adb.concurrency = getattr(self.args, "concurrency", 4) or 1
+
+    def start_captures(self):
+        directory = getattr(self.args, "capture_logs", None)
+        if not directory:
+            return
+        from TDTK.core.capture import LogCapture
+        for adb in self.sessions:
+            self.captures[adb.serial] = LogCapture(adb, directory, int((getattr(self.args, "capture_size", 4) or 4) * (1 << 20)))
+            self.captures[adb.serial].start()
+
+    def stop_captures(self):
+        for capture in self.captures.values():
+            capture.stop()
+        self.captures = {}
+
+    def start_samplers(self):
+        interval = getattr(self.args, "sample", None)
+        if not interval:
+            return
+        from TDTK.core.sampler import Sampler
+        for adb in self.sessions:
+            self.samplers[adb.serial] = Sampler(adb, interval)
+            self.samplers[adb.serial].start()
+
+    def stop_samplers(self):
+        for sampler in self.samplers.values():
+            sampler.stop()
+        self.samplers = {}
+
+    def run_on_devices(self, target):
+        if len(self.sessions) == 1:
+            self.run_on_device(target, self.sessions[0])
+            return
+        with ThreadPoolExecutor(max_workers=len(self.sessions)) as pool:
+            futures = [pool.submit(self.run_on_device, target, adb) for adb in self.sessions]
+            for future in futures:
+                future.result()
+
+    def run_on_device(self, target, adb: "ADB"):
+        self.logger.bind_device(adb.serial)
+        try:
+            target(adb)
+        except Exception as e:
+            self.logger.log(f"Device run aborted: {e}", type="fatal")
+            self.count(adb, "errors")
+        finally:
+            indicator.finish(adb.serial)
+
+    def count(self, adb: Optional["ADB"], key: str):
+        with self.lock:
+            setattr(self, key, getattr(self, key) + 1)
+            serial = adb.serial if adb else None
+            self.device_counts.setdefault(serial, Counter())[key] += 1
 
     def load_modules(self):
         if len(self.modules.available_modules) == 0:
@@ -49,86 +238,277 @@ class TestRunner:
             self.finish()
 
     def load_test_suite(self):
-        with open(self.args.test_plan, "r") as test_plan_file:
-            try:
-                self.test_plan = json.load(test_plan_file)
-            except json.JSONDecodeError:
-                self.logger.log("Invalid test plan JSON provided, bailing!", type="fatal")
-                self.finish()
-
-    def run_tests(self):
-        for test in self.test_plan:
-            if self.validate_test(test):
-                repeat = test.get("repeat", 0)
-                for i in range(repeat+1 if repeat > 0 else 1):
-                    self.logger.log(f'Running iteration: {i+1} for test "{test.get("test_name", None)}"', "subsection")
-                    self.run_test(test)
-
-    def validate_test(self, test: dict):
+        try:
+            self.test_plan = TestPlan(self.args.test_plan)
+        except PlanError as e:
+            self.logger.log(f"{e}, bailing!", type="fatal")
+            self.finish()
+
+    def plan_tests(self):
+        # Walks the expanded plan once up front, so broken includes and matrices stop the run before it starts.
+        try:
+            problems = self.planner.check(self.test_plan)
+        except PlanError as e:
+            self.logger.log(f"{e}, bailing!", type="fatal")
+            self.finish()
+        for node, problem in problems.items():
+            self.logger.log(f'Test plan problem in "{node}": {problem}', type="plainFailure")
+
+    def validate_plan(self):
+        # Never touches adb, only the module index and the plan itself.
+        self.setup_logger()
+        self.load_modules()
+        if self.args.test_plan:
+            self.load_test_suite()
+            self.plan_tests()
+            tests = self.test_plan
+        else:
+            tests = [{"test_name": self.args.module, "module": self.args.module}]
+        total = valid = 0
+        for test in tests:
+            total += 1
+            valid += bool(self.check_test(test))
+        self.logger.log(f"{valid} of {total} tests in the test plan are valid.", type="summarySpaced")
+        # Nothing ran, so there is no run summary, the exit code alone tells CI whether the plan is sound.
+        self.logger.close()
+        sys.exit(0 if valid == total else 1)
+
+    def plan_shards(self):
+        # Balancing needs every entry up front, so a sharded plan is expanded in full.
+        tests = list(self.test_plan)
+        groups = group_tests(tests, self.planner)
+        self.shards = ShardQueue(groups, [adb.serial for adb in self.sessions], self.durations)
+        self.logger.log(f"Sharding {len(tests)} tests in {len(groups)} groups across {len(self.sessions)} devices", "plainSpaced")
+        for serial, load in self.shards.loads.items():
+            self.logger.log("Device %s starts with an estimated %.1fs of tests", "debug", serial, load)
+
+    def run_shard(self, adb: "ADB"):
+        while (group := self.shards.next(adb.serial)) is not None:
+            self.run_entries(group, adb)
+
+    def run_tests(self, adb: "ADB"):
+        self.run_entries(self.test_plan, adb)
+
+    def run_entries(self, tests: list, adb: "ADB"):
+        parallel = getattr(self.args, "parallel", 1) or 1
+        if parallel <= 1:
+            for test in tests:
+                self.run_entry(test, adb)
+            return
+        serial = getattr(self.logger.context, "device", None)
+
+        def work(test):
+            # Each entry logs into its own buffer, printed in plan order once it and everything before it is done.
+            self.logger.bind_device(serial)
+            with self.logger.capture() as buffer:
+                try:
+                    self.run_entry(test, adb)
+                except Exception as e:
+                    return buffer, e
+            return buffer, None
+
+        def emit(index, result):
+            buffer, error = result
+            self.logger.emit(buffer)
+            if error:
+                raise error
+
+        # The scheduler reads entries as it gets to them, a long plan is never held as a whole.
+        entries = ((test, self.planner.resources(test.get("module")) if isinstance(test, dict) and isinstance(test.get("module"), str) else None)
+                   for test in tests)
+        ResourceScheduler(entries, parallel, self.lookahead).run(work, emit)
+
+    def run_entry(self, test: dict, adb: "ADB"):
+        if self.validate_test(test, adb):
+            repeat = test.get("repeat", 0)
+            warmup = test.get("warmup", 0)
+            for i in range(warmup):
+                self.logger.log(f'Running warmup iteration: {i+1} for test "{test.get("test_name", None)}"', "subsection")
+                self.run_test(test, adb, warmup=True, iteration=i)
+            for i in range(repeat+1 if repeat > 0 else 1):
+                self.logger.log(f'Running iteration: {i+1} for test "{test.get("test_name", None)}"', "subsection")
+                self.run_test(test, adb, iteration=warmup + i)
+
+    def validate_test(self, test: dict, adb: Optional["ADB"] = None):
+        submodule = self.check_test(test, adb)
+        if not submodule:
+            return False
+        name = test.get("test_name")
+
+        repeat = submodule.repeat+1 if submodule.repeat > 0 else 0
+        self.logger.log("Repeat: %s", "debug", repeat)
+        if repeat > 0:
+            self.logger.log(f'Running test "{name}" {repeat} times', "section")
+        else:
+            self.logger.log(f'Running test: "{name}"', "section")
+
+        self.logger.log("Test '%s' in the test plan has been deemed valid!", "debug", name)
+        return True
+
+    def check_test(self, test: dict, adb: Optional["ADB"] = None):
         name = test.get("test_name", None)
         module: Module = test.get("module", None)
 
         if not name:
             self.logger.log("Test is missing the 'test_name' field!", type="failure")
-            self.errors += 1
+            self.count(adb, "errors")
             return False
         if not module:
             self.logger.log(f"Test '{name}' is missing the 'module' field!", type="failure")
-            self.errors += 1
+            self.count(adb, "errors")
+            return False
+
+        # Every distinct module reference is looked up once, a sweep repeats the same few many times.
+        with self.lock:
+            checked = self.checked.get(module)
+        if checked is None:
+            checked = self.check_module(module)
+            with self.lock:
+                checked = self.checked.setdefault(module, checked)
+        submodule, problem_format, fields = checked
+        if problem_format:
+            self.logger.log(problem_format.format(name=name, **fields), type="failure")
+            self.count(adb, "errors")
             return False
+        return submodule
 
+    def check_module(self, module: str) -> tuple[Optional[SubModule], Optional[str], dict]:
+        # The submodule a plan entry refers to, or the problem with the reference for check_test to report
+        # as a format of the test's name and the given fields.
         module_parts = module.split(".")
         if len(module_parts) < 2:
-            self.logger.log(f"Test '{name}' has an invalid module format. Expected 'module.submodule' or 'category.module.submodule' format!", type="failure")
-            self.errors += 1
-            return False
+            return None, "Test '{name}' has an invalid module format. Expected 'module.submodule' or 'category.module.submodule' format!", {}
 
         module_name = ".".join(module_parts[:-1])
         submodule_name = module_parts[-1]
         module = self.modules.available_modules.get(module_name)
         if not module:
-            self.logger.log(f"Module '{module_name}' not found for test '{name}'!", type="failure")
-            self.errors += 1
-            return False
+            return None, "Module '{module}' not found for test '{name}'!", {"module": module_name}
 
         submodule = module.get_submodule(submodule_name)
         if not submodule:
-            self.logger.log(f"Submodule '{submodule_name}' not found in module '{module_name}' for test '{name}'!", type="failure")
-            self.errors += 1
-            return False
+            return None, "Submodule '{submodule}' not found in module '{module}' for test '{name}'!", \
+                {"submodule": submodule_name, "module": module_name}
 
-        repeat = submodule.repeat+1 if submodule.repeat > 0 else 0
-        self.logger.log(f"Repeat: {repeat}", "debug")
-        if repeat > 0:
-            self.logger.log(f'Running test "{name}" {repeat} times', "section")
-        else:
-            self.logger.log(f'Running test: "{name}"', "section")
+        try:
+            self.planner.resolve(f"{module_name}.{submodule_name}")
+        except PlanError as e:
+            return None, "Test '{name}' cannot be scheduled: {error}", {"error": e}
 
-        self.logger.log(f"Test '{name}' in the test plan has been deemed valid!", type="debug")
-        return True
+        return submodule, None, {}
 
 
-    def run_test(self, test):
+    def run_test(self, test, adb: Optional["ADB"] = None, warmup: bool = False, iteration: int = 0):
         test_name = test.get("test_name")
         module_name, submodule_name = test.get("module").rsplit(".", 1)
         module = self.modules.available_modules.get(module_name)
+        started = time.time()
+        start = time.perf_counter()
+        values = {}
+        units = {}
+        output = ""
+        logs = []
+        system = {}
 
         if module:
-            ret = module.run(submodule_name, test.get("parameters"))
+            # Imported once devices are selected, like the rest of the device side.
+            from adbutils import AdbError, AdbTimeout
+            from TDTK.core.replay import ReplayError
+            adb = adb or self.sessions[0]
+            indicator.update(adb.serial, test=test_name, iteration=iteration + 1)
+            capture = self.captures.get(adb.serial)
+            marks = capture.mark() if capture else None
+            sampler = self.samplers.get(adb.serial)
+            first_sample = sampler.mark() if sampler else None
+            try:
+                # The plan deadline and the per-test budget bound everything the test does on the device.
+                with budget(test.get("deadline") or getattr(self.args, "test_timeout", None), until=self.plan_deadline), \
+                        tracer.scope(device=adb.serial, test=test_name, iteration=iteration), \
+                        tracer.span("test", warmup=warmup):
+                    remaining()
+                    ret = self.planner.run(test.get("module"), test.get("parameters"), adb)
+            except (TimeoutError, AdbTimeout) as e:
+                self.logger.log(f"Test \"{test_name}\" timed out: {e}", type="failure")
+                ret = "timeout"
+            except ReplayError as e:
+                self.logger.log(f"Test \"{test_name}\" left the recording: {e}", type="failure")
+                ret = "error"
+            except AdbError as e:
+                self.logger.log(f"Test \"{test_name}\" failed on the device: {e}", type="failure")
+                ret = "error"
+            output = adb.last_output
+            submodule = module.get_submodule(submodule_name)
+            units = {metric.name: (metric.unit, metric.better) for metric in submodule.metrics}
+            if ret is True and submodule.metrics:
+                values = extract_metrics(submodule.metrics, adb.last_output)
+                self.logger.log("Metrics: %s", "debug", values)
+                if not warmup:
+                    self.metrics.add(adb.serial, test_name, submodule.metrics, values)
             if ret is True:
                 self.logger.log(f"Test \"{test_name}\" completed successfully.", type="result")
-                self.tests_passed += 1
+                self.count(adb, "tests_passed")
+                status = "passed"
+            elif ret == "timeout":
+                self.count(adb, "tests_failed")
+                status = "timeout"
+            elif ret == "error":
+                self.count(adb, "errors")
+                status = "error"
             else:
                 self.logger.log(f"Test \"{test_name}\" has failed.", type="failure")
-                self.tests_failed += 1
+                self.count(adb, "tests_failed")
+                status = "failed"
+            if sampler:
+                system = sampler.summary(first_sample)
+                self.logger.log("System: %s", "debug", system)
+            if capture and status in ("failed", "timeout"):
+                logs = [str(path) for path in capture.dump(marks, test_name, iteration)]
+                self.logger.log(f"Device logs written to {', '.join(logs)}", type="failure")
         else:
             self.logger.log(f'Module for "{test_name}" not found, skipped!', type="failure")
-            self.errors += 1
+            self.count(adb, "errors")
+            status = "error"
 
-        self.total_tests += 1
+        duration = time.perf_counter() - start
+        self.count(adb, "total_tests")
+        if status != "error":
+            self.durations.add(test, duration)
+        if self.history and adb and not warmup:
+            self.history.record(adb.serial, adb.build_fingerprint(), test_name, test.get("module"), iteration, status,
+                                duration, values, units)
+        if self.sink:
+            self.sink.record({
+                "test_name": test_name,
+                "module": test.get("module"),
+                "device": adb.serial if adb else None,
+                "iteration": iteration,
+                "warmup": warmup,
+                "status": status,
+                "started": started,
+                "duration": duration,
+                "output": self.sink.snippet(output),
+                "metrics": values,
+                **({"system": system} if system else {}),
+                **({"logs": logs} if logs else {}),
+            })
 
     def finish(self):
-        self.logger.log_summary(self.total_tests, self.tests_passed, self.tests_failed, self.errors)
-        if self.adb.device:
-            self.adb.cleanup()  # Don't care if failed or not.
+        self.logger.bind_device(None)
+        self.logger.set_overlay(None)
+        indicator.stop()
+        self.stop_captures()
+        self.stop_samplers()
+        self.close_replay()
+        self.metrics.log_summary()
+        tracer.finish(getattr(self.args, "trace", None))
+        self.durations.save()
+        self.close_sink()
+        self.close_history()
+        devices = {serial: counts for serial, counts in self.device_counts.items() if serial}
+        self.logger.log_summary(self.total_tests, self.tests_passed, self.tests_failed, self.errors, devices)
+        self.log_replay_misses()
+        for adb in self.sessions:
+            if adb.device:
+                adb.cleanup(keep_files=getattr(self.args, "keep_files", False))  # Don't care if failed or not.
+        self.logger.close()
         sys.exit(1)
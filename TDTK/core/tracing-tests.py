@@ -0,0 +1,37 @@
+import json
+import threading
+import time
+from TDTK.core.tracing import Tracer, null_span
+
+class Tests:
+    # Tests that the trace is Chrome trace JSON with nested spans inside their parents, named per device thread.
+    def test_export(self, tmp_path):
+        tracer = Tracer()
+        tracer.enable()
+        with tracer.scope(device="dev1", test="Bench"):
+            with tracer.span("test", warmup=False):
+                with tracer.span("adb.shell2", command="true"):
+                    time.sleep(0.01)
+                time.sleep(0.01)
+        tracer.export(str(tmp_path / "trace.json"))
+
+        trace = json.loads((tmp_path / "trace.json").read_text())
+        assert trace["displayTimeUnit"] == "ms"
+        metadata = [event for event in trace["traceEvents"] if event["ph"] == "M"]
+        assert metadata == [{"name": "thread_name", "ph": "M", "pid": 1, "tid": threading.get_ident(), "args": {"name": "dev1"}}]
+        inner, outer = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+        assert (inner["name"], inner["cat"], outer["name"], outer["cat"]) == ("adb.shell2", "adb", "test", "tdtk")
+        assert inner["args"] == {"device": "dev1", "test": "Bench", "command": "true"}
+        assert outer["args"] == {"device": "dev1", "test": "Bench", "warmup": False}
+        assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+        count, total, own = tracer.phases["test"]
+        assert count == 1 and own < total  # Self time leaves out the nested span.
+
+    # Tests that spans and scopes cost nothing and record nothing while tracing is off.
+    def test_disabled(self):
+        tracer = Tracer()
+        assert tracer.span("adb.shell2") is null_span
+        assert tracer.scope(device="dev1") is null_span
+        with tracer.scope(device="dev1"), tracer.span("test"):
+            pass
+        assert tracer.events == [] and tracer.phases == {}
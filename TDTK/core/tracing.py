@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from contextlib import nullcontext
+from typing import Optional
+from TDTK.core.logger import Logger
+
+logger = Logger(None)
+null_span = nullcontext()
+
+class Span:
+    __slots__ = ("tracer", "name", "attributes", "start", "children")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.children = 0.0
+
+    def __enter__(self):
+        self.tracer.stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        stack = self.tracer.stack()
+        stack.pop()
+        if stack:
+            with self.tracer.lock:  # The parent may be a span of another thread, see Tracer.carry.
+                stack[-1].children += duration
+        self.tracer.record(self, duration)
+        return False
+
+class Scope:
+    __slots__ = ("tracer", "attributes", "previous")
+
+    def __init__(self, tracer: "Tracer", attributes: dict):
+        self.tracer = tracer
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.previous = self.tracer.attributes()
+        self.tracer.local.attributes = {**self.previous, **self.attributes}
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.local.attributes = self.previous
+        return False
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.events = []
+        self.threads = {}
+        self.phases = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def reset(self):
+        self.__init__()
+
+    # Both return a shared no-op context while tracing is off, so call sites cost one attribute check.
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            return null_span
+        return Span(self, name, {**self.attributes(), **attributes})
+
+    def scope(self, **attributes):
+        if not self.enabled:
+            return null_span
+        return Scope(self, attributes)
+
+    def carry(self, function):
+        # Wraps function to run on another thread as if it was called here, with the same attributes and nested in
+        # the current span. Pooled work done on behalf of a test is counted in that test's breakdown.
+        if not self.enabled:
+            return function
+        attributes = self.attributes()
+        stack = self.stack()
+        parent = stack[-1:]
+
+        def carried(*args, **kwargs):
+            previous = self.attributes(), self.stack()
+            self.local.attributes, self.local.stack = attributes, list(parent)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.local.attributes, self.local.stack = previous
+        return carried
+
+    def attributes(self) -> dict:
+        return getattr(self.local, "attributes", {})
+
+    def stack(self) -> list:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def record(self, span: Span, duration: float):
+        thread = threading.get_ident()
+        with self.lock:
+            if thread not in self.threads:
+                self.threads[thread] = span.attributes.get("device") or threading.current_thread().name
+            self.events.append({
+                "name": span.name,
+                "cat": "adb" if span.name.startswith("adb.") else "tdtk",
+                "ph": "X",
+                "ts": round((span.start - self.origin) * 1e6, 3),
+                "dur": round(duration * 1e6, 3),
+                "pid": 1,
+                "tid": thread,
+                "args": {key: value for key, value in span.attributes.items() if value is not None},
+            })
+            phase = self.phases.setdefault(span.name, [0, 0.0, 0.0])
+            phase[0] += 1
+            phase[1] += duration
+            phase[2] += max(duration - span.children, 0)  # Children run side by side on a pool can overlap.
+
+    def export(self, path: str):
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": 1, "tid": thread, "args": {"name": name}}
+            for thread, name in self.threads.items()
+        ]
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, trace_file, default=str)
+        logger.log(f"Trace written to {path}", type="plain")
+
+    def log_breakdown(self):
+        if not self.phases:
+            return
+        logger.log("Time Breakdown (self time excludes nested phases):", type="summarySpaced")
+        for name, (count, total, own) in sorted(self.phases.items(), key=lambda item: -item[1][2]):
+            logger.log(f"{name}: {count} calls, {total:.3f}s total, {own:.3f}s self", type="result")
+
+    def finish(self, path: Optional[str] = None):
+        if not self.enabled:
+            return
+        self.log_breakdown()
+        if path:
+            self.export(path)
+
+tracer = Tracer()